@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+Pub/sub backplane for room fan-out
+A server publishes room, private and presence traffic to its backplane, and
+the backplane delivers it on this node and on every other subscribed node.
+Run this file to start a standalone local broker:
+
+    python backplane.py /tmp/chat_hub.sock
+"""
+
+import json
+import os
+import socket
+import sys
+import threading
+import itertools
+import time
+
+from nickname_registry import LeaseTable, NicknameCache
+from structured_log import get_logger
+
+
+def send_op(sock, op, lock):
+    """Send one length-prefixed JSON operation"""
+    data = json.dumps(op).encode('utf-8')
+    with lock:
+        sock.sendall(len(data).to_bytes(4, byteorder='big') + data)
+
+
+def recv_exact(sock, length):
+    """Read exactly length bytes, None if the peer went away"""
+    data = b''
+    while len(data) < length:
+        chunk = sock.recv(min(65536, length - len(data)))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def recv_op(sock):
+    """Receive one length-prefixed JSON operation, None on disconnect"""
+    length_data = recv_exact(sock, 4)
+    if not length_data:
+        return None
+    data = recv_exact(sock, int.from_bytes(length_data, byteorder='big'))
+    if data is None:
+        return None
+    return json.loads(data.decode('utf-8'))
+
+
+class BackplaneHub:
+    """Broker that relays room, private and presence traffic between subscribed nodes"""
+
+    def __init__(self, path=None):
+        self.path = path     # UNIX socket for nodes in other processes, None for in-process only
+        self.nodes = {}      # {node_id: callable that delivers an operation to the node}
+        self.leases = LeaseTable()  # The global nickname set, renewed by node heartbeats
+        self.presence = {}   # {nickname: room or None}
+        self.lock = threading.Lock()
+        self.sock = None
+
+    def start(self):
+        """Bind the UNIX socket and serve nodes in the background"""
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(64)
+
+        thread = threading.Thread(target=self.accept_nodes)
+        thread.daemon = True
+        thread.start()
+
+    def accept_nodes(self):
+        """Accept node connections until the hub is stopped"""
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                break
+            thread = threading.Thread(target=self.handle_node, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        """Stop the hub and remove its socket file"""
+        if self.sock:
+            self.sock.close()
+        if self.path:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+    def subscribe(self, node_id, deliver):
+        """Register a node and send it everyone who is already online"""
+        with self.lock:
+            self.nodes[node_id] = deliver
+            users = [{'nickname': nickname, 'room': room} for nickname, room in self.presence.items()]
+        self.send_to(node_id, {'op': 'sync', 'users': users})
+
+    def unsubscribe(self, node_id):
+        """Forget a node and free every nickname it held"""
+        with self.lock:
+            self.nodes.pop(node_id, None)
+        for nickname in self.leases.release_holder(node_id):
+            self.drop_user(nickname, node_id)
+
+    def drop_user(self, nickname, node_id):
+        """Forget a user whose lease is gone and tell the other nodes"""
+        with self.lock:
+            self.presence.pop(nickname, None)
+        self.send_to_others(node_id, {'op': 'presence', 'nickname': nickname,
+                                      'room': None, 'online': False})
+
+    def expire_leases(self):
+        """Free nicknames whose node stopped renewing them"""
+        for nickname, node_id in self.leases.expire():
+            get_logger().info("lease expired", nickname=nickname, node=node_id)
+            self.drop_user(nickname, node_id)
+
+    def send_to(self, node_id, op):
+        """Send an operation to one node, ignoring nodes that went away"""
+        deliver = self.nodes.get(node_id)
+        if deliver:
+            try:
+                deliver(op)
+            except OSError:
+                pass
+
+    def send_to_others(self, node_id, op):
+        """Send an operation to every node except the one it came from"""
+        for other_id in list(self.nodes.keys()):
+            if other_id != node_id:
+                self.send_to(other_id, op)
+
+    def handle_node(self, conn):
+        """Serve one node connected over the UNIX socket"""
+        hello = recv_op(conn)
+        if not hello or hello.get('op') != 'hello':
+            conn.close()
+            return
+        node_id = hello['worker']
+        send_lock = threading.Lock()
+        self.subscribe(node_id, lambda op: send_op(conn, op, send_lock))
+
+        try:
+            while True:
+                op = recv_op(conn)
+                if op is None:
+                    break
+                self.handle_op(node_id, op)
+        except (OSError, ValueError) as e:
+            get_logger().error("backplane link failed", node=node_id, error=e)
+        finally:
+            self.unsubscribe(node_id)
+            conn.close()
+
+    def handle_op(self, node_id, op):
+        """Apply or relay one operation from a node"""
+        kind = op.get('op')
+
+        if kind == 'claim':
+            self.expire_leases()
+            ok = self.leases.acquire(op['nickname'], node_id)
+            self.send_to(node_id, {'op': 'claim_result', 'req': op['req'], 'ok': ok,
+                                   'lease': self.leases.lease_seconds})
+        elif kind == 'renew':
+            # Heartbeats arrive regularly from every node, so expiry runs here too
+            self.expire_leases()
+            lost = self.leases.renew(node_id, op['nicknames'])
+            if lost:
+                self.send_to(node_id, {'op': 'renew_result', 'lost': lost})
+        elif kind == 'release':
+            if self.leases.release(op['nickname'], node_id):
+                self.drop_user(op['nickname'], node_id)
+        elif kind == 'presence':
+            with self.lock:
+                self.presence[op['nickname']] = op.get('room')
+            self.send_to_others(node_id, op)
+        elif kind == 'room':
+            self.send_to_others(node_id, op)
+        elif kind == 'user':
+            target = self.leases.holder_of(op['nickname'])
+            if target is not None and target != node_id:
+                self.send_to(target, op)
+
+
+class Backplane:
+    """Interface between one server and the other nodes it shares users with
+
+    Subclasses provide send() to reach a broker. Servers publish through
+    publish_room/publish_user/publish_presence, and traffic from other nodes
+    comes back through dispatch() into the server's deliver_* methods.
+    Nicknames are leased: a heartbeat renews them, and names found taken are
+    cached so repeated attempts are rejected without a round trip.
+    """
+
+    def __init__(self, server):
+        self.server = server
+        self.requests = itertools.count(1)
+        self.pending_claims = {}  # {req: [Event, result]}
+        self.nickname_cache = NicknameCache()
+        self.lease_seconds = 30
+        self.running = False
+
+    def connect(self):
+        """Subscribe this node to the rest of the deployment and start renewing leases"""
+        self.running = True
+        thread = threading.Thread(target=self.heartbeat_loop)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        """Unsubscribe this node"""
+        self.running = False
+
+    def heartbeat_loop(self):
+        """Renew held nickname leases well before they run out"""
+        while self.running:
+            time.sleep(self.lease_seconds / 3)
+            held = self.nickname_cache.held_names()
+            if held and self.running:
+                self.renew_leases(held)
+
+    def renew_leases(self, nicknames):
+        """Ask the registry to extend this node's leases"""
+        self.send({'op': 'renew', 'nicknames': nicknames})
+
+    def send(self, op):
+        """Send an operation to the broker"""
+        raise NotImplementedError
+
+    def claim_nickname(self, nickname, timeout=5):
+        """Lease a nickname across all nodes, True if it was free"""
+        # A name that was just found taken is rejected locally
+        if self.nickname_cache.is_taken(nickname):
+            return False
+
+        ok = self.request_claim(nickname, timeout)
+        if ok:
+            self.nickname_cache.hold(nickname)
+        else:
+            self.nickname_cache.mark_taken(nickname)
+        return ok
+
+    def request_claim(self, nickname, timeout):
+        """Ask the registry for a lease and wait for the answer"""
+        req = next(self.requests)
+        waiter = [threading.Event(), False]
+        self.pending_claims[req] = waiter
+        self.send({'op': 'claim', 'nickname': nickname, 'req': req})
+        waiter[0].wait(timeout)
+        self.pending_claims.pop(req, None)
+        return waiter[1]
+
+    def release_nickname(self, nickname):
+        """Give a nickname back when its user disconnects"""
+        self.nickname_cache.drop(nickname)
+        self.send({'op': 'release', 'nickname': nickname})
+
+    def publish_presence(self, nickname, room):
+        """Tell the other nodes which room a local user is in"""
+        self.send({'op': 'presence', 'nickname': nickname, 'room': room, 'online': True})
+
+    def publish_room(self, room_name, msg_type, message_bytes, exclude=None):
+        """Deliver an encoded room message here and on every other node"""
+        self.server.deliver_room_frame(room_name, msg_type, message_bytes, exclude)
+        self.relay_room(room_name, msg_type, message_bytes)
+
+    def relay_room(self, room_name, msg_type, message_bytes):
+        """Send an encoded room message to members on the other nodes"""
+        self.send({'op': 'room', 'room': room_name, 'type': msg_type,
+                   'body': message_bytes.decode('utf-8')})
+
+    def publish_user(self, nickname, msg_type, message_bytes):
+        """Deliver an encoded message to a user wherever they are, False if they are offline"""
+        if self.server.deliver_user_frame(nickname, msg_type, message_bytes):
+            return True
+        return self.relay_user(nickname, msg_type, message_bytes)
+
+    def relay_user(self, nickname, msg_type, message_bytes):
+        """Send an encoded message to a user connected to another node"""
+        if nickname not in self.server.remote_users:
+            return False
+        self.send({'op': 'user', 'nickname': nickname, 'type': msg_type,
+                   'body': message_bytes.decode('utf-8')})
+        return True
+
+    def dispatch(self, op):
+        """Apply one operation relayed from another node"""
+        kind = op.get('op')
+        if kind == 'claim_result':
+            waiter = self.pending_claims.get(op['req'])
+            if waiter:
+                # Heartbeats follow the lease length the registry hands out
+                self.lease_seconds = op.get('lease', self.lease_seconds)
+                waiter[1] = op['ok']
+                waiter[0].set()
+        elif kind == 'renew_result':
+            for nickname in op['lost']:
+                self.nickname_cache.drop(nickname)
+                get_logger().warning("lost nickname lease", nickname=nickname)
+        elif kind == 'sync':
+            for user in op['users']:
+                self.server.apply_presence(user['nickname'], user['room'], True)
+        elif kind == 'presence':
+            if not op.get('online', True):
+                self.nickname_cache.forget(op['nickname'])
+            self.server.apply_presence(op['nickname'], op.get('room'), op.get('online', True))
+        elif kind == 'room':
+            self.server.deliver_room_frame(op['room'], op['type'], op['body'].encode('utf-8'))
+        elif kind == 'user':
+            self.server.deliver_user_frame(op['nickname'], op['type'], op['body'].encode('utf-8'))
+
+
+class InProcessBackplane(Backplane):
+    """Backplane for servers in one process sharing a BackplaneHub object"""
+
+    def __init__(self, server, hub=None, node_id='local'):
+        super().__init__(server)
+        # On its own a server gets a private hub and behaves as a single node
+        self.hub = hub if hub is not None else BackplaneHub()
+        self.node_id = node_id
+
+    def connect(self):
+        """Subscribe to the shared hub"""
+        self.hub.subscribe(self.node_id, self.dispatch)
+        super().connect()
+
+    def stop(self):
+        """Leave the shared hub"""
+        super().stop()
+        self.hub.unsubscribe(self.node_id)
+
+    def send(self, op):
+        """Hand an operation straight to the hub"""
+        self.hub.handle_op(self.node_id, op)
+
+
+class HubBackplane(Backplane):
+    """Backplane for a server talking to a BackplaneHub in another process"""
+
+    def __init__(self, server, path, worker_id):
+        super().__init__(server)
+        self.path = path
+        self.worker_id = worker_id
+        self.sock = None
+        self.send_lock = threading.Lock()
+
+    def connect(self):
+        """Connect to the hub and start reading relayed traffic"""
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+        send_op(self.sock, {'op': 'hello', 'worker': self.worker_id}, self.send_lock)
+
+        thread = threading.Thread(target=self.read_loop)
+        thread.daemon = True
+        thread.start()
+        super().connect()
+
+    def stop(self):
+        """Disconnect from the hub"""
+        super().stop()
+        if self.sock:
+            self.sock.close()
+
+    def send(self, op):
+        """Send an operation to the hub"""
+        try:
+            send_op(self.sock, op, self.send_lock)
+        except OSError as e:
+            get_logger().error("backplane send failed", error=e)
+
+    def read_loop(self):
+        """Dispatch traffic relayed by the hub to the local server"""
+        while True:
+            try:
+                op = recv_op(self.sock)
+            except (OSError, ValueError):
+                op = None
+            if op is None:
+                get_logger().error("lost connection to backplane hub")
+                break
+            self.dispatch(op)
+
+
+def main():
+    """Run a standalone broker"""
+    # python backplane.py /tmp/chat_hub.sock
+    if len(sys.argv) != 2:
+        print("Usage: python backplane.py SOCKET_PATH")
+        return
+
+    hub = BackplaneHub(sys.argv[1])
+    hub.start()
+    print(f"=== Chat Backplane Broker ===\nListening on {hub.path}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print("\nStopping broker...")
+    finally:
+        hub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -4,6 +4,12 @@ import json
 import sys
 import base64
 import os
+import uuid
+import time
+
+from compression import (ALGORITHM as COMPRESSION_ALGORITHM, FrameCompressor, FrameDecompressor,
+                         is_precompressed)
+from protocol import hello_frame, RecentCommands
 
 class ChatClient:
     def __init__(self, host='localhost', port=55555):
@@ -13,6 +19,13 @@ class ChatClient:
         self.nickname = None
         self.connected = False
         self.current_room = None
+        self.stream_id = None  # Delivery stream the server assigned at login
+        self.last_seq = 0      # Highest sequence number already handled
+        self.use_compression = True  # Ask for compression when the server offers it
+        self.compressor = None
+        self.decompressor = None
+        self.recent_commands = RecentCommands()  # Resent with the same msg_id after a reconnect
+        self.reconnecting = False  # Set until the login after a reconnect is accepted
         
     def connect_to_server(self):
         """Connect to the chat server"""
@@ -20,6 +33,9 @@ class ChatClient:
             self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.client_socket.connect((self.host, self.port))
             self.connected = True
+            # A new connection starts uncompressed until the login says otherwise
+            self.compressor = None
+            self.decompressor = None
             return True
         except Exception as e:
             print(f"Failed to connect to server: {e}")
@@ -36,14 +52,40 @@ class ChatClient:
                 'command': command,
                 'content': content
             }
-            message_json = json.dumps(message)
-            message_bytes = message_json.encode('utf-8')
-            length_bytes = len(message_bytes).to_bytes(4, byteorder='big')
-            self.client_socket.send(length_bytes + message_bytes)
+            # Unique ID lets the server drop this command if it is ever resent
+            if command not in ('ACK', 'PONG'):
+                message['msg_id'] = uuid.uuid4().hex
+            message_bytes = json.dumps(message).encode('utf-8')
+            if 'msg_id' in message:
+                self.recent_commands.add(message_bytes)
+            self.send_frame(message_bytes)
         except Exception as e:
             print(f"Connection lost: {e}")
             self.connected = False
     
+    def send_frame(self, message_bytes, compress=True):
+        """Write one length-prefixed frame, compressed once the server agreed to it"""
+        compressor = self.compressor
+        if compressor is None:
+            length_bytes = len(message_bytes).to_bytes(4, byteorder='big')
+            self.client_socket.sendall(length_bytes + message_bytes)
+            return
+        
+        # Frames have to enter the deflate stream in the order they are written
+        with compressor.lock:
+            payload = compressor.encode(message_bytes, compress)
+            self.client_socket.sendall(len(payload).to_bytes(4, byteorder='big') + payload)
+    
+    def send_batch(self, commands):
+        """Send several (command, content) pairs in one BATCH frame
+
+        The server runs them in order and answers with one BATCH_RESULT frame.
+        """
+        batch = []
+        for command, content in commands:
+            batch.append({'command': command, 'content': content, 'msg_id': uuid.uuid4().hex})
+        self.send_message('BATCH', batch)
+    
     def receive_messages(self):
         """Listen for messages from the server"""
         while self.connected:
@@ -66,9 +108,13 @@ class ChatClient:
                 if len(message_data) != message_length:
                     break
                 
+                if self.decompressor:
+                    message_data = self.decompressor.decode(message_data)
                 message = message_data.decode('utf-8')
                 if message:
                     data = json.loads(message)
+                    if self.is_duplicate(data):
+                        continue
                     self.handle_server_message(data)
                 else:
                     print("Server disconnected")
@@ -84,6 +130,24 @@ class ChatClient:
                     self.connected = False
                 break
     
+    def is_duplicate(self, data):
+        """Acknowledge sequenced messages and report ones already handled"""
+        # A new delivery stream restarts the sequence numbers
+        if data.get('type') == 'NICK_ACCEPTED' and data.get('stream_id') != self.stream_id:
+            self.stream_id = data.get('stream_id')
+            self.last_seq = 0
+        
+        seq = data.get('seq')
+        if seq is None:
+            return False
+        
+        # Cumulative ACK, so acking a retransmitted duplicate is harmless
+        self.send_message('ACK', seq)
+        if seq <= self.last_seq:
+            return True
+        self.last_seq = seq
+        return False
+    
     def handle_server_message(self, data):
         """Handle different types of messages from the server"""
         msg_type = data.get('type', '')
@@ -91,9 +155,13 @@ class ChatClient:
         timestamp = data.get('timestamp', '')
         
         if msg_type == 'NICK_REQUEST':
-            self.handle_nickname_request()
+            self.handle_nickname_request(data)
         elif msg_type == 'NICK_ACCEPTED':
             print(f"[{timestamp}] {content}")
+            # Only commands sent over an earlier connection can have been lost
+            if self.reconnecting:
+                self.reconnecting = False
+                self.resend_recent()
             self.show_help()
         elif msg_type == 'NICK_ERROR':
             print(f"[{timestamp}] Error: {content}")
@@ -116,25 +184,78 @@ class ChatClient:
             print(f"[{timestamp}] \n{content}")
         elif msg_type == 'ERROR':
             print(f"[{timestamp}] ❌ Error: {content}")
+        elif msg_type == 'PING':
+            # Heartbeat, the server drops clients that do not answer
+            self.send_message('PONG')
+        elif msg_type in ('RETRY_LATER', 'THROTTLED'):
+            print(f"[{timestamp}] ⏳ {content}")
         elif msg_type == 'FILE_SENT':
             print(f"[{timestamp}] ✅ {content}")
         elif msg_type == 'FILE_RECEIVED':
             self.handle_received_file(data)
+        elif msg_type in ('RECONNECT', 'SERVER_BUSY'):
+            print(f"[{timestamp}] 🔄 {content}")
+            self.reconnect(data.get('retry_after_ms', 1000))
+        elif msg_type == 'BATCH_RESULT':
+            # One list of replies per command, in the order the commands were sent
+            for replies in data.get('results', []):
+                for reply in replies:
+                    self.handle_server_message(reply)
+        elif msg_type == 'OFFLINE_MESSAGES':
+            print(f"[{timestamp}] 📬 {content}")
+            for queued in data.get('messages', []):
+                self.handle_server_message(queued)
         else:
             print(f"[{timestamp}] {content}")
     
-    def handle_nickname_request(self):
-        """Handle nickname request from server"""
+    def ask_nickname(self):
+        """Prompt until a valid nickname is entered"""
         while True:
             nickname = input("Enter your nickname: ").strip()
             if nickname and ' ' not in nickname:
                 self.nickname = nickname
-                nickname_bytes = nickname.encode('utf-8')
-                length_bytes = len(nickname_bytes).to_bytes(4, byteorder='big')
-                self.client_socket.send(length_bytes + nickname_bytes)
-                break
-            else:
-                print("Invalid nickname! Please enter a nickname without spaces.")
+                return
+            print("Invalid nickname! Please enter a nickname without spaces.")
+    
+    def send_hello(self, room=None):
+        """Log in straight after connecting, without waiting for NICK_REQUEST"""
+        capabilities = [COMPRESSION_ALGORITHM] if self.use_compression else []
+        self.send_frame(json.dumps(hello_frame(self.nickname, capabilities, room)).encode('utf-8'))
+    
+    def handle_nickname_request(self, data):
+        """NICK_REQUEST is the server's answer to HELLO, it says whether compression is on"""
+        # The server compresses every frame after our HELLO if it offers what we asked for
+        if self.use_compression and COMPRESSION_ALGORITHM in data.get('capabilities', []):
+            self.compressor = FrameCompressor()
+            self.decompressor = FrameDecompressor()
+    
+    def resend_recent(self):
+        """Send again the commands that may have been lost with the previous connection"""
+        # Same frames, same msg_id, the server skips the ones it already handled
+        for message_bytes, compress in self.recent_commands.pending():
+            self.send_frame(message_bytes, compress)
+    
+    def reconnect(self, delay_ms, attempts=10):
+        """Reconnect after the server restarts, keeping the same nickname"""
+        try:
+            self.client_socket.close()
+        except:
+            pass
+        
+        # The server picks a random delay so clients do not all come back at once
+        time.sleep(delay_ms / 1000)
+        for attempt in range(attempts):
+            if self.connect_to_server():
+                # Log in and rejoin the room in the same round trip
+                self.reconnecting = True
+                self.send_hello(self.current_room)
+                print("Reconnected to server!")
+                return True
+            time.sleep(min(0.5 * (2 ** attempt), 5))
+        
+        print("Could not reconnect to server")
+        self.connected = False
+        return False
     
     def show_help(self):
         """Display available commands"""
@@ -224,10 +345,13 @@ class ChatClient:
     def start_client(self):
         """Start the chat client"""
         print("=== Python Chat Client ===")
+        if not self.nickname:
+            self.ask_nickname()
         print("Connecting to server...")
         
         if not self.connect_to_server():
             return
+        self.send_hello()
         
         print("Connected to server!")
         
@@ -295,6 +419,7 @@ class ChatClient:
             # Send file command
             file_command = {
                 'command': 'FILE',
+                'msg_id': uuid.uuid4().hex,
                 'target': target,
                 'is_private': is_private,
                 'file_data': {
@@ -305,10 +430,10 @@ class ChatClient:
             }
             
             print(f"📤 Sending {filename} ({'privately to ' + target if is_private else 'to room'})...")
-            message_json = json.dumps(file_command)
-            message_bytes = message_json.encode('utf-8')
-            length_bytes = len(message_bytes).to_bytes(4, byteorder='big')
-            self.client_socket.send(length_bytes + message_bytes)
+            message_bytes = json.dumps(file_command).encode('utf-8')
+            self.recent_commands.add(message_bytes, not is_precompressed(filename))
+            # Images, archives and video are compressed already
+            self.send_frame(message_bytes, compress=not is_precompressed(filename))
             
         except Exception as e:
             print(f"❌ Failed to send file: {e}")
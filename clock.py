@@ -0,0 +1,33 @@
+import time
+
+
+class CoarseClock:
+    """Wall clock timestamps cached per second, plus a millisecond Unix epoch"""
+
+    def __init__(self):
+        # Wall clock read once, then advanced by the monotonic clock
+        self.started = time.monotonic()
+        self.started_ms = int(time.time() * 1000)
+        # (second, formatted) replaced as one tuple so readers never see a mix of two seconds
+        self.cached = (None, '')
+
+    def timestamp(self):
+        """Current time as HH:MM:SS, formatted at most once a second"""
+        now = time.time()
+        second = int(now)
+        cached_second, text = self.cached
+        if second != cached_second:
+            text = time.strftime("%H:%M:%S", time.localtime(now))
+            self.cached = (second, text)
+        return text
+
+    def epoch_ms(self):
+        """Milliseconds since the Unix epoch, never goes backwards within a process
+
+        Values from different servers are only as close as their system clocks.
+        """
+        return self.started_ms + int((time.monotonic() - self.started) * 1000)
+
+
+# One clock per process so every frame shares the same cached timestamp
+shared_clock = CoarseClock()
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+"""
+Multi-node chat cluster
+Server nodes form a TCP peer mesh and exchange presence, room messages,
+private messages and files. Each room and nickname is owned by one node,
+picked by consistent hashing over the nodes that are currently up.
+"""
+
+import bisect
+import hashlib
+import os
+import socket
+import sys
+import threading
+import time
+
+from backplane import Backplane, send_op, recv_op
+from nickname_registry import LeaseTable
+from offline_mailbox import MailboxStore
+from server import ChatServer
+from structured_log import get_logger
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, replicas=64):
+        self.replicas = replicas
+        self.keys = []    # Sorted hash positions
+        self.owners = {}  # {hash position: node_id}
+
+    @staticmethod
+    def hash_key(key):
+        return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+    def add(self, node_id):
+        """Place a node on the ring"""
+        for i in range(self.replicas):
+            position = self.hash_key(f"{node_id}#{i}")
+            if position not in self.owners:
+                bisect.insort(self.keys, position)
+                self.owners[position] = node_id
+
+    def remove(self, node_id):
+        """Take a node off the ring, its keys move to the next node"""
+        for i in range(self.replicas):
+            position = self.hash_key(f"{node_id}#{i}")
+            if self.owners.get(position) == node_id:
+                del self.owners[position]
+                self.keys.remove(position)
+
+    def node_for(self, key):
+        """Node that owns a key, None if the ring is empty"""
+        if not self.keys:
+            return None
+        index = bisect.bisect(self.keys, self.hash_key(key)) % len(self.keys)
+        return self.owners[self.keys[index]]
+
+
+class ClusterBackplane(Backplane):
+    """Backplane made of a node's links to its peers in the cluster mesh"""
+
+    def __init__(self, server, node_id, listen_address, peers):
+        super().__init__(server)
+        self.node_id = node_id
+        self.listen_address = listen_address  # (host, port) for peer connections
+        self.peers = dict(peers)              # {node_id: (host, port)}, excluding this node
+        self.links = {}                       # {node_id: (socket, send lock)} for outgoing traffic
+        self.ring = HashRing()
+        self.ring.add(node_id)
+        self.presence = {}  # {nickname: (node_id, room)} for every user in the cluster
+        self.leases = LeaseTable()  # Leases on the nicknames this node owns
+        self.lock = threading.Lock()
+        self.retry_interval = 1.0
+        self.sock = None
+
+    def connect(self):
+        """Start listening for peers and dial every configured peer"""
+        super().connect()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(self.listen_address)
+        self.sock.listen(16)
+
+        thread = threading.Thread(target=self.accept_peers)
+        thread.daemon = True
+        thread.start()
+
+        for peer_id in self.peers:
+            thread = threading.Thread(target=self.dial_peer, args=(peer_id,))
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        """Close the peer listener and every outgoing link"""
+        super().stop()
+        if self.sock:
+            self.sock.close()
+        for peer_sock, _ in list(self.links.values()):
+            try:
+                peer_sock.close()
+            except OSError:
+                pass
+
+    def live_nodes(self):
+        """This node plus every peer with an open link"""
+        return [self.node_id] + list(self.links.keys())
+
+    def owner_of(self, key):
+        """Node that owns a room or nickname"""
+        with self.lock:
+            return self.ring.node_for(key)
+
+    # Peer links
+
+    def dial_peer(self, peer_id):
+        """Keep an outgoing connection to one peer, reconnecting when it drops"""
+        while self.running:
+            try:
+                peer_sock = socket.create_connection(self.peers[peer_id], timeout=5)
+                peer_sock.settimeout(None)
+                send_lock = threading.Lock()
+                send_op(peer_sock, {'op': 'hello', 'node': self.node_id}, send_lock)
+            except OSError:
+                time.sleep(self.retry_interval)
+                continue
+
+            with self.lock:
+                self.links[peer_id] = (peer_sock, send_lock)
+                self.ring.add(peer_id)
+                local = [{'nickname': nickname, 'room': room}
+                         for nickname, (node_id, room) in self.presence.items()
+                         if node_id == self.node_id]
+            get_logger().info("cluster link up", peer=peer_id)
+            self.send_to(peer_id, {'op': 'sync', 'users': local})
+
+            # Links only carry traffic one way, a read returns once the peer goes away
+            try:
+                while peer_sock.recv(1):
+                    pass
+            except OSError:
+                pass
+            self.drop_peer(peer_id)
+            if self.running:
+                time.sleep(self.retry_interval)
+
+    def accept_peers(self):
+        """Accept incoming links until the node stops"""
+        while self.running:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                break
+            thread = threading.Thread(target=self.handle_peer, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def handle_peer(self, conn):
+        """Apply traffic arriving from one peer"""
+        hello = recv_op(conn)
+        if not hello or hello.get('op') != 'hello':
+            conn.close()
+            return
+        peer_id = hello['node']
+
+        try:
+            while True:
+                op = recv_op(conn)
+                if op is None:
+                    break
+                self.handle_op(peer_id, op)
+        except (OSError, ValueError) as e:
+            get_logger().error("cluster link failed", peer=peer_id, error=e)
+        finally:
+            conn.close()
+
+    def drop_peer(self, peer_id):
+        """Forget a peer that went away and every user it hosted"""
+        with self.lock:
+            link = self.links.pop(peer_id, None)
+            if link is None:
+                return
+            self.ring.remove(peer_id)
+            gone = [nickname for nickname, (node_id, _) in self.presence.items() if node_id == peer_id]
+            for nickname in gone:
+                del self.presence[nickname]
+        self.leases.release_holder(peer_id)
+        try:
+            link[0].close()
+        except OSError:
+            pass
+
+        get_logger().warning("cluster link down", peer=peer_id)
+        for nickname in gone:
+            self.server.apply_presence(nickname, None, False)
+
+    def send_to(self, node_id, op):
+        """Send an operation to one peer, ignoring peers that are down"""
+        link = self.links.get(node_id)
+        if link:
+            try:
+                send_op(link[0], op, link[1])
+            except OSError:
+                pass
+
+    def send_to_all(self, op):
+        """Send an operation to every peer that is up"""
+        for node_id in list(self.links.keys()):
+            self.send_to(node_id, op)
+
+    # Operations from peers
+
+    def handle_op(self, peer_id, op):
+        """Apply one operation from a peer"""
+        kind = op.get('op')
+
+        if kind == 'sync':
+            for user in op['users']:
+                self.record_presence(peer_id, user['nickname'], user['room'], True)
+        elif kind == 'presence':
+            self.record_presence(peer_id, op['nickname'], op.get('room'), op.get('online', True))
+        elif kind == 'claim':
+            ok = self.try_claim(op['nickname'], peer_id)
+            self.send_to(peer_id, {'op': 'claim_result', 'req': op['req'], 'ok': ok,
+                                   'lease': self.leases.lease_seconds})
+        elif kind == 'renew':
+            # Every peer gets the full list, each renews the nicknames it owns
+            self.expire_leases()
+            owned = [nickname for nickname in op['nicknames'] if self.owner_of(nickname) == self.node_id]
+            lost = self.leases.renew(peer_id, owned)
+            if lost:
+                self.send_to(peer_id, {'op': 'renew_result', 'lost': lost})
+        elif kind in ('claim_result', 'renew_result'):
+            self.dispatch(op)
+        elif kind == 'room':
+            message_bytes = op['body'].encode('utf-8')
+            self.server.deliver_room_frame(op['room'], op['type'], message_bytes)
+            # The owner passes the message on to the other nodes with members
+            if op.get('fanout'):
+                self.fan_out(op['room'], op['type'], op['body'], skip=(peer_id,))
+        elif kind == 'user':
+            self.server.deliver_user_frame(op['nickname'], op['type'], op['body'].encode('utf-8'))
+
+    def record_presence(self, node_id, nickname, room, online):
+        """Track where a user is and pass the change to the server"""
+        with self.lock:
+            if online:
+                self.presence[nickname] = (node_id, room)
+                owned = self.ring.node_for(nickname) == self.node_id
+            elif self.presence.get(nickname, (node_id,))[0] == node_id:
+                self.presence.pop(nickname, None)
+
+        if online:
+            # After a ring change this node may own names leased elsewhere
+            if owned:
+                self.leases.acquire(nickname, node_id)
+        else:
+            self.leases.release(nickname, node_id)
+            self.nickname_cache.forget(nickname)
+        self.server.apply_presence(nickname, room, online)
+
+    def try_claim(self, nickname, node_id):
+        """Lease a nickname this node owns, True if it was free"""
+        self.expire_leases()
+        with self.lock:
+            location = self.presence.get(nickname)
+            if location and location[0] != node_id:
+                return False
+        return self.leases.acquire(nickname, node_id)
+
+    def expire_leases(self):
+        """Free owned nicknames whose node stopped renewing them"""
+        for nickname, node_id in self.leases.expire():
+            get_logger().info("lease expired", nickname=nickname, node=node_id)
+            with self.lock:
+                if self.presence.get(nickname, (None,))[0] != node_id:
+                    continue
+                del self.presence[nickname]
+            if node_id != self.node_id:
+                self.server.apply_presence(nickname, None, False)
+
+    # Backplane interface
+
+    def request_claim(self, nickname, timeout):
+        """Ask the owning node for a lease and wait for the answer"""
+        owner = self.owner_of(nickname)
+        if owner == self.node_id:
+            return self.try_claim(nickname, self.node_id)
+
+        req = next(self.requests)
+        waiter = [threading.Event(), False]
+        self.pending_claims[req] = waiter
+        self.send_to(owner, {'op': 'claim', 'nickname': nickname, 'req': req})
+        waiter[0].wait(timeout)
+        self.pending_claims.pop(req, None)
+        return waiter[1]
+
+    def renew_leases(self, nicknames):
+        """Renew owned leases here and ask every peer to renew the rest"""
+        self.expire_leases()
+        owned = [nickname for nickname in nicknames if self.owner_of(nickname) == self.node_id]
+        for nickname in self.leases.renew(self.node_id, owned):
+            self.dispatch({'op': 'renew_result', 'lost': [nickname]})
+        self.send_to_all({'op': 'renew', 'nicknames': nicknames})
+
+    def release_nickname(self, nickname):
+        """Give a nickname back when its user disconnects"""
+        self.nickname_cache.drop(nickname)
+        with self.lock:
+            self.presence.pop(nickname, None)
+        self.leases.release(nickname, self.node_id)
+        self.send_to_all({'op': 'presence', 'nickname': nickname, 'room': None, 'online': False})
+
+    def publish_presence(self, nickname, room):
+        """Tell every peer which room a local user is in"""
+        with self.lock:
+            self.presence[nickname] = (self.node_id, room)
+        self.send_to_all({'op': 'presence', 'nickname': nickname, 'room': room, 'online': True})
+
+    def relay_room(self, room_name, msg_type, message_bytes):
+        """Send an encoded room message to members on the other nodes through the room owner"""
+        body = message_bytes.decode('utf-8')
+        owner = self.owner_of(room_name)
+        if owner == self.node_id:
+            self.fan_out(room_name, msg_type, body)
+        else:
+            self.send_to(owner, {'op': 'room', 'room': room_name, 'type': msg_type,
+                                 'body': body, 'fanout': True})
+
+    def fan_out(self, room_name, msg_type, body, skip=()):
+        """Send a room message to every other node that has members in the room"""
+        with self.lock:
+            nodes = {node_id for node_id, room in self.presence.values() if room == room_name}
+        nodes.discard(self.node_id)
+        for node_id in nodes:
+            if node_id not in skip:
+                self.send_to(node_id, {'op': 'room', 'room': room_name, 'type': msg_type, 'body': body})
+
+    def relay_user(self, nickname, msg_type, message_bytes):
+        """Send an encoded message to a user connected to another node"""
+        with self.lock:
+            location = self.presence.get(nickname)
+        if not location or location[0] == self.node_id:
+            return False
+        self.send_to(location[0], {'op': 'user', 'nickname': nickname, 'type': msg_type,
+                                   'body': message_bytes.decode('utf-8')})
+        return True
+
+
+def parse_address(text):
+    """Split host:port"""
+    host, port = text.rsplit(':', 1)
+    return host, int(port)
+
+
+def run_node(node_id, chat_address, nodes):
+    """Run one cluster node, nodes maps every node_id to its cluster address"""
+    peers = {peer_id: address for peer_id, address in nodes.items() if peer_id != node_id}
+    server = ChatServer(*chat_address, lambda server: ClusterBackplane(server, node_id, nodes[node_id], peers))
+
+    # Each node keeps its own snapshot and mailbox files
+    server.snapshot_path = f"server_snapshot_{node_id}.pkl"
+    server.offline_mailboxes = MailboxStore(spill_dir=os.path.join("server_mailboxes", node_id))
+
+    print(f"Node {node_id} serving {chat_address[0]}:{chat_address[1]}, "
+          f"cluster port {nodes[node_id][1]}")
+    try:
+        server.start_server()
+    except KeyboardInterrupt:
+        server.shutdown_server()
+    finally:
+        server.backplane.stop()
+
+
+def main():
+    """Parse command line arguments and run a node"""
+    # python cluster.py NODE_ID HOST:PORT NODE_ID@HOST:PORT [NODE_ID@HOST:PORT ...]
+    # The node list names every node in the cluster, including this one
+    usage = "Usage: python cluster.py NODE_ID HOST:PORT NODE_ID@HOST:PORT [NODE_ID@HOST:PORT ...]"
+    if len(sys.argv) < 4:
+        print(usage)
+        return
+
+    try:
+        node_id = sys.argv[1]
+        chat_address = parse_address(sys.argv[2])
+        nodes = {}
+        for entry in sys.argv[3:]:
+            peer_id, address = entry.split('@', 1)
+            nodes[peer_id] = parse_address(address)
+    except ValueError:
+        print(usage)
+        return
+
+    if node_id not in nodes:
+        print(f"Node {node_id} is missing from the node list")
+        return
+
+    print("=== Python Chat Server (cluster node) ===")
+    run_node(node_id, chat_address, nodes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import bisect
+import functools
+import threading
+
+
+# Upper bounds in milliseconds of the latency histogram buckets, the last one catches the rest
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+
+class LatencyHistogram:
+    """Counts of handling times in fixed buckets"""
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0  # Seconds
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        index = bisect.bisect_left(self.bounds, seconds * 1000)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += seconds
+
+    def percentile(self, fraction):
+        """Upper bound in ms of the bucket holding the given fraction of samples, None when empty"""
+        with self.lock:
+            counts = list(self.counts)
+            count = self.count
+        if not count:
+            return None
+        needed = fraction * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= needed and bucket_count:
+                return self.bounds[index] if index < len(self.bounds) else float('inf')
+        return float('inf')
+
+    def summary(self):
+        """Count, mean and percentiles for the admin panel"""
+        return {
+            'count': self.count,
+            'mean_ms': round(self.total / self.count * 1000, 2) if self.count else 0,
+            'p50_ms': self.percentile(0.5),
+            'p99_ms': self.percentile(0.99),
+        }
+
+
+class Command:
+    """One registered command and the middleware chain built around its handler"""
+
+    __slots__ = ('name', 'handler', 'skip', 'histogram', 'call')
+
+    def __init__(self, name, handler, skip=()):
+        self.name = name
+        self.handler = handler  # handler(session, message)
+        self.skip = skip        # Middleware this command bypasses
+        self.histogram = LatencyHistogram()
+        self.call = handler
+
+
+class CommandRegistry:
+    """Maps command names to handlers wrapped in a middleware chain
+
+    A middleware is called as middleware(command, call_next, session, message)
+    and decides whether to call call_next(session, message). Chains are built
+    when a command or middleware is added, so dispatching a frame is one dict
+    lookup and a call.
+    """
+
+    def __init__(self):
+        self.commands = {}    # {name: Command}
+        self.middleware = []  # Outermost first
+
+    def register(self, name, handler, skip=()):
+        """Add or replace the handler for a command name"""
+        command = Command(name, handler, skip)
+        self.build(command)
+        self.commands[name] = command
+        return command
+
+    def use(self, middleware):
+        """Append a middleware inside the existing ones and rebuild every chain"""
+        self.middleware.append(middleware)
+        for command in self.commands.values():
+            self.build(command)
+
+    def build(self, command):
+        call = command.handler
+        for middleware in reversed(self.middleware):
+            if middleware not in command.skip:
+                call = functools.partial(middleware, command, call)
+        command.call = call
+
+    def lookup(self, name):
+        """The command for a name, falling back to its upper case spelling"""
+        command = self.commands.get(name)
+        if command is None and isinstance(name, str):
+            command = self.commands.get(name.upper())
+        return command
+
+    def dispatch(self, session, message):
+        """Run a command frame through its chain, False if the command is unknown"""
+        command = self.lookup(message.get('command', ''))
+        if command is None:
+            return False
+        command.call(session, message)
+        return True
+
+    def latency_summary(self):
+        """{name: histogram summary} for commands that have run"""
+        return {name: command.histogram.summary()
+                for name, command in self.commands.items() if command.histogram.count}
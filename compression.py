@@ -0,0 +1,103 @@
+import os
+import re
+import threading
+import zlib
+
+
+# Offered in NICK_REQUEST and named in the nickname response to turn compression on
+ALGORITHM = 'zlib'
+
+# Strings nearly every frame repeats, deflate can refer back to them from the
+# first frame on. The most common ones go last so they get the shortest distances.
+SHARED_DICTIONARY = (
+    b'"file_info": {"filename": "size": "sender": "file_id": "file_content": "is_private": '
+    b'"retry_after_ms": "stream_id": "messages": "results": "server_ms": "msg_id": '
+    b'"command": "JOIN""LEAVE""LIST""FILE""BATCH""ACK""PING""PONG"'
+    b'"LIST_RESPONSE""ROOM_JOINED""ROOM_LEFT""USER_JOINED""USER_LEFT""ERROR""THROTTLED"'
+    b'"FILE_RECEIVED""PRIVATE_MSG""Private from "Private to "MSG"'
+    b'{"type": "PUBLIC_MSG", "content": "You: ", "timestamp": "", "seq": '
+)
+
+WINDOW_BITS = 12  # 4 KB history is plenty for chat frames and keeps each stream small
+MEM_LEVEL = 5
+SYNC_TAIL = b'\x00\x00\xff\xff'  # Ends every sync flush, so it is left off the wire
+
+# First byte of every frame once compression is on
+RAW = b'\x00'
+DEFLATED = b'\x01'
+
+# File types that are compressed already, deflating them again only costs CPU
+PRECOMPRESSED_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp',
+    '.zip', '.rar', '.7z',
+    '.mp3', '.ogg',
+    '.mp4', '.avi', '.mov', '.webm',
+    '.pdf', '.docx',
+}
+
+# File frames put file_info first, so the name is found near the start of the frame
+FILENAME_FIELD = re.compile(rb'"filename": "([^"]{1,255})"')
+FILENAME_SEARCH_BYTES = 1024
+SNIFF_MIN_BYTES = 4096  # Smaller frames are always compressed
+
+
+def is_precompressed(filename):
+    """True if the file type is already compressed"""
+    return os.path.splitext(filename)[1].lower() in PRECOMPRESSED_EXTENSIONS
+
+
+def carries_precompressed_file(message_bytes):
+    """True for a large file frame whose file is already compressed"""
+    if len(message_bytes) < SNIFF_MIN_BYTES:
+        return False
+    match = FILENAME_FIELD.search(message_bytes, 0, FILENAME_SEARCH_BYTES)
+    return bool(match) and is_precompressed(match.group(1).decode('utf-8', 'replace'))
+
+
+class FrameCompressor:
+    """Compresses the frames sent in one direction of a connection as a single deflate stream
+
+    Each frame is sync-flushed so the receiver can decode it on its own, while
+    repeated keys and values still compress against earlier frames. Frames have
+    to be encoded in the order they are written, callers hold lock from encode
+    until the frame is queued.
+    """
+
+    def __init__(self):
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, -WINDOW_BITS, MEM_LEVEL,
+                                           zlib.Z_DEFAULT_STRATEGY, SHARED_DICTIONARY)
+        self.lock = threading.Lock()
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def encode(self, payload, compress=True):
+        """The frame body to put on the wire for payload"""
+        if compress:
+            data = self.compressor.compress(payload) + self.compressor.flush(zlib.Z_SYNC_FLUSH)
+            frame = DEFLATED + data[:-len(SYNC_TAIL)]
+        else:
+            frame = RAW + payload
+        self.bytes_in += len(payload)
+        self.bytes_out += len(frame)
+        return frame
+
+
+class FrameDecompressor:
+    """Decodes frames produced by the FrameCompressor on the other end"""
+
+    def __init__(self, max_size=16 * 1024 * 1024):
+        self.decompressor = zlib.decompressobj(-WINDOW_BITS, SHARED_DICTIONARY)
+        self.max_size = max_size  # Refuse frames that inflate beyond this
+
+    def decode(self, frame):
+        marker, body = frame[:1], frame[1:]
+        if marker == RAW:
+            return body
+        if marker != DEFLATED:
+            # A client may send a few plain JSON frames after HELLO before it has
+            # read the server's answer, JSON never starts with a marker byte
+            return frame
+        payload = self.decompressor.decompress(body + SYNC_TAIL, self.max_size)
+        if self.decompressor.unconsumed_tail:
+            raise ValueError("Compressed frame too large")
+        return payload
@@ -0,0 +1,126 @@
+import threading
+import time
+import uuid
+from collections import deque, OrderedDict
+
+from structured_log import get_logger
+
+
+def add_sequence(body, seq):
+    """Splice a sequence number into an encoded JSON object without re-encoding it"""
+    return b'{"seq": ' + str(seq).encode('ascii') + b', ' + body[1:]
+
+
+class DeliveryStream:
+    """Sequenced server-to-client frames for one nickname with an ACK cursor"""
+
+    def __init__(self, nickname, max_frames=1000, max_bytes=16 * 1024 * 1024):
+        self.nickname = nickname
+        self.stream_id = uuid.uuid4().hex[:12]
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.next_seq = 1
+        self.acked = 0            # Highest sequence number the client confirmed
+        self.unacked = deque()    # (seq, body without seq) in send order
+        self.unacked_bytes = 0
+        self.detached_at = None   # Set while the nickname is offline
+        self.lock = threading.Lock()
+
+    def track(self, body):
+        """Assign the next sequence number to a frame and keep it until acked"""
+        seq = self.next_seq
+        self.next_seq += 1
+        self.unacked.append((seq, body))
+        self.unacked_bytes += len(body)
+
+        # Bounded buffer: give up on the oldest frames rather than grow forever
+        while self.unacked and (len(self.unacked) > self.max_frames or
+                                self.unacked_bytes > self.max_bytes):
+            old_seq, old_body = self.unacked.popleft()
+            self.unacked_bytes -= len(old_body)
+            get_logger().warning("dropped unacknowledged frame", nickname=self.nickname, seq=old_seq)
+        return add_sequence(body, seq)
+
+    def ack(self, seq):
+        """Cumulative acknowledgement of every frame up to and including seq"""
+        if seq <= self.acked:
+            return
+        self.acked = min(seq, self.next_seq - 1)
+        while self.unacked and self.unacked[0][0] <= self.acked:
+            _, body = self.unacked.popleft()
+            self.unacked_bytes -= len(body)
+
+    def pending(self):
+        """Encoded frames that still need to be retransmitted"""
+        return [add_sequence(body, seq) for seq, body in self.unacked]
+
+    def to_state(self):
+        """Plain data for a snapshot (caller holds the lock)"""
+        return {
+            'stream_id': self.stream_id,
+            'next_seq': self.next_seq,
+            'acked': self.acked,
+            'unacked': list(self.unacked)
+        }
+
+    @classmethod
+    def from_state(cls, nickname, state):
+        """Rebuild a detached stream from snapshot data"""
+        stream = cls(nickname)
+        stream.stream_id = state['stream_id']
+        stream.next_seq = state['next_seq']
+        stream.acked = state['acked']
+        stream.unacked = deque(state['unacked'])
+        stream.unacked_bytes = sum(len(body) for _, body in stream.unacked)
+        stream.detached_at = time.time()
+        return stream
+
+    def is_expired(self, resume_window):
+        """True if the nickname has been offline longer than the resume window"""
+        return self.detached_at is not None and time.time() - self.detached_at > resume_window
+
+
+class IdempotencyCache:
+    """Time-windowed, size-capped record of recently seen client message IDs"""
+
+    def __init__(self, window_seconds=600, max_entries=100000, max_id_length=64):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self.max_id_length = max_id_length
+        self.entries = OrderedDict()  # {(nickname, msg_id): first seen time}, oldest first
+        self.lock = threading.Lock()
+
+    def check_and_add(self, nickname, msg_id):
+        """Record a message ID, returns True if it was already seen in the window"""
+        key = (nickname, str(msg_id)[:self.max_id_length])
+        now = time.time()
+
+        with self.lock:
+            # Entries are in insertion order, so expired ones are all at the front
+            cutoff = now - self.window_seconds
+            while self.entries:
+                oldest_key, seen_at = next(iter(self.entries.items()))
+                if seen_at >= cutoff and len(self.entries) < self.max_entries:
+                    break
+                del self.entries[oldest_key]
+
+            if key in self.entries:
+                return True
+            self.entries[key] = now
+            return False
+
+    def discard(self, nickname, msg_id):
+        """Forget a message ID, so a command that was refused can be retried with it"""
+        with self.lock:
+            self.entries.pop((nickname, str(msg_id)[:self.max_id_length]), None)
+
+    def export_state(self):
+        """[nickname, msg_id, seen_at] for a snapshot, so retries after a restart stay no-ops"""
+        with self.lock:
+            return [[nickname, msg_id, seen_at] for (nickname, msg_id), seen_at in self.entries.items()]
+
+    def import_state(self, state):
+        """Restore IDs exported by export_state"""
+        with self.lock:
+            for nickname, msg_id, seen_at in state:
+                self.entries[(nickname, msg_id)] = seen_at
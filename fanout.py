@@ -0,0 +1,77 @@
+import queue
+import threading
+
+from structured_log import get_logger
+
+
+class FanoutJob:
+    """Tracks one message being delivered by several fan-out workers"""
+
+    def __init__(self, parts):
+        self.remaining = parts
+        self.lock = threading.Lock()
+        self.done = threading.Event()
+        if parts == 0:
+            self.done.set()
+
+    def part_finished(self):
+        with self.lock:
+            self.remaining -= 1
+            if self.remaining == 0:
+                self.done.set()
+
+    def wait(self, timeout=None):
+        """Block until every recipient has been sent the message"""
+        return self.done.wait(timeout)
+
+
+class FanoutPool:
+    """Worker threads that deliver messages to large rooms in parallel
+
+    Every socket belongs to one worker, picked from its hash, so a recipient
+    always gets room messages in the order they were submitted.
+    """
+
+    def __init__(self, workers=4, threshold=200):
+        self.threshold = threshold  # Rooms at least this big are delivered by the pool
+        self.queues = [queue.Queue() for _ in range(workers)]
+        self.threads = []
+        for index, jobs in enumerate(self.queues):
+            thread = threading.Thread(target=self.worker_loop, args=(jobs,), name=f"fanout-{index}")
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def should_fan_out(self, member_count):
+        return len(self.queues) > 1 and member_count >= self.threshold
+
+    def submit(self, recipients, send):
+        """Split recipients by owning worker and call send(recipient) on each worker"""
+        slices = [[] for _ in self.queues]
+        for recipient in recipients:
+            slices[hash(recipient) % len(slices)].append(recipient)
+
+        used = [index for index, part in enumerate(slices) if part]
+        job = FanoutJob(len(used))
+        for index in used:
+            self.queues[index].put((slices[index], send, job))
+        return job
+
+    def worker_loop(self, jobs):
+        """Deliver queued slices until the pool is stopped"""
+        while True:
+            item = jobs.get()
+            if item is None:
+                break
+            recipients, send, job = item
+            for recipient in recipients:
+                try:
+                    send(recipient)
+                except Exception as e:
+                    get_logger().error("fan-out delivery failed", error=e)
+            job.part_finished()
+
+    def stop(self):
+        """Let every worker finish its queue and exit"""
+        for jobs in self.queues:
+            jobs.put(None)
@@ -5,6 +5,15 @@ import threading
 import json
 import base64
 import os
+import uuid
+import time
+import sys
+
+from structured_log import get_logger, DEBUG
+from compression import (ALGORITHM as COMPRESSION_ALGORITHM, FrameCompressor, FrameDecompressor,
+                         is_precompressed)
+from protocol import hello_frame, RecentCommands
+from presence import CAPABILITY as PRESENCE_CAPABILITY
 
 class ChatGUI:
     def __init__(self):
@@ -13,6 +22,11 @@ class ChatGUI:
         self.root.geometry("800x600")
         self.root.minsize(600, 400)
         
+        # Debug output goes through the background logger, off unless enabled
+        self.log = get_logger()
+        if '--debug' in sys.argv[1:]:
+            self.log.configure(level=DEBUG)
+        
         # Chat client connection variables
         self.client_socket = None
         self.nickname = None
@@ -20,6 +34,19 @@ class ChatGUI:
         self.current_room = None
         self.host = 'localhost'
         self.port = 55555
+        self.stream_id = None  # Delivery stream the server assigned at login
+        self.last_seq = 0      # Highest sequence number already handled
+        self.use_compression = True  # Ask for compression when the server offers it
+        self.compressor = None
+        self.decompressor = None
+        self.recent_commands = RecentCommands()  # Resent with the same msg_id after a reconnect
+        self.reconnecting = False  # Set until the login after a reconnect is accepted
+        
+        # The user and room lists follow PRESENCE frames after one LIST
+        self.presence_version = None  # Version the lists show, None until LIST arrives
+        self.presence_resync = False  # A LIST is owed before PRESENCE frames apply again
+        self.user_rows = []  # Nickname on each row of the users list
+        self.room_rows = []  # Room name on each row of the rooms list
         
         # Colors and styling
         self.bg_color = "#2c3e50"
@@ -276,6 +303,9 @@ class ChatGUI:
             self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.client_socket.connect((self.host, self.port))
             self.connected = True
+            self.compressor = None
+            self.decompressor = None
+            self.send_hello()
             
             # Start receiving messages
             receive_thread = threading.Thread(target=self.receive_messages)
@@ -294,6 +324,39 @@ class ChatGUI:
             messagebox.showerror("Connection Error", f"Failed to connect: {e}")
             self.connected = False
     
+    def reconnect(self, data, attempts=10):
+        """Reconnect after the server restarts, keeping the same nickname"""
+        content = data.get('content', '')
+        self.root.after(0, lambda: self.add_message_to_chat(f"🔄 {content}", "system"))
+        self.root.after(0, lambda: self.status_label.configure(text="Reconnecting...", fg=self.error_color))
+        try:
+            self.client_socket.close()
+        except:
+            pass
+        
+        # The server picks a random delay so clients do not all come back at once
+        time.sleep(data.get('retry_after_ms', 1000) / 1000)
+        for attempt in range(attempts):
+            try:
+                self.client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.client_socket.connect((self.host, self.port))
+                # A new connection starts uncompressed until the login says otherwise
+                self.compressor = None
+                self.decompressor = None
+                # Log in and rejoin the room in the same round trip
+                self.reconnecting = True
+                self.send_hello(self.current_room)
+                self.root.after(0, lambda: self.status_label.configure(
+                    text=f"Connected as {self.nickname}", fg=self.success_color))
+                return True
+            except OSError:
+                time.sleep(min(0.5 * (2 ** attempt), 5))
+        
+        self.connected = False
+        self.root.after(0, lambda: self.add_message_to_chat("Could not reconnect to server", "error"))
+        self.root.after(0, self.disconnect_from_server)
+        return False
+    
     def disconnect_from_server(self):
         """Disconnect from the server"""
         try:
@@ -311,9 +374,13 @@ class ChatGUI:
             # Clear lists
             self.users_listbox.delete(0, tk.END)
             self.rooms_listbox.delete(0, tk.END)
+            self.user_rows = []
+            self.room_rows = []
+            self.presence_version = None
+            self.presence_resync = False
             
         except Exception as e:
-            print(f"Error disconnecting: {e}")
+            self.log.error("disconnect failed", error=e)
     
     def receive_messages(self):
         """Listen for messages from the server"""
@@ -337,18 +404,22 @@ class ChatGUI:
                 if len(message_data) != message_length:
                     break
                 
+                if self.decompressor:
+                    message_data = self.decompressor.decode(message_data)
                 message = message_data.decode('utf-8')
                 if message:
-                    # Handle nickname request (plain text)
-                    if "Please enter your nickname:" in message or message.startswith("NICK_REQUEST"):
-                        nickname_bytes = self.nickname.encode('utf-8')
-                        length_bytes = len(nickname_bytes).to_bytes(4, byteorder='big')
-                        self.client_socket.send(length_bytes + nickname_bytes)
-                        continue
-                    
                     # Parse JSON message
                     try:
                         data = json.loads(message)
+                        if data.get('type') == 'NICK_REQUEST':
+                            self.handle_nickname_request(data)
+                            continue
+                        if self.is_duplicate(data):
+                            continue
+                        if data.get('type') in ('RECONNECT', 'SERVER_BUSY'):
+                            # Reconnect on this thread, the loop then reads the new socket
+                            self.reconnect(data)
+                            continue
                         self.handle_server_message(data)
                     except json.JSONDecodeError:
                         # Handle plain text messages
@@ -358,20 +429,70 @@ class ChatGUI:
                         else:
                             self.root.after(0, lambda: self.add_message_to_chat(f"Server: {message}", "system"))
                 else:
-                    print("Server disconnected")
+                    self.log.info("server disconnected")
                     self.connected = False
                     break
             except ConnectionResetError:
-                print("Connection to server lost")
+                self.log.warning("connection to server lost")
                 self.connected = False
                 break
             except Exception as e:
                 if self.connected:
-                    print(f"Connection error: {e}")
+                    self.log.error("connection error", error=e)
                     self.root.after(0, lambda: self.add_message_to_chat(f"Connection error: {e}", "error"))
                     self.connected = False
                 break
     
+    def send_hello(self, room=None):
+        """Log in straight after connecting, without waiting for NICK_REQUEST"""
+        capabilities = [COMPRESSION_ALGORITHM] if self.use_compression else []
+        capabilities.append(PRESENCE_CAPABILITY)
+        self.send_frame(json.dumps(hello_frame(self.nickname, capabilities, room)).encode('utf-8'))
+    
+    def handle_nickname_request(self, data):
+        """NICK_REQUEST is the server's answer to HELLO, it says whether compression is on"""
+        # The server compresses every frame after our HELLO if it offers what we asked for
+        if self.use_compression and COMPRESSION_ALGORITHM in data.get('capabilities', []):
+            self.compressor = FrameCompressor()
+            self.decompressor = FrameDecompressor()
+    
+    def resend_recent(self):
+        """Send again the commands that may have been lost with the previous connection"""
+        # Same frames, same msg_id, the server skips the ones it already handled
+        for message_bytes, compress in self.recent_commands.pending():
+            self.send_frame(message_bytes, compress)
+    
+    def send_frame(self, message_bytes, compress=True):
+        """Write one length-prefixed frame, compressed once the server agreed to it"""
+        compressor = self.compressor
+        if compressor is None:
+            length_bytes = len(message_bytes).to_bytes(4, byteorder='big')
+            self.client_socket.sendall(length_bytes + message_bytes)
+            return
+        
+        # Frames have to enter the deflate stream in the order they are written
+        with compressor.lock:
+            payload = compressor.encode(message_bytes, compress)
+            self.client_socket.sendall(len(payload).to_bytes(4, byteorder='big') + payload)
+    
+    def is_duplicate(self, data):
+        """Acknowledge sequenced messages and report ones already handled"""
+        # A new delivery stream restarts the sequence numbers
+        if data.get('type') == 'NICK_ACCEPTED' and data.get('stream_id') != self.stream_id:
+            self.stream_id = data.get('stream_id')
+            self.last_seq = 0
+        
+        seq = data.get('seq')
+        if seq is None:
+            return False
+        
+        # Cumulative ACK, so acking a retransmitted duplicate is harmless
+        self.send_command('ACK', seq)
+        if seq <= self.last_seq:
+            return True
+        self.last_seq = seq
+        return False
+    
     def handle_server_message(self, data):
         """Handle different types of messages from the server"""
         msg_type = data.get('type', '')
@@ -381,6 +502,14 @@ class ChatGUI:
         # Use root.after to update GUI from thread
         if msg_type == 'NICK_ACCEPTED':
             self.root.after(0, lambda: self.add_message_to_chat(content, "system"))
+            # Only commands sent over an earlier connection can have been lost
+            if self.reconnecting:
+                self.reconnecting = False
+                self.resend_recent()
+            # One LIST fills the lists, PRESENCE frames keep them current from then on
+            if PRESENCE_CAPABILITY in data.get('capabilities', []):
+                self.presence_resync = True
+                self.refresh_lists()
         elif msg_type == 'NICK_ERROR':
             self.root.after(0, lambda: self.add_message_to_chat(f"Error: {content}", "error"))
             self.root.after(0, self.disconnect_from_server)
@@ -402,13 +531,27 @@ class ChatGUI:
         elif msg_type == 'USER_LEFT':
             self.root.after(0, lambda: self.add_message_to_chat(f"[{timestamp}] 👋 {content}", "user_left"))
         elif msg_type == 'LIST_RESPONSE':
-            self.root.after(0, lambda: self.update_lists(content))
+            self.root.after(0, lambda: self.update_lists(content, data.get('presence')))
+        elif msg_type == 'PRESENCE':
+            self.root.after(0, lambda: self.apply_presence(data))
         elif msg_type == 'ERROR':
             self.root.after(0, lambda: self.add_message_to_chat(f"[{timestamp}] ❌ Error: {content}", "error"))
+        elif msg_type == 'PING':
+            # Heartbeat, the server drops clients that do not answer
+            self.send_command('PONG')
+        elif msg_type in ('RETRY_LATER', 'THROTTLED'):
+            self.root.after(0, lambda: self.add_message_to_chat(f"[{timestamp}] ⏳ {content}", "error"))
+            # Without the LIST every later PRESENCE frame is ignored, so ask again once allowed
+            if data.get('command') == 'LIST' and self.presence_resync:
+                self.root.after(data.get('retry_after_ms', 1000), self.refresh_lists)
         elif msg_type == 'FILE_SENT':
             self.root.after(0, lambda: self.add_message_to_chat(f"[{timestamp}] 📎 {content}", "system"))
         elif msg_type == 'FILE_RECEIVED':
             self.root.after(0, lambda: self.handle_received_file(data))
+        elif msg_type == 'OFFLINE_MESSAGES':
+            self.root.after(0, lambda: self.add_message_to_chat(f"[{timestamp}] 📬 {content}", "system"))
+            for queued in data.get('messages', []):
+                self.handle_server_message(queued)
         else:
             self.root.after(0, lambda: self.add_message_to_chat(f"[{timestamp}] {content}", "system"))
     
@@ -476,13 +619,16 @@ class ChatGUI:
                 'command': command,
                 'content': content
             }
-            message_json = json.dumps(message)
-            message_bytes = message_json.encode('utf-8')
-            length_bytes = len(message_bytes).to_bytes(4, byteorder='big')
-            print(f"Sending command: {command} with content: {content}")  # Debug
-            self.client_socket.send(length_bytes + message_bytes)
+            # Unique ID lets the server drop this command if it is ever resent
+            if command not in ('ACK', 'PONG'):
+                message['msg_id'] = uuid.uuid4().hex
+            message_bytes = json.dumps(message).encode('utf-8')
+            if 'msg_id' in message:
+                self.recent_commands.add(message_bytes)
+            self.log.debug("sending command", command=command)
+            self.send_frame(message_bytes)
         except Exception as e:
-            print(f"Error sending command: {e}")  # Debug
+            self.log.error("send failed", command=command, error=e)
             self.add_message_to_chat(f"Error sending command: {e}", "error")
             self.connected = False
     
@@ -528,17 +674,29 @@ class ChatGUI:
         """Refresh users and rooms lists"""
         self.send_command('LIST')
     
-    def update_lists(self, list_content):
+    def update_lists(self, list_content, presence=None):
         """Update users and rooms lists from server response"""
-        lines = list_content.split('\n')
-        
         # Clear lists
         self.users_listbox.delete(0, tk.END)
         self.rooms_listbox.delete(0, tk.END)
+        self.user_rows = []
+        self.room_rows = []
+        
+        if presence:
+            # The same state PRESENCE frames update, no need to parse the text
+            for nickname, room in presence.get('users', {}).items():
+                self.set_row(self.users_listbox, self.user_rows, nickname, self.user_text(nickname, room))
+            for room, count in presence.get('rooms', {}).items():
+                self.set_row(self.rooms_listbox, self.room_rows, room, self.room_text(room, count))
+            # PRESENCE frames after this version are applied on top
+            self.presence_version = presence.get('version')
+            self.presence_resync = False
+            return
         
-        # Parse response
+        # Older servers only send the text
+        self.presence_version = None
         current_section = None
-        for line in lines:
+        for line in list_content.split('\n'):
             line = line.strip()
             if line == "Active Users:":
                 current_section = "users"
@@ -546,8 +704,58 @@ class ChatGUI:
                 current_section = "rooms"
             elif line and current_section == "users":
                 self.users_listbox.insert(tk.END, line)
+                self.user_rows.append(line.split(' (')[0])
             elif line and current_section == "rooms":
                 self.rooms_listbox.insert(tk.END, line)
+                self.room_rows.append(line.rsplit(' (', 1)[0])
+    
+    def apply_presence(self, data):
+        """Apply a PRESENCE frame to the lists in place, or resync if one was missed"""
+        version = data.get('version', 0)
+        if self.presence_version is None or version <= self.presence_version:
+            return  # Waiting for LIST, or the change is already in it
+        if version != self.presence_version + 1:
+            self.presence_version = None
+            self.presence_resync = True
+            self.refresh_lists()
+            return
+        self.presence_version = version
+        
+        for event in data.get('events', []):
+            op = event.get('op')
+            if op in ('user_online', 'user_moved'):
+                nickname = event['nickname']
+                self.set_row(self.users_listbox, self.user_rows, nickname,
+                             self.user_text(nickname, event.get('room')))
+            elif op == 'user_offline':
+                self.remove_row(self.users_listbox, self.user_rows, event['nickname'])
+            elif op in ('room_created', 'room_count'):
+                room = event['room']
+                self.set_row(self.rooms_listbox, self.room_rows, room, self.room_text(room, event['count']))
+            elif op == 'room_removed':
+                self.remove_row(self.rooms_listbox, self.room_rows, event['room'])
+    
+    def user_text(self, nickname, room):
+        return f"{nickname} ({room or 'No room'})"
+    
+    def room_text(self, room, count):
+        return f"{room} ({count} users)"
+    
+    def set_row(self, listbox, rows, key, text):
+        """Replace the row for key, or add it at the end"""
+        if key in rows:
+            index = rows.index(key)
+            listbox.delete(index)
+            listbox.insert(index, text)
+        else:
+            rows.append(key)
+            listbox.insert(tk.END, text)
+    
+    def remove_row(self, listbox, rows, key):
+        if key in rows:
+            index = rows.index(key)
+            del rows[index]
+            listbox.delete(index)
     
     def show_help(self):
         """Show help dialog"""
@@ -670,6 +878,7 @@ You can also:
             # Send file command
             file_command = {
                 'command': 'FILE',
+                'msg_id': uuid.uuid4().hex,
                 'target': target,
                 'is_private': is_private,
                 'file_data': {
@@ -683,10 +892,10 @@ You can also:
             progress_msg = f"Sending {filename} ({'privately to ' + target if is_private else 'to room ' + target})..."
             self.add_message_to_chat(progress_msg, "system")
             
-            message_json = json.dumps(file_command)
-            message_bytes = message_json.encode('utf-8')
-            length_bytes = len(message_bytes).to_bytes(4, byteorder='big')
-            self.client_socket.send(length_bytes + message_bytes)
+            message_bytes = json.dumps(file_command).encode('utf-8')
+            self.recent_commands.add(message_bytes, not is_precompressed(filename))
+            # Images, archives and video are compressed already
+            self.send_frame(message_bytes, compress=not is_precompressed(filename))
             
         except Exception as e:
             messagebox.showerror("Error", f"Failed to send file: {e}")
@@ -694,22 +903,17 @@ You can also:
     def handle_received_file(self, data):
         """Handle received file from server"""
         try:
-            print(f"🔍 DEBUG: Received file data keys: {list(data.keys())}")
-            
             file_info = data.get('file_info', {})
             file_content_b64 = data.get('file_content', '')
             is_private = data.get('is_private', False)
             timestamp = data.get('timestamp', '')
             
-            print(f"🔍 DEBUG: file_info keys: {list(file_info.keys())}")
-            print(f"🔍 DEBUG: timestamp: '{timestamp}'")
-            print(f"🔍 DEBUG: file_content length: {len(file_content_b64)}")
-            
             filename = file_info.get('filename', 'unknown_file')
             sender = file_info.get('sender', 'Unknown')
             file_size = file_info.get('size', 0)
             
-            print(f"🔍 DEBUG: filename: '{filename}', sender: '{sender}', size: {file_size}")
+            self.log.debug("file received", filename=filename, sender=sender, size=file_size,
+                           encoded_length=len(file_content_b64))
             
             # Format file size
             if file_size < 1024:
@@ -728,7 +932,6 @@ You can also:
                 self.received_files = {}
             
             file_id = f"{sender}_{filename}_{timestamp}"
-            print(f"🔍 DEBUG: Generated file_id: '{file_id}'")
             
             self.received_files[file_id] = {
                 'filename': filename,
@@ -737,8 +940,7 @@ You can also:
                 'size': file_size
             }
             
-            print(f"🔍 DEBUG: Stored file in received_files. Total files: {len(self.received_files)}")
-            print(f"🔍 DEBUG: Available file IDs: {list(self.received_files.keys())}")
+            self.log.debug("file stored", file_id=file_id, stored_files=len(self.received_files))
             
             # Add clickable message - make the entire line clickable
             self.chat_display.configure(state=tk.NORMAL)
@@ -753,15 +955,12 @@ You can also:
     def handle_file_click(self, event):
         """Handle clicking on file links"""
         try:
-            print(f"🔍 DEBUG: File click detected!")
-            
             # Get the current position
             current_pos = self.chat_display.index(tk.CURRENT)
-            print(f"🔍 DEBUG: Click position: {current_pos}")
             
             # Get all text with the file_link tag
             ranges = self.chat_display.tag_ranges("file_link")
-            print(f"🔍 DEBUG: Found {len(ranges)//2} file_link ranges")
+            self.log.debug("file link clicked", position=current_pos, links=len(ranges) // 2)
             
             # Find which file link was clicked
             for i in range(0, len(ranges), 2):
@@ -774,54 +973,42 @@ You can also:
                     
                     # Get the text for this range
                     link_text = self.chat_display.get(start_pos, end_pos)
-                    print(f"🔍 DEBUG: Clicked link text: '{link_text}'")
                     
                     # Extract file ID from the text
                     if "(ID: " in link_text:
                         file_id = link_text.split("(ID: ")[1].split(")")[0]
-                        print(f"🔍 DEBUG: Extracted file_id: '{file_id}'")
                         
                         if hasattr(self, 'received_files'):
-                            print(f"🔍 DEBUG: Available file IDs: {list(self.received_files.keys())}")
                             if file_id in self.received_files:
-                                print(f"✅ DEBUG: File found! Proceeding to download...")
                                 self.download_file(file_id)
                                 return
                             else:
-                                print(f"❌ DEBUG: File ID not found in received_files")
+                                self.log.debug("clicked file not found", file_id=file_id)
                         else:
-                            print(f"❌ DEBUG: No received_files attribute")
+                            self.log.debug("no received files yet")
                     else:
-                        print(f"❌ DEBUG: No file ID found in link text")
+                        self.log.debug("no file ID in link text")
                     break
             else:
-                print(f"❌ DEBUG: Click position not found in any file link range")
+                self.log.debug("click outside file links", position=current_pos)
                 
         except Exception as e:
-            print(f"❌ DEBUG: Error handling file click: {e}")
-            import traceback
-            traceback.print_exc()
+            self.log.error("file click failed", error=e)
     
     def download_file(self, file_id):
         """Download and save received file"""
-        print(f"🔧 DEBUG: download_file called with file_id: '{file_id}'")
-        
         if not hasattr(self, 'received_files'):
-            print(f"❌ DEBUG: No received_files attribute!")
             messagebox.showerror("Error", "File not found!")
             return
             
         if file_id not in self.received_files:
-            print(f"❌ DEBUG: file_id '{file_id}' not in received_files: {list(self.received_files.keys())}")
             messagebox.showerror("Error", "File not found!")
             return
         
         file_data = self.received_files[file_id]
         filename = file_data['filename']
-        print(f"🔧 DEBUG: Retrieved file data for '{filename}'")
         
         # Ask where to save
-        print(f"🔧 DEBUG: Opening file save dialog...")
         save_path = filedialog.asksaveasfilename(
             title="Save file as",
             initialfile=filename,
@@ -829,17 +1016,14 @@ You can also:
             parent=self.root
         )
         
-        print(f"🔧 DEBUG: User selected save path: '{save_path}'")
-        
         if save_path:
             try:
-                print(f"🔧 DEBUG: Decoding and saving file...")
                 # Decode and save file
                 file_content = base64.b64decode(file_data['content'])
                 with open(save_path, 'wb') as f:
                     f.write(file_content)
                 
-                print(f"✅ DEBUG: File saved successfully!")
+                self.log.debug("file saved", filename=filename, path=save_path)
                 messagebox.showinfo("Success", f"File saved as: {save_path}")
                 self.add_message_to_chat(f"📥 Downloaded: {filename}", "system")
                 
@@ -847,12 +1031,8 @@ You can also:
                 del self.received_files[file_id]
                 
             except Exception as e:
-                print(f"❌ DEBUG: Exception in download_file: {e}")
-                import traceback
-                traceback.print_exc()
+                self.log.error("file save failed", filename=filename, error=e)
                 messagebox.showerror("Error", f"Failed to save file: {e}")
-        else:
-            print(f"🔧 DEBUG: User cancelled file save dialog")
     
 if __name__ == "__main__":
     # Start the GUI client
@@ -0,0 +1,87 @@
+import os
+import socket
+import threading
+
+from structured_log import get_logger
+
+# Passing file descriptors needs UNIX domain sockets (SCM_RIGHTS), Python 3.9+
+HANDOFF_SUPPORTED = hasattr(socket, 'AF_UNIX') and hasattr(socket, 'send_fds')
+
+
+def request_listener(path, timeout=10):
+    """Ask the server running at path for its listening socket, None if there is none"""
+    if not HANDOFF_SUPPORTED or not os.path.exists(path):
+        return None
+
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.settimeout(timeout)
+    try:
+        conn.connect(path)
+    except (ConnectionRefusedError, FileNotFoundError):
+        conn.close()
+        return None
+
+    try:
+        conn.sendall(b'HANDOFF')
+        # The old server drains its clients before answering, so this can take a moment
+        message, fds, _, _ = socket.recv_fds(conn, 64, 1)
+        if message != b'LISTEN' or not fds:
+            return None
+        listener = socket.socket(fileno=fds[0])
+        listener.setblocking(True)
+        return listener
+    finally:
+        conn.close()
+
+
+class HandoffListener:
+    """Waits on a UNIX socket for a successor process and hands it the listener"""
+
+    def __init__(self, server, path):
+        self.server = server
+        self.path = path
+        self.sock = None
+        self.finished = threading.Event()  # Set once the listener has been handed over
+
+    def start(self):
+        """Bind the handoff path and wait for a successor in the background"""
+        if not HANDOFF_SUPPORTED:
+            get_logger().warning("listener handoff not supported on this platform")
+            return False
+
+        # A previous server's path is stale once we own the listener
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(1)
+
+        thread = threading.Thread(target=self.wait_for_successor)
+        thread.daemon = True
+        thread.start()
+        get_logger().info("accepting listener handoff", path=self.path)
+        return True
+
+    def wait_for_successor(self):
+        """Hand the listening socket to the first process that asks for it"""
+        try:
+            conn, _ = self.sock.accept()
+        except OSError:
+            return
+
+        try:
+            with conn:
+                if conn.recv(64) != b'HANDOFF':
+                    return
+                get_logger().info("successor connected, handing over listener", path=self.path)
+                listener = self.server.release_listener()
+                if listener is None:
+                    return
+                socket.send_fds(conn, [b'LISTEN'], [listener.fileno()])
+                listener.close()
+        finally:
+            self.sock.close()
+            self.finished.set()
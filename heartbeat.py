@@ -0,0 +1,81 @@
+import socket
+import threading
+
+
+class TimerWheel:
+    """Hashed timing wheel holding one deadline per key
+
+    Pushing a deadline back only updates a dict entry, the key is moved to
+    its new slot when the wheel reaches the old one, so refreshing a busy
+    connection on every frame costs almost nothing.
+    """
+
+    def __init__(self, tick=1.0, slots=64, now=0.0):
+        self.tick = tick
+        self.slots = [set() for _ in range(slots)]
+        self.deadlines = {}  # {key: deadline}
+        self.slot_of = {}    # {key: index of the slot holding it}
+        self.current = int(now // tick)  # Tick the wheel has been advanced to
+        self.lock = threading.Lock()
+
+    def place(self, key, deadline):
+        """Put a key in the slot for its deadline (caller holds the lock)"""
+        index = max(int(deadline // self.tick), self.current) % len(self.slots)
+        self.slots[index].add(key)
+        self.slot_of[key] = index
+
+    def schedule(self, key, deadline):
+        """Set or change the deadline for a key"""
+        with self.lock:
+            old = self.deadlines.get(key)
+            self.deadlines[key] = deadline
+            if old is None:
+                self.place(key, deadline)
+            elif deadline < old:
+                # Earlier deadlines have to move now, later ones move lazily
+                self.slots[self.slot_of[key]].discard(key)
+                self.place(key, deadline)
+
+    def cancel(self, key):
+        with self.lock:
+            if self.deadlines.pop(key, None) is not None:
+                self.slots[self.slot_of.pop(key)].discard(key)
+
+    def advance(self, now):
+        """Move the wheel up to now, returns the keys whose deadline has passed"""
+        expired = []
+        with self.lock:
+            target = int(now // self.tick)
+            # After a long stall every slot is due, but each only needs one look
+            for tick in range(max(self.current, target - len(self.slots) + 1), target + 1):
+                index = tick % len(self.slots)
+                for key in list(self.slots[index]):
+                    deadline = self.deadlines[key]
+                    if deadline <= now:
+                        self.slots[index].discard(key)
+                        del self.deadlines[key]
+                        del self.slot_of[key]
+                        expired.append(key)
+                    elif int(deadline // self.tick) % len(self.slots) != index:
+                        self.slots[index].discard(key)
+                        self.place(key, deadline)
+            # Stay on the target tick, keys due later in it are checked next time
+            self.current = target
+        return expired
+
+    def __len__(self):
+        return len(self.deadlines)
+
+
+def enable_keepalive(sock, idle=30, interval=10, count=3):
+    """Turn on TCP keepalive so the kernel notices dead peers on its own"""
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    # Tuning options differ per platform, use whatever this one has
+    if hasattr(socket, 'TCP_KEEPIDLE'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle)
+    elif hasattr(socket, 'TCP_KEEPALIVE'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPALIVE, idle)
+    if hasattr(socket, 'TCP_KEEPINTVL'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval)
+    if hasattr(socket, 'TCP_KEEPCNT'):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
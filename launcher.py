@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Multi-process chat server launcher
+Starts N worker processes that share one port through SO_REUSEPORT and
+exchange room, private and presence traffic over a local backplane hub.
+"""
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+from backplane import BackplaneHub, HubBackplane
+from offline_mailbox import MailboxStore
+from server import ChatServer
+
+
+def run_worker(worker_id, host, port, hub_path):
+    """Run one server loop connected to the backplane"""
+    server = ChatServer(host, port, lambda server: HubBackplane(server, hub_path, worker_id))
+    server.reuse_port = True
+
+    # Each worker keeps its own snapshot and mailbox files
+    server.snapshot_path = f"server_snapshot_worker{worker_id}.pkl"
+    server.offline_mailboxes = MailboxStore(spill_dir=os.path.join("server_mailboxes", f"worker{worker_id}"))
+
+    print(f"Worker {worker_id} (pid {os.getpid()}) serving {host}:{port}")
+    try:
+        server.start_server()
+    except KeyboardInterrupt:
+        server.shutdown_server()
+
+
+def launch(workers, host='localhost', port=55555):
+    """Start the hub and the workers, then wait until they exit"""
+    hub_path = os.path.join(tempfile.mkdtemp(prefix='chat_hub_'), 'hub.sock')
+    hub = BackplaneHub(hub_path)
+    hub.start()
+
+    processes = []
+    for worker_id in range(workers):
+        process = multiprocessing.Process(target=run_worker, args=(worker_id, host, port, hub_path))
+        process.daemon = True
+        process.start()
+        processes.append(process)
+
+    try:
+        while any(process.is_alive() for process in processes):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\nStopping workers...")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join(timeout=5)
+        hub.stop()
+
+
+def main():
+    """Parse command line arguments and launch the workers"""
+    # python launcher.py [workers] [host] [port]
+    workers = os.cpu_count() or 1
+    host = 'localhost'
+    port = 55555
+
+    try:
+        if len(sys.argv) >= 2:
+            workers = int(sys.argv[1])
+        if len(sys.argv) >= 3:
+            host = sys.argv[2]
+        if len(sys.argv) >= 4:
+            port = int(sys.argv[3])
+    except ValueError:
+        print("Usage: python launcher.py [workers] [host] [port]")
+        return
+
+    print("=== Python Chat Server (multi-process) ===")
+    print(f"Starting {workers} workers on {host}:{port}...")
+    launch(workers, host, port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import threading
+import time
+
+
+class LeaseTable:
+    """Time-bounded nickname leases, kept by whoever arbitrates the names"""
+
+    def __init__(self, lease_seconds=30):
+        self.lease_seconds = lease_seconds
+        self.leases = {}  # {nickname: [holder, expires_at]}
+        self.lock = threading.Lock()
+
+    def acquire(self, nickname, holder, now=None):
+        """Grant or extend a lease, False if another holder has a live one"""
+        now = now if now is not None else time.time()
+        with self.lock:
+            lease = self.leases.get(nickname)
+            if lease and lease[0] != holder and lease[1] > now:
+                return False
+            self.leases[nickname] = [holder, now + self.lease_seconds]
+            return True
+
+    def renew(self, holder, nicknames, now=None):
+        """Extend every lease a holder still has, returns the nicknames it lost"""
+        return [nickname for nickname in nicknames if not self.acquire(nickname, holder, now)]
+
+    def release(self, nickname, holder):
+        """Drop a lease, False if the holder did not have it"""
+        with self.lock:
+            lease = self.leases.get(nickname)
+            if not lease or lease[0] != holder:
+                return False
+            del self.leases[nickname]
+            return True
+
+    def release_holder(self, holder):
+        """Drop every lease of a holder that went away, returns the nicknames"""
+        with self.lock:
+            released = [nickname for nickname, lease in self.leases.items() if lease[0] == holder]
+            for nickname in released:
+                del self.leases[nickname]
+            return released
+
+    def holder_of(self, nickname, now=None):
+        """Current holder of a nickname, None if it is free"""
+        now = now if now is not None else time.time()
+        with self.lock:
+            lease = self.leases.get(nickname)
+            if lease and lease[1] > now:
+                return lease[0]
+            return None
+
+    def expire(self, now=None):
+        """Drop leases that were not renewed in time, returns (nickname, holder) pairs"""
+        now = now if now is not None else time.time()
+        with self.lock:
+            expired = [(nickname, lease[0]) for nickname, lease in self.leases.items()
+                       if lease[1] <= now]
+            for nickname, _ in expired:
+                del self.leases[nickname]
+            return expired
+
+
+class NicknameCache:
+    """A node's local view: leases it holds and nicknames recently found taken"""
+
+    def __init__(self, negative_ttl=5):
+        self.negative_ttl = negative_ttl
+        self.held = set()  # Nicknames this node holds a lease for
+        self.taken = {}    # {nickname: time the negative entry expires}
+        self.lock = threading.Lock()
+
+    def is_taken(self, nickname, now=None):
+        """True if a recent lookup found the nickname in use elsewhere"""
+        now = now if now is not None else time.time()
+        with self.lock:
+            expires_at = self.taken.get(nickname)
+            if expires_at is None:
+                return False
+            if expires_at <= now:
+                del self.taken[nickname]
+                return False
+            return True
+
+    def mark_taken(self, nickname):
+        """Remember that a nickname is in use elsewhere"""
+        with self.lock:
+            self.taken[nickname] = time.time() + self.negative_ttl
+
+    def forget(self, nickname):
+        """Drop a negative entry once the nickname is known to be free"""
+        with self.lock:
+            self.taken.pop(nickname, None)
+
+    def hold(self, nickname):
+        """Record a lease granted to this node"""
+        with self.lock:
+            self.held.add(nickname)
+            self.taken.pop(nickname, None)
+
+    def drop(self, nickname):
+        """Forget a lease this node gave back or lost"""
+        with self.lock:
+            self.held.discard(nickname)
+
+    def held_names(self):
+        """Nicknames to renew on the next heartbeat"""
+        with self.lock:
+            return list(self.held)
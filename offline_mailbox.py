@@ -0,0 +1,205 @@
+import json
+import os
+import threading
+import time
+import hashlib
+import itertools
+from collections import deque
+
+from structured_log import get_logger
+
+
+class OfflineMailbox:
+    """Bounded FIFO of frames waiting for one offline nickname"""
+
+    def __init__(self, nickname, spill_path, memory_limit, max_entries):
+        self.nickname = nickname
+        self.spill_path = spill_path
+        self.memory_limit = memory_limit
+        self.max_entries = max_entries
+        self.memory = deque()   # Oldest entries stay in memory
+        self.spilled = 0        # Number of newer entries appended to disk
+
+    def __len__(self):
+        return len(self.memory) + self.spilled
+
+    def put(self, entry):
+        """Queue an entry, spilling to disk once the memory part is full"""
+        if len(self) >= self.max_entries:
+            return False
+
+        # Once anything is on disk, keep appending there to preserve order
+        if self.spilled or len(self.memory) >= self.memory_limit:
+            os.makedirs(os.path.dirname(self.spill_path), exist_ok=True)
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+            self.spilled += 1
+        else:
+            self.memory.append(entry)
+        return True
+
+    def peek(self, limit):
+        """The oldest entries in arrival order, left in the mailbox"""
+        entries = list(itertools.islice(self.memory, limit))
+        if len(entries) < limit and self.spilled:
+            try:
+                with open(self.spill_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        line = line.strip()
+                        if line:
+                            entries.append(json.loads(line))
+                            if len(entries) >= limit:
+                                break
+            except (OSError, json.JSONDecodeError) as e:
+                get_logger().error("could not read mailbox spill", nickname=self.nickname, error=e)
+        return entries
+
+    def evict_expired(self, cutoff):
+        """Drop entries queued before cutoff, returns how many were removed"""
+        return self.remove_front(lambda queued_at: queued_at < cutoff)
+
+    def remove_through(self, queued_at):
+        """Drop the entries up to and including the one queued at queued_at"""
+        return self.remove_front(lambda entry_queued_at: entry_queued_at <= queued_at)
+
+    def remove_front(self, is_removed):
+        """Drop leading entries whose queued_at passes is_removed, returns how many"""
+        removed = 0
+        while self.memory and is_removed(self.memory[0]['queued_at']):
+            self.memory.popleft()
+            removed += 1
+
+        # The memory part is always older than the spill, so only look at disk
+        # when everything in memory has already gone
+        if self.spilled and not self.memory:
+            entries = self.read_spill()
+            self.discard_spill()
+            kept = [entry for entry in entries if not is_removed(entry['queued_at'])]
+            removed += len(entries) - len(kept)
+            for entry in kept:
+                self.put(entry)
+        return removed
+
+    def read_spill(self):
+        """Every entry on disk, in arrival order"""
+        entries = []
+        try:
+            with open(self.spill_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        entries.append(json.loads(line))
+        except (OSError, json.JSONDecodeError) as e:
+            get_logger().error("could not read mailbox spill", nickname=self.nickname, error=e)
+        return entries
+
+    def discard_spill(self):
+        """Delete the on-disk part of this mailbox"""
+        self.spilled = 0
+        try:
+            os.remove(self.spill_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            get_logger().error("could not remove mailbox spill", nickname=self.nickname, error=e)
+
+
+class MailboxStore:
+    """Per-nickname offline mailboxes with disk spill and TTL eviction"""
+
+    def __init__(self, spill_dir="server_mailboxes", memory_limit=50,
+                 max_entries=500, max_mailboxes=1000, ttl_seconds=7 * 24 * 3600):
+        self.spill_dir = spill_dir
+        self.memory_limit = memory_limit
+        self.max_entries = max_entries
+        self.max_mailboxes = max_mailboxes
+        self.ttl_seconds = ttl_seconds
+        self.mailboxes = {}  # {nickname: OfflineMailbox}
+        self.lock = threading.Lock()
+        self.last_sweep = time.time()
+        self.last_queued_at = 0.0  # queued_at is unique and increasing within the store
+
+    def spill_path(self, nickname):
+        """Disk file for a nickname, hashed so any nickname is a safe filename"""
+        digest = hashlib.sha1(nickname.encode('utf-8')).hexdigest()
+        return os.path.join(self.spill_dir, f"{digest}.jsonl")
+
+    def enqueue(self, nickname, entry):
+        """Queue a frame for an offline nickname, returns False if it is full"""
+        entry = dict(entry)
+
+        with self.lock:
+            # Entries are removed by queued_at once delivered, so no two may share one
+            self.last_queued_at = max(time.time(), self.last_queued_at + 0.000001)
+            entry['queued_at'] = self.last_queued_at
+            self.sweep_if_due()
+
+            mailbox = self.mailboxes.get(nickname)
+            if mailbox is None:
+                if len(self.mailboxes) >= self.max_mailboxes:
+                    return False
+                mailbox = OfflineMailbox(nickname, self.spill_path(nickname),
+                                         self.memory_limit, self.max_entries)
+                self.mailboxes[nickname] = mailbox
+            return mailbox.put(entry)
+
+    def peek(self, nickname, limit=50):
+        """The oldest unexpired entries for a nickname, kept until remove_through is called"""
+        with self.lock:
+            mailbox = self.mailboxes.get(nickname)
+            if mailbox is None:
+                return []
+            mailbox.evict_expired(time.time() - self.ttl_seconds)
+            return [dict(entry) for entry in mailbox.peek(limit)]
+
+    def remove_through(self, nickname, queued_at):
+        """Remove a nickname's entries up to the one queued at queued_at, once they are delivered"""
+        with self.lock:
+            mailbox = self.mailboxes.get(nickname)
+            if mailbox is None:
+                return
+            mailbox.remove_through(queued_at)
+            if not len(mailbox):
+                mailbox.discard_spill()
+                del self.mailboxes[nickname]
+
+    def pending_count(self, nickname):
+        """Number of frames waiting for a nickname"""
+        with self.lock:
+            mailbox = self.mailboxes.get(nickname)
+            return len(mailbox) if mailbox else 0
+
+    def export_state(self):
+        """Plain data for a snapshot, spilled entries stay in their files"""
+        with self.lock:
+            return {nickname: {'memory': list(mailbox.memory), 'spilled': mailbox.spilled}
+                    for nickname, mailbox in self.mailboxes.items()}
+
+    def import_state(self, state):
+        """Restore mailboxes exported by export_state"""
+        with self.lock:
+            for nickname, data in state.items():
+                mailbox = OfflineMailbox(nickname, self.spill_path(nickname),
+                                         self.memory_limit, self.max_entries)
+                mailbox.memory.extend(data['memory'])
+                mailbox.spilled = data['spilled']
+                self.mailboxes[nickname] = mailbox
+                for entry in data['memory']:
+                    self.last_queued_at = max(self.last_queued_at, entry['queued_at'])
+
+    def sweep_if_due(self):
+        """Evict expired entries at most once a minute (caller holds the lock)"""
+        now = time.time()
+        if now - self.last_sweep < 60:
+            return
+        self.last_sweep = now
+        self.evict_expired(now - self.ttl_seconds)
+
+    def evict_expired(self, cutoff):
+        """Drop expired entries and empty mailboxes (caller holds the lock)"""
+        for nickname in list(self.mailboxes.keys()):
+            mailbox = self.mailboxes[nickname]
+            mailbox.evict_expired(cutoff)
+            if not len(mailbox):
+                mailbox.discard_spill()
+                del self.mailboxes[nickname]
@@ -0,0 +1,89 @@
+import threading
+
+
+# Load levels in increasing order of severity
+NORMAL = 'NORMAL'
+ELEVATED = 'ELEVATED'
+HIGH = 'HIGH'
+CRITICAL = 'CRITICAL'
+LEVELS = [NORMAL, ELEVATED, HIGH, CRITICAL]
+
+# Commands refused at each level, the most expensive ones go first and MSG never does
+SHED_COMMANDS = {
+    NORMAL: set(),
+    ELEVATED: {'FILE'},
+    HIGH: {'FILE', 'LIST'},
+    CRITICAL: {'FILE', 'LIST', 'JOIN'},
+}
+
+
+class OverloadMonitor:
+    """Grades server load from handler latency, queue depth and connection use"""
+
+    def __init__(self, latency_limits=(0.05, 0.2, 1.0), depth_limits=(200, 1000, 5000),
+                 connection_limits=(0.8, 0.9, 0.98)):
+        # Each tuple holds the thresholds for ELEVATED, HIGH and CRITICAL
+        self.latency_limits = latency_limits        # Seconds of average command handling time
+        self.depth_limits = depth_limits            # Operations waiting in room and fan-out queues
+        self.connection_limits = connection_limits  # Share of max_connections in use
+        self.latency = 0.0   # Moving average of command handling time
+        self.queue_depth = 0
+        self.connection_use = 0.0
+        self.level = NORMAL
+        self.shed_count = 0
+        self.lock = threading.Lock()
+
+    def record_latency(self, seconds):
+        """Fold one command's handling time into the moving average"""
+        with self.lock:
+            self.latency += (seconds - self.latency) * 0.1
+
+    def grade(self, value, limits):
+        """Index into LEVELS for one measurement"""
+        level = 0
+        for index, limit in enumerate(limits):
+            if value >= limit:
+                level = index + 1
+        return level
+
+    def update(self, queue_depth, connection_use):
+        """Re-grade the load, returns the new level if it changed, otherwise None"""
+        with self.lock:
+            self.queue_depth = queue_depth
+            self.connection_use = connection_use
+            target = max(self.grade(self.latency, self.latency_limits),
+                         self.grade(queue_depth, self.depth_limits),
+                         self.grade(connection_use, self.connection_limits))
+
+            # Step up at once, step down one level per update so the state does not flap
+            current = LEVELS.index(self.level)
+            if target < current:
+                target = current - 1
+            if target == current:
+                return None
+            self.level = LEVELS[target]
+            return self.level
+
+    def should_shed(self, command):
+        """True if the command is refused at the current level"""
+        if command in SHED_COMMANDS[self.level]:
+            with self.lock:
+                self.shed_count += 1
+            return True
+        return False
+
+    def retry_after_ms(self):
+        """How long a shed client should wait, longer at higher levels"""
+        return 1000 * (2 ** LEVELS.index(self.level))
+
+    def status(self):
+        """Summary for the admin panel"""
+        with self.lock:
+            return {
+                'level': self.level,
+                'latency_ms': round(self.latency * 1000, 1),
+                'queue_depth': self.queue_depth,
+                'connection_use': round(self.connection_use * 100),
+                'shed': sorted(SHED_COMMANDS[self.level]),
+                'shed_count': self.shed_count
+            }
@@ -0,0 +1,70 @@
+import threading
+
+
+# Asked for in HELLO by clients that want PRESENCE frames instead of polling LIST
+CAPABILITY = 'presence'
+
+
+class PresenceTracker:
+    """Who is online, which room they are in and how many users each room has
+
+    Every change bumps version and hands the events it caused to publish,
+    called as publish(version, events) while the lock is still held, so
+    frames are queued in version order. A client that sees a version gap
+    asks for LIST again to resync.
+    """
+
+    def __init__(self, publish=None):
+        self.publish = publish
+        self.users = {}        # {nickname: room or None}
+        self.room_counts = {}  # {room: users in it}
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def update(self, nickname, room, online=True):
+        """Record where a user is now, returns the new version or None if nothing changed"""
+        with self.lock:
+            known = nickname in self.users
+            old_room = self.users.get(nickname)
+            if online:
+                if known and old_room == room:
+                    return None
+                self.users[nickname] = room
+                op = 'user_moved' if known else 'user_online'
+                events = [{'op': op, 'nickname': nickname, 'room': room}]
+            else:
+                if not known:
+                    return None
+                del self.users[nickname]
+                room = None
+                events = [{'op': 'user_offline', 'nickname': nickname}]
+
+            if old_room and old_room != room:
+                self.count_leave(old_room, events)
+            if room and room != old_room:
+                self.count_join(room, events)
+
+            self.version += 1
+            if self.publish:
+                self.publish(self.version, events)
+            return self.version
+
+    def count_join(self, room, events):
+        count = self.room_counts.get(room, 0) + 1
+        self.room_counts[room] = count
+        op = 'room_created' if count == 1 else 'room_count'
+        events.append({'op': op, 'room': room, 'count': count})
+
+    def count_leave(self, room, events):
+        count = self.room_counts.get(room, 0) - 1
+        if count > 0:
+            self.room_counts[room] = count
+            events.append({'op': 'room_count', 'room': room, 'count': count})
+        else:
+            self.room_counts.pop(room, None)
+            events.append({'op': 'room_removed', 'room': room})
+
+    def snapshot(self):
+        """(version, users, room_counts) as of one version, for LIST"""
+        with self.lock:
+            return self.version, dict(self.users), dict(self.room_counts)
@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import deque
+
+
+# Version of the frame protocol, sent in HELLO and answered in NICK_REQUEST and NICK_ACCEPTED
+PROTOCOL_VERSION = 1
+
+
+def hello_frame(nickname, capabilities=(), room=None):
+    """The login frame a client sends as soon as it connects
+
+    capabilities names optional features the client wants, such as 'zlib'
+    compression, and room is joined as part of the login when given.
+    """
+    hello = {
+        'command': 'HELLO',
+        'nickname': nickname,
+        'version': PROTOCOL_VERSION,
+        'capabilities': list(capabilities),
+    }
+    if room:
+        hello['room'] = room
+    return hello
+
+
+class RecentCommands:
+    """Commands a client sent in the last window seconds, kept to resend after a reconnect
+
+    They are resent unchanged, msg_id included, so the server ignores the ones
+    it already handled and runs the ones lost with the old connection. The
+    window has to stay shorter than the server's msg_id window.
+    """
+
+    def __init__(self, window=60, max_bytes=16 * 1024 * 1024):
+        self.window = window
+        self.max_bytes = max_bytes  # Older commands are forgotten early past this
+        self.entries = deque()  # (sent_at, message_bytes, compress), oldest first
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def add(self, message_bytes, compress=True):
+        with self.lock:
+            self.entries.append((time.monotonic(), message_bytes, compress))
+            self.bytes += len(message_bytes)
+            self.expire()
+
+    def pending(self):
+        """(message_bytes, compress) of every command still in the window, in send order"""
+        with self.lock:
+            self.expire()
+            return [(message_bytes, compress) for _, message_bytes, compress in self.entries]
+
+    def expire(self):
+        """Forget commands older than the window (caller holds the lock)"""
+        cutoff = time.monotonic() - self.window
+        while self.entries and (self.entries[0][0] < cutoff or self.bytes > self.max_bytes):
+            _, message_bytes, _ = self.entries.popleft()
+            self.bytes -= len(message_bytes)
@@ -0,0 +1,92 @@
+import threading
+import time
+
+
+# {(scope, action): (tokens per second, burst size)}
+DEFAULT_LIMITS = {
+    ('client', 'MSG'): (5.0, 10),
+    ('client', 'JOIN'): (1.0, 3),
+    ('client', 'LIST'): (0.5, 2),
+    ('room', 'MSG'): (50.0, 100),
+    ('room', 'JOIN'): (10.0, 20),
+}
+
+
+class TokenBucket:
+    """Refills at rate tokens per second up to burst"""
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Seconds until one token is available"""
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Token buckets per client and per room, with limits that can change at runtime"""
+
+    def __init__(self, limits=None):
+        self.limits = dict(limits or DEFAULT_LIMITS)
+        self.buckets = {}  # {(scope, action, key): TokenBucket}
+        self.lock = threading.Lock()
+        self.last_prune = time.monotonic()
+        self.throttled_count = 0
+
+    def acquire(self, checks, now=None):
+        """Take one token from every (scope, action, key) bucket, or none at all
+
+        Returns 0 when allowed, otherwise the milliseconds to wait before retrying.
+        """
+        now = now if now is not None else time.monotonic()
+        with self.lock:
+            self.prune(now)
+
+            buckets = []
+            for scope, action, key in checks:
+                limit = self.limits.get((scope, action))
+                if limit is None:
+                    continue
+                bucket = self.buckets.get((scope, action, key))
+                if bucket is None:
+                    bucket = TokenBucket(limit[0], limit[1], now)
+                    self.buckets[(scope, action, key)] = bucket
+                bucket.refill(now)
+                buckets.append(bucket)
+
+            wait = max([bucket.wait_time() for bucket in buckets] or [0.0])
+            if wait > 0:
+                self.throttled_count += 1
+                return max(1, int(wait * 1000))
+
+            for bucket in buckets:
+                bucket.tokens -= 1
+            return 0
+
+    def set_limit(self, scope, action, rate, burst):
+        """Change a limit, existing buckets pick it up immediately"""
+        with self.lock:
+            self.limits[(scope, action)] = (rate, burst)
+            for (bucket_scope, bucket_action, _), bucket in self.buckets.items():
+                if (bucket_scope, bucket_action) == (scope, action):
+                    bucket.rate = rate
+                    bucket.burst = burst
+                    bucket.tokens = min(bucket.tokens, burst)
+
+    def prune(self, now):
+        """Drop buckets that have been idle long enough to be full again (caller holds the lock)"""
+        if now - self.last_prune < 60:
+            return
+        self.last_prune = now
+        for key, bucket in list(self.buckets.items()):
+            if bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.burst:
+                del self.buckets[key]
@@ -0,0 +1,71 @@
+import queue
+import threading
+import time
+
+from structured_log import get_logger
+
+
+class RoomActors:
+    """Single-threaded executors that own room state
+
+    Rooms are sharded across the executors by name. Everything that reads or
+    changes a room's member set runs on its shard's thread, in the order it
+    was posted, so room state needs no locks.
+    """
+
+    def __init__(self, shards=4):
+        self.mailboxes = [queue.Queue() for _ in range(shards)]
+        self.threads = []
+        for index, mailbox in enumerate(self.mailboxes):
+            thread = threading.Thread(target=self.run_loop, args=(mailbox,), name=f"room-shard-{index}")
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def shard_of(self, room_name):
+        return hash(room_name) % len(self.mailboxes)
+
+    def on_owner(self, room_name):
+        """True when called from the thread that owns the room"""
+        return threading.current_thread() is self.threads[self.shard_of(room_name)]
+
+    def post(self, room_name, operation, *args):
+        """Queue an operation on the room's executor, returns an Event set once it ran"""
+        done = threading.Event()
+        self.mailboxes[self.shard_of(room_name)].put((operation, args, done))
+        return done
+
+    def call(self, room_name, operation, *args):
+        """Run an operation on the room's executor, inline if already there"""
+        if self.on_owner(room_name):
+            operation(*args)
+            return None
+        return self.post(room_name, operation, *args)
+
+    def flush(self, timeout=5):
+        """Wait up to timeout seconds in total until every operation posted so far has run"""
+        deadline = time.monotonic() + timeout
+        markers = []
+        for mailbox in self.mailboxes:
+            done = threading.Event()
+            mailbox.put((lambda: None, (), done))
+            markers.append(done)
+        return all(done.wait(max(deadline - time.monotonic(), 0)) for done in markers)
+
+    def run_loop(self, mailbox):
+        """Run posted room operations one at a time"""
+        while True:
+            item = mailbox.get()
+            if item is None:
+                break
+            operation, args, done = item
+            try:
+                operation(*args)
+            except Exception as e:
+                get_logger().error("room operation failed", operation=operation.__name__, error=e)
+            done.set()
+
+    def stop(self):
+        """Let every executor finish its mailbox and exit"""
+        for mailbox in self.mailboxes:
+            mailbox.put(None)
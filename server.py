@@ -5,16 +5,61 @@ from datetime import datetime
 import base64
 import os
 import mimetypes
+import time
+import random
+import sys
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from offline_mailbox import MailboxStore
+from delivery import DeliveryStream, IdempotencyCache
+from snapshot import write_snapshot, read_snapshot
+from handoff import HandoffListener, request_listener
+from backplane import InProcessBackplane, HubBackplane
+from fanout import FanoutPool
+from room_actors import RoomActors
+from overload import OverloadMonitor
+from rate_limit import RateLimiter
+from heartbeat import TimerWheel, enable_keepalive
+from writer import WriteCoalescer, WriteFlusher, enable_nodelay
+from compression import (ALGORITHM as COMPRESSION_ALGORITHM, FrameCompressor, FrameDecompressor,
+                         carries_precompressed_file)
+from protocol import PROTOCOL_VERSION
+from presence import CAPABILITY as PRESENCE_CAPABILITY, PresenceTracker
+from session import ClientSession
+from structured_log import get_logger, LEVEL_NAMES, INFO
+from clock import shared_clock
+from commands import CommandRegistry
 
 class ChatServer:
-    def __init__(self, host='localhost', port=55555):
+    def __init__(self, host='localhost', port=55555, backplane=None):
         self.host = host
         self.port = port
-        self.clients = {}  # {client_socket: {'nickname': str, 'room': str}}
-        self.rooms = {}    # {room_name: set of client_sockets}
+        self.log = get_logger()
+        self.clock = shared_clock  # Cached HH:MM:SS timestamps and a ms Unix epoch
+        self.sessions = {}  # {client_id: ClientSession} for logged in clients
+        self.connections = {}  # {client_id: ClientSession} for every admitted connection
+        self.rooms = {}     # {room_name: set of client_ids}
+        self.sessions_by_nickname = {}  # {nickname: ClientSession}
+        self.client_ids = itertools.count(1)
         self.nicknames = set()  # Set of active nicknames
+        self.known_nicknames = set()  # Nicknames that have logged in at least once
         self.server_socket = None
         
+        # Offline mailboxes for private messages and files
+        self.offline_mailboxes = MailboxStore(spill_dir="server_mailboxes")
+        # Queued mail goes out one bounded frame at a time, each file in a frame of
+        # its own, and leaves the mailbox only once the client ACKs it
+        self.offline_batch_bytes = 256 * 1024
+        self.offline_in_flight = {}  # {nickname: (stream_id, seq, queued_at of its last entry)}
+        
+        # At-least-once delivery: sequenced frames kept until the client ACKs them
+        self.delivery_streams = {}  # {nickname: DeliveryStream}
+        self.reliable_types = {'PUBLIC_MSG', 'PRIVATE_MSG', 'FILE_RECEIVED', 'OFFLINE_MESSAGES'}
+        self.resume_window = 300  # Seconds a disconnected nickname can resume its stream
+        
+        # Client supplied msg_id values seen recently, so retried commands are no-ops
+        self.recent_commands = IdempotencyCache(window_seconds=600, max_entries=100000)
+        
         # File sharing settings
         self.max_file_size = 5 * 1024 * 1024  # 5MB max file size
         self.allowed_file_types = {
@@ -36,215 +81,999 @@ class ChatServer:
         self.uploads_dir = "server_uploads"
         if not os.path.exists(self.uploads_dir):
             os.makedirs(self.uploads_dir)
+        self.upload_index = {}  # {file_id: {'sender', 'filename', 'size', 'saved_at'}}
+        
+        # State snapshots for fast restart
+        self.snapshot_path = "server_snapshot.pkl"
+        self.snapshot_interval = 60  # Seconds between periodic snapshots, 0 disables them
+        self.pending_rooms = {}  # {nickname: room} restored from a snapshot, rejoined on login
+        self.running = False
+        
+        # Logins and commands in progress, a snapshot waits until they are done
+        self.dispatch_lock = threading.Condition()
+        self.dispatching = 0
+        self.accepting_commands = True
+        
+        # Zero-downtime restarts: hand the listening socket to a successor
+        self.handing_off = False
+        self.accept_stopped = threading.Event()
+        self.wakeup_address = None
+        self.reconnect_window_ms = 3000  # Clients spread their reconnects over this window
+        self.drain_timeout = 2  # Seconds a drain waits for clients to take their last frames
+        
+        self.reuse_port = False  # SO_REUSEPORT so several workers can share the port
+        self.remote_users = {}  # {nickname: room} for users connected to other nodes
+        
+        # Rooms with at least fanout_pool.threshold local members are delivered in parallel
+        self.fanout_pool = FanoutPool(workers=4, threshold=200)
+        self.fanout_jobs = {}  # {room_name: last FanoutJob}
+        
+        # Each room is owned by one executor, room membership changes and
+        # deliveries are posted to it instead of running on client threads
+        self.room_actors = RoomActors(shards=4)
+        
+        # Admission control: connections beyond max_connections are told to retry later
+        self.accept_backlog = 128
+        self.max_connections = 500
+        self.busy_retry_ms = 2000  # Rejected clients retry within this window
+        self.active_connections = 0
+        self.rejected_connections = 0
+        self.connection_lock = threading.Lock()
+        self.handler_pool = None  # Bounded pool of client handler threads, created on start
+        
+        # Command name -> handler, wrapped in auth, dedup, shedding, rate limit, logging
+        # and timing middleware; each command keeps its own latency histogram
+        self.commands = CommandRegistry()
+        self.register_commands()
+        self.max_batch_size = 100  # Commands allowed in one BATCH frame
+        # (session, replies) while a batched command runs, per thread so frames
+        # other threads send to the same client are not mistaken for its replies
+        self.reply_sink = threading.local()
+        
+        # Graded overload states, expensive commands are refused first
+        self.overload = OverloadMonitor()
+        self.overload_interval = 0.5  # Seconds between load checks
+        
+        # Token buckets per nickname and per room for MSG, JOIN and LIST
+        self.rate_limiter = RateLimiter()
+        
+        # Idle clients are sent a PING and reaped if they do not answer, all
+        # deadlines live in one timer wheel instead of a timer per socket
+        self.login_timeout = 60        # Seconds a new connection has to pick a nickname
+        self.heartbeat_interval = 15   # Idle seconds before a client is pinged
+        self.heartbeat_timeout = 10    # Seconds a pinged client has to answer
+        self.idle_wheel = TimerWheel(tick=1.0, now=time.monotonic())
+        self.pinged = set()  # Sockets that have not answered their PING yet
+        self.reaped_connections = 0
+        
+        # Frames to a client are queued and written together, one sendmsg per
+        # coalesce window or per coalesce_bytes instead of one send per frame
+        self.write_flusher = WriteFlusher(window=0.002)
+        self.coalesce_bytes = 32 * 1024
+        
+        # zlib compression, offered in NICK_REQUEST and used by clients that ask for it
+        self.compression_enabled = True
+        
+        # Local and remote users and room sizes, versioned. Clients that ask for the
+        # presence capability are pushed the changes instead of polling LIST
+        self.presence = PresenceTracker(publish=self.publish_presence_events)
+        self.presence_subscribers = set()  # Sessions sent PRESENCE frames
         
-    def start_server(self):
-        """Initialize and start the server"""
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.server_socket.bind((self.host, self.port))
-        self.server_socket.listen(5)
+        # All room and private traffic goes through the backplane, which also reaches
+        # users on other workers or nodes when it is connected to a broker.
+        # backplane(server) builds it, connected last since it can call back at once
+        self.backplane = (backplane or InProcessBackplane)(self)
+        self.backplane.connect()
         
-        print(f"Server started on {self.host}:{self.port}")
-        print("Waiting for connections...")
+    def start_server(self, listener=None):
+        """Initialize and start the server, optionally on an inherited listening socket"""
+        if listener:
+            self.server_socket = listener
+        else:
+            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            if self.reuse_port:
+                self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+            self.server_socket.bind((self.host, self.port))
+            self.server_socket.listen(self.accept_backlog)
+        self.accept_stopped.clear()
+        self.handler_pool = ThreadPoolExecutor(max_workers=self.max_connections,
+                                               thread_name_prefix="client")
+        
+        self.restore_snapshot()
+        self.running = True
+        if self.snapshot_interval:
+            snapshot_thread = threading.Thread(target=self.snapshot_loop)
+            snapshot_thread.daemon = True
+            snapshot_thread.start()
+        overload_thread = threading.Thread(target=self.overload_loop)
+        overload_thread.daemon = True
+        overload_thread.start()
+        heartbeat_thread = threading.Thread(target=self.heartbeat_loop)
+        heartbeat_thread.daemon = True
+        heartbeat_thread.start()
+        self.write_flusher.start()
+        
+        self.log.info("server started", host=self.host, port=self.port)
         
         try:
             while True:
                 client_socket, address = self.server_socket.accept()
-                print(f"Connected with {str(address)}")
                 
-                # Start a new thread for each client
-                client_thread = threading.Thread(
-                    target=self.handle_client, 
-                    args=(client_socket, address)
-                )
-                client_thread.daemon = True
-                client_thread.start()
+                if self.handing_off:
+                    # Stop accepting, the successor picks up the rest of the queue
+                    try:
+                        if client_socket.getpeername() != self.wakeup_address:
+                            self.send_frame(client_socket, self.reconnect_hint())
+                    except OSError:
+                        pass
+                    client_socket.close()
+                    break
+                
+                if not self.admit_connection():
+                    self.reject_busy(client_socket)
+                    continue
+                
+                self.log.debug("connection accepted", address=address)
+                
+                # Each admitted client gets a session and a thread from the bounded pool
+                session = ClientSession(next(self.client_ids), client_socket, address)
+                session.writer = WriteCoalescer(
+                    client_socket, self.write_flusher, self.coalesce_bytes,
+                    on_error=lambda error, session=session: self.write_failed(session, error))
+                self.connections[session.client_id] = session
+                self.handler_pool.submit(self.run_client, session)
                 
         except KeyboardInterrupt:
-            print("\nShutting down server...")
             self.shutdown_server()
         except Exception as e:
-            print(f"Server error: {e}")
-            self.shutdown_server()
+            if self.running:
+                self.log.error("accept loop failed", error=e)
+                self.shutdown_server()
+        finally:
+            self.accept_stopped.set()
+    
+    def admit_connection(self):
+        """Take a connection slot, False if the server is full"""
+        with self.connection_lock:
+            if self.active_connections >= self.max_connections:
+                self.rejected_connections += 1
+                return False
+            self.active_connections += 1
+            return True
+    
+    def run_client(self, session):
+        """Serve one admitted client and give its slot back afterwards"""
+        try:
+            try:
+                enable_keepalive(session.sock)
+                enable_nodelay(session.sock)
+            except OSError as e:
+                self.log.warning("socket options unavailable", address=session.address, error=e)
+            self.idle_wheel.schedule(session, time.monotonic() + self.login_timeout)
+            self.handle_client(session)
+        finally:
+            self.connections.pop(session.client_id, None)
+            with self.connection_lock:
+                self.active_connections -= 1
+    
+    def reject_busy(self, client_socket):
+        """Tell a client the server is full and when to try again, then close it"""
+        retry_after_ms = random.randint(self.busy_retry_ms // 2, self.busy_retry_ms)
+        try:
+            # Never let a slow client hold up the accept loop
+            client_socket.settimeout(1)
+            self.send_frame(client_socket, json.dumps({
+                'type': 'SERVER_BUSY',
+                'content': f"Server busy, retry after {retry_after_ms} ms",
+                'retry_after_ms': retry_after_ms,
+                'timestamp': self.clock.timestamp()
+            }).encode('utf-8'))
+        except OSError:
+            pass
+        finally:
+            client_socket.close()
+    
+    def release_listener(self):
+        """Stop serving and return the listening socket for a successor server"""
+        if not self.running or not self.server_socket:
+            return None
+        
+        # Wake the accept loop with a connection of our own so it sees the flag
+        self.handing_off = True
+        host, port = self.server_socket.getsockname()[:2]
+        if host in ('0.0.0.0', '::', ''):
+            host = '127.0.0.1'
+        try:
+            wakeup = socket.create_connection((host, port), timeout=2)
+            self.wakeup_address = wakeup.getsockname()
+            self.accept_stopped.wait(5)
+            wakeup.close()
+        except OSError as e:
+            self.log.error("could not wake accept loop", error=e)
+        
+        # Snapshot once nothing can change it, so the successor resumes every
+        # session from the last seq and msg_id that was actually handled
+        self.running = False
+        self.stop_dispatch()
+        self.save_snapshot()
+        self.drain_clients()
+        self.stop_workers()
+        
+        listener = self.server_socket
+        self.server_socket = None
+        self.log.info("listening socket released to successor")
+        return listener
+    
+    def reconnect_hint(self, content="Server is restarting, reconnecting..."):
+        """Encoded RECONNECT frame with a random delay to avoid a connection storm"""
+        return json.dumps({
+            'type': 'RECONNECT',
+            'content': content,
+            'retry_after_ms': random.randint(100, self.reconnect_window_ms),
+            'timestamp': self.clock.timestamp()
+        }).encode('utf-8')
+    
+    def drain_clients(self, content="Server is restarting, reconnecting..."):
+        """Ask every client to reconnect and close them without room notifications
+        
+        Takes at most drain_timeout seconds however many clients are connected.
+        """
+        deadline = time.monotonic() + self.drain_timeout
+        # Connections still logging in are told to come back as well
+        sessions = list(self.connections.values())
+        clients = [session.sock for session in sessions]
+        
+        # Forget everyone first so exiting handler threads have nothing to announce
+        now = time.time()
+        for stream in self.delivery_streams.values():
+            stream.detached_at = now
+        self.sessions.clear()
+        self.sessions_by_nickname.clear()
+        self.rooms.clear()
+        self.nicknames.clear()
+        
+        # One hint each, behind any frames still queued
+        hint_flags = getattr(socket, 'MSG_DONTWAIT', 0)
+        flushing = []
+        for session in sessions:
+            message_bytes = self.reconnect_hint(content)
+            try:
+                if session.writer:
+                    self.queue_frame(session, message_bytes, schedule=False)
+                    flushing.append(session)
+                else:
+                    length_bytes = len(message_bytes).to_bytes(4, byteorder='big')
+                    session.sock.send(length_bytes + message_bytes, hint_flags)
+                    session.sock.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+        
+        # Keep writing without blocking until every queue is empty or the deadline
+        # passes, so a client whose socket buffer is full does not hold up the rest
+        while flushing:
+            waiting = []
+            for session in flushing:
+                try:
+                    if not session.writer.flush(blocking=False, wait=False):
+                        waiting.append(session)
+                        continue
+                    # Send FIN after the hint so it is not lost to a reset on close
+                    session.sock.shutdown(socket.SHUT_WR)
+                except OSError:
+                    pass
+            flushing = waiting
+            if not flushing or time.monotonic() >= deadline:
+                break
+            time.sleep(0.01)
+        for session in flushing:
+            try:
+                session.sock.shutdown(socket.SHUT_WR)
+            except OSError:
+                pass
+        
+        # Clients close their end once they have read the hint, which ends their
+        # handler threads, stragglers are closed when the deadline passes
+        while time.monotonic() < deadline:
+            if all(client_socket.fileno() == -1 for client_socket in clients):
+                break
+            time.sleep(0.05)
+        
+        for client_socket in clients:
+            try:
+                # Shutting down also wakes a handler thread still blocked in recv
+                client_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            try:
+                client_socket.close()
+            except OSError:
+                pass
     
-    def handle_client(self, client_socket, address):
+    def handle_client(self, session):
         """Handle individual client connections"""
+        logging_in = False
         try:
-            # Request nickname
-            self.send_message(client_socket, "NICK_REQUEST", "Please enter your nickname:")
+            # Greet the client with what this server supports. Clients that send HELLO
+            # straight after connecting do not wait for this, older ones answer it
+            # with their bare nickname
+            capabilities = [COMPRESSION_ALGORITHM] if self.compression_enabled else []
+            capabilities.append(PRESENCE_CAPABILITY)
+            self.send_json(session, {
+                'type': 'NICK_REQUEST',
+                'content': "Please enter your nickname:",
+                'version': PROTOCOL_VERSION,
+                'capabilities': capabilities,
+                'timestamp': self.clock.timestamp()
+            })
             
-            # Wait for nickname response
-            nickname_response = self.receive_message(client_socket)
+            hello = self.receive_login(session)
+            logging_in = self.begin_command()
+            if not logging_in:
+                # Drained while logging in, the client already has its RECONNECT hint
+                return
+            if hello is None:
+                self.send_message(session, "NICK_ERROR", "Invalid nickname format!")
+                self.close_connection(session)
+                return
+            nickname = hello['nickname'].strip()
             
-            # Extract nickname from response
-            if isinstance(nickname_response, str):
-                nickname = nickname_response.strip()
-            else:
-                # If it's a dict, it might be a command - reject
-                self.send_message(client_socket, "NICK_ERROR", "Invalid nickname format!")
-                client_socket.close()
+            version = hello.get('version', PROTOCOL_VERSION)
+            if not isinstance(version, int) or version < 1:
+                self.send_message(session, "NICK_ERROR", "Unsupported protocol version!")
+                self.close_connection(session)
                 return
             
+            requested = hello.get('capabilities')
+            if not isinstance(requested, list):
+                requested = []
+            if COMPRESSION_ALGORITHM in requested and COMPRESSION_ALGORITHM in capabilities:
+                # Every frame after HELLO is compressed in both directions
+                session.compressor = FrameCompressor()
+                session.decompressor = FrameDecompressor()
+            agreed = [name for name in capabilities if name in requested]
+            
             # Validate nickname
-            if not nickname or nickname in self.nicknames or ' ' in nickname:
-                self.send_message(client_socket, "NICK_ERROR", "Nickname already taken or invalid!")
-                client_socket.close()
+            if (not nickname or nickname in self.nicknames or nickname in self.remote_users
+                    or ' ' in nickname):
+                self.send_message(session, "NICK_ERROR", "Nickname already taken or invalid!")
+                self.close_connection(session)
+                return
+            
+            # Other nodes may have just taken it, the backplane has the final say
+            if not self.backplane.claim_nickname(nickname):
+                self.send_message(session, "NICK_ERROR", "Nickname already taken or invalid!")
+                self.close_connection(session)
                 return
             
             # Add client to server data structures
-            self.clients[client_socket] = {'nickname': nickname, 'room': None}
+            session.nickname = nickname
+            self.sessions[session.client_id] = session
+            self.sessions_by_nickname[nickname] = session
             self.nicknames.add(nickname)
+            self.known_nicknames.add(nickname)
+            
+            self.log.info("client connected", nickname=nickname, client_id=session.client_id,
+                          address=session.address)
+            self.backplane.publish_presence(nickname, None)
+            if PRESENCE_CAPABILITY in agreed:
+                self.presence_subscribers.add(session)
+            self.presence.update(nickname, None)
+            stream = self.attach_delivery_stream(nickname)
+            self.send_json(session, {
+                'type': 'NICK_ACCEPTED',
+                'content': f"Welcome {nickname}!",
+                'stream_id': stream.stream_id,
+                'version': PROTOCOL_VERSION,
+                'capabilities': agreed,
+                'timestamp': self.clock.timestamp()
+            })
+            
+            # Resend frames the client never acknowledged before it went away
+            self.retransmit_unacked(session, stream)
+            
+            # Join the room named in HELLO, otherwise put the user back in the room
+            # they were in before a restart
+            restored_room = self.pending_rooms.pop(nickname, None)
+            initial_room = hello.get('room')
+            if not isinstance(initial_room, str) or not initial_room:
+                initial_room = restored_room
+            if initial_room:
+                self.handle_join_room(session, initial_room)
             
-            print(f"Client {nickname} connected from {address}")
-            self.send_message(client_socket, "NICK_ACCEPTED", f"Welcome {nickname}!")
+            # Hand over anything that arrived while this nickname was offline
+            self.deliver_offline_mail(session, nickname)
+            logging_in = False
+            self.end_command()
             
             # Listen for messages from this client
             while True:
                 try:
-                    message = self.receive_message(client_socket)
+                    message = self.receive_message(session)
                     if message:
-                        self.process_command(client_socket, message)
+                        self.process_command(session, message)
                     else:
                         break
                 except ConnectionResetError:
                     break
                 except Exception as e:
-                    print(f"Error handling client {nickname}: {e}")
+                    self.log.error("client handler failed", nickname=nickname, error=e)
                     break
                     
         except Exception as e:
-            print(f"Error in handle_client: {e}")
+            self.log.error("client handler failed", client_id=session.client_id, error=e)
         finally:
-            self.disconnect_client(client_socket)
+            if logging_in:
+                self.end_command()
+            self.disconnect_client(session)
     
-    def send_message(self, client_socket, msg_type, content):
+    def send_message(self, session, msg_type, content, block=True):
         """Send a message to a client"""
+        message = {
+            'type': msg_type,
+            'content': content,
+            'timestamp': self.clock.timestamp()
+        }
+        self.send_json(session, message, block)
+    
+    def send_json(self, session, message, block=True):
+        """Send an already built message dict to a client, returns its seq if it was sequenced"""
+        message_bytes = json.dumps(message).encode('utf-8')
+        return self.send_encoded(session, message.get('type'), message_bytes, block)
+    
+    def send_encoded(self, session, msg_type, message_bytes, block=True):
+        """Send an encoded JSON message, sequencing it if it needs an ACK
+
+        Returns the sequence number of a sequenced frame, otherwise None. With
+        block=False the calling thread only writes what the socket takes without
+        blocking and leaves the rest to the flusher. Room executors and fan-out
+        workers send this way so one slow reader cannot hold up a shard. Where
+        MSG_DONTWAIT is missing (Windows) such writes can still block.
+        """
+        # While a BATCH runs, replies to its current command are collected for the
+        # combined response; sequenced frames still go out on their own so they
+        # can be acknowledged
+        sink = getattr(self.reply_sink, 'value', None)
+        if sink and sink[0] is session and msg_type not in self.reliable_types:
+            sink[1].append(message_bytes)
+            return
+        
         try:
-            message = {
-                'type': msg_type,
-                'content': content,
-                'timestamp': datetime.now().strftime("%H:%M:%S")
-            }
-            message_json = json.dumps(message)
-            message_bytes = message_json.encode('utf-8')
+            stream = None
+            seq = None
+            if msg_type in self.reliable_types and session.client_id in self.sessions:
+                stream = self.delivery_streams.get(session.nickname)
             
-            # Send length first, then message
-            length_bytes = len(message_bytes).to_bytes(4, byteorder='big')
-            client_socket.send(length_bytes + message_bytes)
+            if stream:
+                # Sequence and queue under one lock so frames go out in seq order
+                with stream.lock:
+                    seq = stream.next_seq
+                    message_bytes = stream.track(message_bytes)
+                    flush_due = self.queue_frame(session, message_bytes, block=block)
+            else:
+                flush_due = self.queue_frame(session, message_bytes, block=block)
+            # Any blocking write happens with no session lock held, so a room
+            # executor sending to this client never waits behind a full socket
+            if flush_due:
+                session.writer.flush()
+            session.frames_sent += 1
+            return seq
+        except BufferError:
+            # Too far behind to keep up with. Shutting the socket also wakes its
+            # handler thread, which then cleans up as for any lost connection
+            self.log.warning("dropping slow client", client_id=session.client_id,
+                             nickname=session.nickname)
+            try:
+                session.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
         except ConnectionResetError:
-            print(f"Client disconnected while sending message")
-            self.disconnect_client(client_socket)
+            self.log.debug("client disconnected while sending", client_id=session.client_id)
+            self.disconnect_client(session)
+        except Exception as e:
+            self.log.warning("send failed", client_id=session.client_id, error=e)
+            self.disconnect_client(session)
+    
+    def send_frame(self, client_socket, message_bytes):
+        """Write one length-prefixed frame to a socket"""
+        # Send length first, then message
+        length_bytes = len(message_bytes).to_bytes(4, byteorder='big')
+        client_socket.sendall(length_bytes + message_bytes)
+    
+    def queue_frame(self, session, message_bytes, schedule=True, block=True):
+        """Hand one frame to the session's write coalescer, compressing it if the client asked
+
+        With schedule=False the frame is only queued and the caller flushes it.
+        Returns True when the caller has to flush session.writer itself, which
+        it does after letting go of any lock it holds.
+        """
+        compressor = session.compressor
+        if compressor is None:
+            return self.write_frame(session, message_bytes, schedule, block)
+        
+        # Frames have to enter the deflate stream in the order they are written
+        with compressor.lock:
+            payload = compressor.encode(message_bytes, not carries_precompressed_file(message_bytes))
+            return self.write_frame(session, payload, schedule, block)
+    
+    def write_frame(self, session, payload, schedule=True, block=True):
+        """Queue a length-prefixed frame, or send it at once if the session has no coalescer
+
+        Returns True when a blocking flush is due, see queue_frame.
+        """
+        if session.writer is None:
+            self.send_frame(session.sock, payload)
+            return False
+        # Length and body stay separate buffers, sendmsg gathers them without a copy
+        length_bytes = len(payload).to_bytes(4, byteorder='big')
+        if schedule:
+            return session.writer.queue(length_bytes, payload, block=block)
+        session.writer.append(length_bytes, payload)
+        return False
+    
+    def write_failed(self, session, error):
+        """A background flush could not write to a client"""
+        self.log.debug("write failed", client_id=session.client_id, error=error)
+        self.disconnect_client(session)
+    
+    def close_connection(self, session):
+        """Push out whatever the client can still take, then close its socket"""
+        try:
+            if session.writer:
+                session.writer.flush(blocking=False)
+        except OSError:
+            pass
+        try:
+            session.sock.close()
+        except OSError:
+            pass
+    
+    def attach_delivery_stream(self, nickname):
+        """Get the delivery stream for a nickname, starting a new one if needed"""
+        # Forget streams of nicknames that stayed away too long
+        for name, stream in list(self.delivery_streams.items()):
+            if stream.is_expired(self.resume_window):
+                del self.delivery_streams[name]
+        
+        stream = self.delivery_streams.get(nickname)
+        if stream is None:
+            stream = DeliveryStream(nickname)
+            self.delivery_streams[nickname] = stream
+        stream.detached_at = None
+        return stream
+    
+    def retransmit_unacked(self, session, stream):
+        """Resend every frame after the client's ACK cursor"""
+        try:
+            flush_due = False
+            with stream.lock:
+                frames = stream.pending()
+                for message_bytes in frames:
+                    flush_due = self.queue_frame(session, message_bytes) or flush_due
+            if flush_due:
+                session.writer.flush()
         except Exception as e:
-            print(f"Error sending message: {e}")
-            self.disconnect_client(client_socket)
+            self.log.warning("retransmit failed", nickname=stream.nickname, error=e)
+            return
+        if frames:
+            self.log.info("retransmitted unacknowledged frames", nickname=stream.nickname,
+                          frames=len(frames))
     
-    def receive_message(self, client_socket):
-        """Receive a message from a client"""
+    def handle_ack(self, session, content):
+        """Handle ACK command - advance the client's delivery cursor"""
         try:
-            # First, receive the length of the message
-            length_data = client_socket.recv(4)
-            if not length_data:
-                return None
-            
-            message_length = int.from_bytes(length_data, byteorder='big')
-            
-            # Now receive the actual message
-            message_data = b''
-            while len(message_data) < message_length:
-                chunk = client_socket.recv(min(4096, message_length - len(message_data)))
-                if not chunk:
-                    return None
-                message_data += chunk
+            seq = int(content)
+        except (TypeError, ValueError):
+            self.send_message(session, "ERROR", "Invalid ACK!")
+            return
+        
+        stream = self.delivery_streams.get(session.nickname)
+        if stream:
+            with stream.lock:
+                stream.ack(seq)
             
-            message = message_data.decode('utf-8')
-            if message:
-                # Try to parse as JSON first
-                try:
-                    return json.loads(message)
-                except json.JSONDecodeError:
-                    # If not JSON, treat as plain text (for nickname)
-                    return message
+            # Queued mail the client has now confirmed can leave the mailbox
+            in_flight = self.offline_in_flight.get(session.nickname)
+            if in_flight and in_flight[0] == stream.stream_id and stream.acked >= in_flight[1]:
+                del self.offline_in_flight[session.nickname]
+                self.offline_mailboxes.remove_through(session.nickname, in_flight[2])
+                self.deliver_offline_mail(session, session.nickname)
+    
+    def receive_message(self, session):
+        """Receive a JSON message from a client, None once the connection is gone or broken"""
+        try:
+            message_data = self.receive_frame(session)
+            if not message_data:
+                return None
+            return json.loads(message_data.decode('utf-8'))
+        except Exception as e:
+            self.log.debug("receive failed", client_id=session.client_id, error=e)
             return None
+    
+    def receive_login(self, session):
+        """Read the login frame as a HELLO dict, None if it is not a usable login
+        
+        Clients from before HELLO send their bare nickname, it is wrapped in a
+        HELLO with no capabilities.
+        """
+        try:
+            message_data = self.receive_frame(session)
+            if not message_data:
+                return None
+            text = message_data.decode('utf-8')
         except Exception as e:
-            print(f"Error receiving message: {e}")
+            self.log.debug("receive failed", client_id=session.client_id, error=e)
+            return None
+        
+        try:
+            message = json.loads(text)
+        except json.JSONDecodeError:
+            message = text
+        if isinstance(message, str):
+            return {'command': 'HELLO', 'nickname': message}
+        if isinstance(message, dict) and message.get('command') == 'HELLO' and \
+                isinstance(message.get('nickname'), str):
+            return message
+        return None
+    
+    def receive_frame(self, session):
+        """Read one length-prefixed frame and undo its compression, None when the client closed"""
+        # First, receive the length of the message
+        length_data = session.sock.recv(4)
+        if not length_data:
             return None
+        
+        message_length = int.from_bytes(length_data, byteorder='big')
+        
+        # Now receive the actual message. A large upload on a slow link can take
+        # longer than the heartbeat timeout, so every chunk from a logged in client
+        # counts as a sign of life, not just whole frames
+        logged_in = session.client_id in self.sessions
+        message_data = b''
+        while len(message_data) < message_length:
+            chunk = session.sock.recv(min(4096, message_length - len(message_data)))
+            if not chunk:
+                return None
+            message_data += chunk
+            if logged_in:
+                self.touch_connection(session)
+        
+        # Any frame shows the client is alive
+        self.touch_connection(session)
+        
+        if session.decompressor:
+            message_data = session.decompressor.decode(message_data)
+        return message_data
     
-    def process_command(self, client_socket, message):
+    def process_command(self, session, message):
         """Process commands from clients"""
         try:
-            # Handle plain text messages (nicknames) - ignore them in this context
-            if isinstance(message, str):
-                # This might be a stray nickname or plain text - log it
-                print(f"Received plain text message: {message}")
-                return
-            
             # Handle dictionary messages (commands)
             if not isinstance(message, dict):
-                print(f"Received non-dict message: {type(message)}")
+                self.log.debug("ignored frame", client_id=session.client_id, kind=type(message).__name__)
                 return
             
-            command = message.get('command', '').upper()
-            content = message.get('content', '')
-            
-            # Check if client is still connected
-            if client_socket not in self.clients:
-                print(f"Received command from unknown client")
+            # Once a drain has started the command is left for the client to resend
+            if not self.begin_command():
                 return
-                
-            nickname = self.clients[client_socket]['nickname']
-            
-            print(f"Processing command '{command}' from {nickname}")
-            
-            if command == 'JOIN':
-                self.handle_join_room(client_socket, content)
-            elif command == 'MSG':
-                self.handle_message(client_socket, content)
-            elif command == 'LEAVE':
-                self.handle_leave_room(client_socket)
-            elif command == 'LIST':
-                self.handle_list_command(client_socket)
-            elif command == 'FILE':
-                self.handle_file_transfer(client_socket, message)
-            else:
-                self.send_message(client_socket, "ERROR", "Unknown command!")
+            try:
+                if not self.commands.dispatch(session, message):
+                    self.send_message(session, "ERROR", "Unknown command!")
+            finally:
+                self.end_command()
                 
         except Exception as e:
-            print(f"Error processing command: {e}")
-            print(f"Message type: {type(message)}")
-            print(f"Message content: {message}")
+            self.log.error("command failed", client_id=session.client_id, error=e,
+                           message=str(message)[:200])
     
-    def handle_join_room(self, client_socket, room_name):
+    def begin_command(self):
+        """Count a login or command as running, False once dispatch has stopped"""
+        with self.dispatch_lock:
+            if not self.accepting_commands:
+                return False
+            self.dispatching += 1
+            return True
+    
+    def end_command(self):
+        with self.dispatch_lock:
+            self.dispatching -= 1
+            if not self.dispatching:
+                self.dispatch_lock.notify_all()
+    
+    def stop_dispatch(self):
+        """Run no more logins or commands and let the server's own work settle
+        
+        Waits for the ones already running, for remote traffic to stop and for
+        room and fan-out deliveries to go out, so nothing is sequenced or
+        handled after the snapshot that follows.
+        """
+        deadline = time.monotonic() + self.drain_timeout
+        with self.dispatch_lock:
+            self.accepting_commands = False
+            self.dispatch_lock.wait_for(lambda: not self.dispatching, self.drain_timeout)
+        self.backplane.stop()
+        self.room_actors.flush(timeout=max(deadline - time.monotonic(), 0))
+        for job in list(self.fanout_jobs.values()):
+            job.wait(max(deadline - time.monotonic(), 0))
+    
+    def register_commands(self):
+        """Fill the command table and the middleware every command runs through"""
+        commands = self.commands
+        commands.register('JOIN', lambda session, message:
+                          self.handle_join_room(session, message.get('content', '')))
+        commands.register('MSG', lambda session, message:
+                          self.handle_message(session, message.get('content', '')))
+        commands.register('LEAVE', lambda session, message: self.handle_leave_room(session))
+        commands.register('LIST', lambda session, message: self.handle_list_command(session))
+        commands.register('FILE', lambda session, message: self.handle_file_transfer(session, message))
+        # Acknowledgements carry no msg_id of their own, so deduplication would drop them
+        commands.register('ACK', lambda session, message:
+                          self.handle_ack(session, message.get('content', '')),
+                          skip=(self.drop_duplicate,))
+        
+        # Heartbeats already refreshed the idle deadline when they arrived, they are never
+        # deduplicated, shed, throttled or timed
+        heartbeat_skip = (self.drop_duplicate, self.shed_load, self.apply_rate_limit,
+                          self.log_command, self.time_command)
+        commands.register('PONG', lambda session, message: None, skip=heartbeat_skip)
+        # Every command inside a batch is timed on its own
+        commands.register('BATCH', self.handle_batch, skip=(self.time_command,))
+        commands.register('PING', lambda session, message: self.send_message(session, "PONG", ""),
+                          skip=heartbeat_skip)
+        
+        for middleware in (self.require_session, self.drop_duplicate, self.shed_load,
+                           self.apply_rate_limit, self.log_command, self.time_command):
+            commands.use(middleware)
+    
+    def handle_batch(self, session, message):
+        """Run a list of commands in order and answer them with one BATCH_RESULT frame"""
+        entries = message.get('content')
+        if not isinstance(entries, list) or not entries:
+            self.send_message(session, "ERROR", "BATCH needs a list of commands!")
+            return
+        if len(entries) > self.max_batch_size:
+            self.send_message(session, "ERROR",
+                              f"BATCH is limited to {self.max_batch_size} commands!")
+            return
+        
+        # Each command goes through its own middleware, so rate limits and
+        # deduplication apply per command just as if it had been sent alone
+        results = []
+        try:
+            for entry in entries:
+                replies = []
+                self.reply_sink.value = (session, replies)
+                command = None
+                if isinstance(entry, dict):
+                    command = self.commands.lookup(entry.get('command', ''))
+                if command is None:
+                    self.send_message(session, "ERROR", "Unknown command!")
+                elif command.name == 'BATCH':
+                    self.send_message(session, "ERROR", "BATCH cannot be nested!")
+                else:
+                    command.call(session, entry)
+                results.append(replies)
+        finally:
+            self.reply_sink.value = None
+        
+        # The replies are already encoded, splice them in instead of decoding them again
+        header = json.dumps({
+            'type': 'BATCH_RESULT',
+            'content': f"{len(results)} commands processed",
+            'timestamp': self.clock.timestamp()
+        }).encode('utf-8')
+        body = b','.join(b'[' + b','.join(replies) + b']' for replies in results)
+        self.send_encoded(session, 'BATCH_RESULT', header[:-1] + b', "results": [' + body + b']}')
+    
+    def require_session(self, command, call_next, session, message):
+        """Only clients that are still connected get their commands run"""
+        if session.client_id not in self.sessions:
+            self.log.debug("command from unknown client", client_id=session.client_id)
+            return
+        session.commands_received += 1
+        call_next(session, message)
+    
+    def drop_duplicate(self, command, call_next, session, message):
+        """A retried command with a msg_id we already handled does nothing"""
+        msg_id = message.get('msg_id')
+        if msg_id and self.recent_commands.check_and_add(session.nickname, msg_id):
+            self.log.debug("duplicate command ignored", nickname=session.nickname,
+                           command=command.name, msg_id=msg_id)
+            return
+        call_next(session, message)
+    
+    def forget_command(self, session, message):
+        """Drop a refused command's msg_id, the client's retry with the same ID has to run"""
+        msg_id = message.get('msg_id')
+        if msg_id:
+            self.recent_commands.discard(session.nickname, msg_id)
+    
+    def shed_load(self, command, call_next, session, message):
+        """Under load, expensive commands are refused with a hint so MSG keeps flowing"""
+        if self.overload.should_shed(command.name):
+            self.forget_command(session, message)
+            self.send_retry_later(session, command.name)
+            return
+        call_next(session, message)
+    
+    def apply_rate_limit(self, command, call_next, session, message):
+        """Commands over their client or room rate are answered with a throttle frame"""
+        retry_after_ms = self.check_rate_limit(session, command.name, message.get('content', ''))
+        if retry_after_ms:
+            self.forget_command(session, message)
+            self.send_throttled(session, command.name, retry_after_ms)
+            return
+        call_next(session, message)
+    
+    def log_command(self, command, call_next, session, message):
+        self.log.debug("command", nickname=session.nickname, command=command.name)
+        call_next(session, message)
+    
+    def time_command(self, command, call_next, session, message):
+        """Record handling time in the command's histogram and the overload average"""
+        started = time.monotonic()
+        call_next(session, message)
+        elapsed = time.monotonic() - started
+        command.histogram.record(elapsed)
+        self.overload.record_latency(elapsed)
+    
+    def send_retry_later(self, session, command):
+        """Refuse a command while the server is overloaded"""
+        retry_after_ms = self.overload.retry_after_ms()
+        self.send_json(session, {
+            'type': 'RETRY_LATER',
+            'content': f"Server is busy, {command} is unavailable right now. Retry after {retry_after_ms} ms",
+            'command': command,
+            'retry_after_ms': retry_after_ms,
+            'timestamp': self.clock.timestamp()
+        })
+    
+    def check_rate_limit(self, session, command, content):
+        """Milliseconds the client has to wait before this command is allowed, 0 if it may run now"""
+        nickname = session.nickname
+        checks = [('client', command, nickname)]
+        
+        # Public messages count against the room they go to, joins against the room joined
+        if command == 'MSG' and ':' not in content and session.room:
+            checks.append(('room', 'MSG', session.room))
+        elif command == 'JOIN' and content:
+            checks.append(('room', 'JOIN', content))
+        return self.rate_limiter.acquire(checks)
+    
+    def send_throttled(self, session, command, retry_after_ms):
+        """Tell a client it is sending a command too fast"""
+        self.send_json(session, {
+            'type': 'THROTTLED',
+            'content': f"Slow down! {command} is rate limited. Retry after {retry_after_ms} ms",
+            'command': command,
+            'retry_after_ms': retry_after_ms,
+            'timestamp': self.clock.timestamp()
+        })
+    
+    def touch_connection(self, session):
+        """Push back the idle deadline of a client that just sent a frame"""
+        self.pinged.discard(session)
+        self.idle_wheel.schedule(session, time.monotonic() + self.heartbeat_interval)
+    
+    def heartbeat_loop(self):
+        """Ping idle clients and reap the ones that stopped answering"""
+        while self.running:
+            time.sleep(self.idle_wheel.tick)
+            for session in self.idle_wheel.advance(time.monotonic()):
+                self.connection_idle(session)
+    
+    def connection_idle(self, session):
+        """Handle a client whose idle deadline has passed"""
+        # Connections that never logged in, or ignored their PING, are dead
+        if session.client_id not in self.sessions or session in self.pinged:
+            self.reap_connection(session)
+            return
+        
+        self.pinged.add(session)
+        self.idle_wheel.schedule(session, time.monotonic() + self.heartbeat_timeout)
+        ping = json.dumps({
+            'type': 'PING',
+            'content': "",
+            'timestamp': self.clock.timestamp()
+        }).encode('utf-8')
+        # This thread pings every connection, so it never waits on one socket.
+        # A client too far behind to take a PING is as good as dead
+        try:
+            if self.queue_frame(session, ping, block=False):
+                session.writer.flush()
+        except (BufferError, OSError):
+            self.reap_connection(session)
+    
+    def reap_connection(self, session):
+        """Drop a dead connection and free its nickname"""
+        self.log.info("reaping idle connection", client_id=session.client_id,
+                      nickname=session.nickname)
+        self.reaped_connections += 1
+        
+        # Shutting down wakes the handler thread blocked in recv
+        try:
+            session.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.disconnect_client(session)
+    
+    def queue_depth(self):
+        """Operations waiting on the room executors and fan-out workers"""
+        depth = sum(mailbox.qsize() for mailbox in self.room_actors.mailboxes)
+        return depth + sum(jobs.qsize() for jobs in self.fanout_pool.queues)
+    
+    def overload_loop(self):
+        """Re-grade the load level until the server stops"""
+        while self.running:
+            time.sleep(self.overload_interval)
+            level = self.overload.update(self.queue_depth(),
+                                         self.active_connections / max(self.max_connections, 1))
+            if level:
+                self.overload_changed(level)
+    
+    def overload_changed(self, level):
+        """Report a change of load level"""
+        self.log.warning("load level changed", level=level)
+    
+    def handle_join_room(self, session, room_name):
         """Handle JOIN command"""
         if not room_name:
-            self.send_message(client_socket, "ERROR", "Room name cannot be empty!")
+            self.send_message(session, "ERROR", "Room name cannot be empty!")
             return
         
-        nickname = self.clients[client_socket]['nickname']
-        current_room = self.clients[client_socket]['room']
+        nickname = session.nickname
+        current_room = session.room
         
         # Leave current room if in one
         if current_room:
-            self.leave_room(client_socket, current_room)
+            self.leave_room(session, current_room)
+        
+        session.room = room_name
+        self.backplane.publish_presence(nickname, room_name)
+        self.presence.update(nickname, room_name)
+        sink = getattr(self.reply_sink, 'value', None)
+        if sink is None:
+            self.room_actors.call(room_name, self.add_room_member, room_name, session)
+            return
+        # Inside a BATCH, ROOM_JOINED has to land in this command's slot, so the
+        # executor collects it into the same sink and the batch waits for it
+        joined = self.room_actors.call(room_name, self.with_reply_sink, sink,
+                                       self.add_room_member, room_name, session)
+        if joined is not None:
+            joined.wait(5)
+    
+    def with_reply_sink(self, sink, operation, *args):
+        """Run an operation with replies to the sink's session collected into it"""
+        previous = getattr(self.reply_sink, 'value', None)
+        self.reply_sink.value = sink
+        try:
+            operation(*args)
+        finally:
+            self.reply_sink.value = previous
+    
+    def add_room_member(self, room_name, session):
+        """Join a room, runs on the room's executor"""
+        # The client may have gone away before the join reached the room
+        if session.client_id not in self.sessions:
+            return
+        nickname = session.nickname
         
-        # Join new room
         if room_name not in self.rooms:
             self.rooms[room_name] = set()
+        self.rooms[room_name].add(session.client_id)
         
-        self.rooms[room_name].add(client_socket)
-        self.clients[client_socket]['room'] = room_name
-        
-        # Notify user
-        self.send_message(client_socket, "ROOM_JOINED", f"Joined room: {room_name}")
+        # Notify user, without waiting on their socket
+        self.send_message(session, "ROOM_JOINED", f"Joined room: {room_name}", block=False)
         
         # Notify other users in the room
         self.broadcast_to_room(room_name, "USER_JOINED", 
-                              f"{nickname} joined the room", exclude=client_socket)
+                              f"{nickname} joined the room", exclude=session.client_id)
         
-        print(f"{nickname} joined room {room_name}")
+        self.log.debug("joined room", nickname=nickname, room=room_name)
     
-    def handle_message(self, client_socket, content):
+    def handle_message(self, session, content):
         """Handle MSG command"""
-        nickname = self.clients[client_socket]['nickname']
+        nickname = session.nickname
         
         # Check if it's a private message (contains ':')
         if ':' in content:
@@ -253,139 +1082,402 @@ class ChatServer:
             message = parts[1].strip()
             
             # Send private message
-            self.send_private_message(client_socket, target_user, message)
+            self.send_private_message(session, target_user, message)
         else:
             # Send public message to current room
-            current_room = self.clients[client_socket]['room']
+            current_room = session.room
             if current_room:
                 self.broadcast_to_room(current_room, "PUBLIC_MSG", 
-                                     f"{nickname}: {content}", exclude=client_socket)
+                                     f"{nickname}: {content}", exclude=session.client_id)
                 # Echo back to sender
-                self.send_message(client_socket, "PUBLIC_MSG", f"You: {content}")
+                self.send_message(session, "PUBLIC_MSG", f"You: {content}")
             else:
-                self.send_message(client_socket, "ERROR", "You must join a room first!")
+                self.send_message(session, "ERROR", "You must join a room first!")
     
-    def handle_leave_room(self, client_socket):
+    def handle_leave_room(self, session):
         """Handle LEAVE command"""
-        current_room = self.clients[client_socket]['room']
+        current_room = session.room
         if current_room:
-            self.leave_room(client_socket, current_room)
-            self.send_message(client_socket, "ROOM_LEFT", f"Left room: {current_room}")
+            self.leave_room(session, current_room)
+            self.send_message(session, "ROOM_LEFT", f"Left room: {current_room}")
         else:
-            self.send_message(client_socket, "ERROR", "You are not in any room!")
+            self.send_message(session, "ERROR", "You are not in any room!")
     
-    def handle_list_command(self, client_socket):
+    def handle_list_command(self, session):
         """Handle LIST command"""
-        # List all active users and rooms
-        users_info = []
-        rooms_info = []
-        
-        for client, info in self.clients.items():
-            room = info['room'] if info['room'] else "No room"
-            users_info.append(f"{info['nickname']} ({room})")
-        
-        for room, clients in self.rooms.items():
-            rooms_info.append(f"{room} ({len(clients)} users)")
+        # The tracker already counts local and remote users, so this is one copy
+        # instead of a walk over every session and room
+        version, users, room_counts = self.presence.snapshot()
+        users_info = [f"{nickname} ({room if room else 'No room'})" for nickname, room in users.items()]
+        rooms_info = [f"{room} ({count} users)" for room, count in room_counts.items()]
         
         response = f"Active Users:\n" + "\n".join(users_info) + "\n\nActive Rooms:\n" + "\n".join(rooms_info)
-        self.send_message(client_socket, "LIST_RESPONSE", response)
+        self.send_json(session, {
+            'type': 'LIST_RESPONSE',
+            'content': response,
+            # Subscribers apply PRESENCE frames with later versions on top of this
+            'presence': {'version': version, 'users': users, 'rooms': room_counts},
+            'timestamp': self.clock.timestamp()
+        })
     
-    def send_private_message(self, sender_socket, target_nickname, message):
+    def publish_presence_events(self, version, events):
+        """Push one presence change to subscribed clients, called with the tracker locked"""
+        if not self.presence_subscribers:
+            return
+        message_bytes = json.dumps({
+            'type': 'PRESENCE',
+            'version': version,
+            'events': events,
+            'timestamp': self.clock.timestamp()
+        }).encode('utf-8')
+        # Each subscriber is served by one fan-out worker, so versions arrive in order
+        self.fanout_pool.submit(list(self.presence_subscribers),
+                                lambda client: self.send_encoded(client, 'PRESENCE', message_bytes, False))
+    
+    def send_private_message(self, sender, target_nickname, message):
         """Send a private message to a specific user"""
-        sender_nickname = self.clients[sender_socket]['nickname']
-        target_socket = None
-        
-        # Find target client
-        for client, info in self.clients.items():
-            if info['nickname'] == target_nickname:
-                target_socket = client
-                break
+        sender_nickname = sender.nickname
+        private_message = {
+            'type': 'PRIVATE_MSG',
+            'content': f"Private from {sender_nickname}: {message}",
+            'timestamp': self.clock.timestamp(),
+            'server_ms': self.clock.epoch_ms()  # Wall clock ms, for measuring delivery latency
+        }
         
-        if target_socket:
-            # Send to target
-            self.send_message(target_socket, "PRIVATE_MSG", 
-                            f"Private from {sender_nickname}: {message}")
+        # The backplane finds the target on this node or any other
+        if self.backplane.publish_user(target_nickname, 'PRIVATE_MSG',
+                                       json.dumps(private_message).encode('utf-8')):
             # Send confirmation to sender
-            self.send_message(sender_socket, "PRIVATE_MSG", 
+            self.send_message(sender, "PRIVATE_MSG", 
                             f"Private to {target_nickname}: {message}")
+        elif target_nickname in self.known_nicknames:
+            # Target is offline - keep the message for their next login
+            if self.offline_mailboxes.enqueue(target_nickname, private_message):
+                self.send_message(sender, "PRIVATE_MSG", 
+                                f"Private to {target_nickname} (offline, queued): {message}")
+            else:
+                self.send_message(sender, "ERROR", f"Mailbox for {target_nickname} is full!")
         else:
-            self.send_message(sender_socket, "ERROR", f"User {target_nickname} not found!")
+            self.send_message(sender, "ERROR", f"User {target_nickname} not found!")
+    
+    def find_session(self, nickname):
+        """Session of a locally connected user, or None"""
+        return self.sessions_by_nickname.get(nickname)
+    
+    def deliver_offline_mail(self, session, nickname):
+        """Send the next frame of queued mail, the one after it follows its ACK"""
+        stream = self.delivery_streams.get(nickname)
+        if stream is None:
+            return
+        
+        # A frame sent before a reconnect was retransmitted with the stream
+        in_flight = self.offline_in_flight.get(nickname)
+        if in_flight and in_flight[0] == stream.stream_id:
+            with stream.lock:
+                if any(seq == in_flight[1] for seq, _ in stream.unacked):
+                    return
+        
+        frame = self.next_offline_frame(nickname)
+        if frame is None:
+            self.offline_in_flight.pop(nickname, None)
+            return
+        message, last_queued_at = frame
+        seq = self.send_json(session, message)
+        if seq is not None:
+            self.offline_in_flight[nickname] = (stream.stream_id, seq, last_queued_at)
+            self.log.info("delivered offline mail", nickname=nickname, type=message['type'], seq=seq)
+    
+    def forward_offline_mail(self, nickname):
+        """Hand a user's queued mail to the node they logged in on, frame by frame"""
+        while True:
+            frame = self.next_offline_frame(nickname)
+            if frame is None:
+                return
+            message, last_queued_at = frame
+            # That node sequences the frames from here on, this one cannot see the ACKs
+            self.backplane.publish_user(nickname, message['type'], json.dumps(message).encode('utf-8'))
+            self.offline_mailboxes.remove_through(nickname, last_queued_at)
+    
+    def next_offline_frame(self, nickname):
+        """The next frame of a user's queued mail and the queued_at of its last entry, or None
+        
+        Messages are batched into OFFLINE_MESSAGES up to offline_batch_bytes, a
+        file is sent as its own FILE_RECEIVED frame. Nothing leaves the mailbox.
+        """
+        entries = self.offline_mailboxes.peek(nickname)
+        if not entries:
+            return None
+        
+        messages = []
+        size = 0
+        for entry in entries:
+            if entry.get('type') == 'FILE_RECEIVED':
+                # Files are queued by reference, load the content from uploads now
+                file_id = entry.get('file_info', {}).get('file_id', '')
+                filepath = os.path.join(self.uploads_dir, os.path.basename(file_id))
+                if os.path.exists(filepath):
+                    if messages:
+                        break
+                    try:
+                        with open(filepath, 'rb') as f:
+                            entry['file_content'] = base64.b64encode(f.read()).decode('utf-8')
+                        queued_at = entry.pop('queued_at')
+                        return entry, queued_at
+                    except OSError:
+                        pass
+                entry = {
+                    'type': 'ERROR',
+                    'content': f"File '{entry['file_info'].get('filename', '')}' is no longer available",
+                    'timestamp': entry.get('timestamp', ''),
+                    'queued_at': entry['queued_at']
+                }
+            
+            size += len(json.dumps(entry))
+            if messages and size > self.offline_batch_bytes:
+                break
+            messages.append(entry)
+        
+        last_queued_at = messages[-1]['queued_at']
+        for entry in messages:
+            entry.pop('queued_at', None)
+        return {
+            'type': 'OFFLINE_MESSAGES',
+            'content': f"You have {len(messages)} message(s) received while you were offline",
+            'messages': messages,
+            'timestamp': self.clock.timestamp()
+        }, last_queued_at
     
     def broadcast_to_room(self, room_name, msg_type, content, exclude=None):
         """Broadcast message to all clients in a room"""
+        message = {
+            'type': msg_type,
+            'content': content,
+            'timestamp': self.clock.timestamp(),
+            'server_ms': self.clock.epoch_ms()  # Wall clock ms, for measuring delivery latency
+        }
+        # Encode once for every recipient, on this node and the others
+        message_bytes = json.dumps(message).encode('utf-8')
+        self.backplane.publish_room(room_name, msg_type, message_bytes, exclude)
+    
+    def deliver_room_frame(self, room_name, msg_type, message_bytes, exclude=None):
+        """Send an encoded message to the local members of a room"""
+        # Member sets are only read on the room's own executor
+        if not self.room_actors.on_owner(room_name):
+            self.room_actors.post(room_name, self.deliver_room_frame,
+                                  room_name, msg_type, message_bytes, exclude)
+            return None
+        
         if room_name in self.rooms:
             # Make a copy of the set to avoid modification during iteration
-            clients_to_notify = self.rooms[room_name].copy()
-            for client in clients_to_notify:
-                if client != exclude:
+            members = self.rooms[room_name].copy()
+            recipients = []
+            for client_id in members:
+                if client_id != exclude:
                     # Check if client is still connected
-                    if client in self.clients:
-                        self.send_message(client, msg_type, content)
+                    client = self.sessions.get(client_id)
+                    if client:
+                        recipients.append(client)
                     else:
                         # Remove disconnected client from room
-                        self.rooms[room_name].discard(client)
+                        self.rooms[room_name].discard(client_id)
+            
+            # Large rooms are split across the fan-out pool. A room stays on the pool
+            # while an earlier job is still running so members never see messages reordered
+            pending = self.fanout_jobs.get(room_name)
+            if self.fanout_pool.should_fan_out(len(recipients)) or (pending and not pending.done.is_set()):
+                job = self.fanout_pool.submit(
+                    recipients, lambda client: self.send_encoded(client, msg_type, message_bytes, False))
+                self.fanout_jobs[room_name] = job
+                return job
+            
+            self.fanout_jobs.pop(room_name, None)
+            for client in recipients:
+                # Frames are left to the flusher, a slow reader never stalls the executor
+                self.send_encoded(client, msg_type, message_bytes, block=False)
     
-    def leave_room(self, client_socket, room_name):
+    def deliver_user_frame(self, nickname, msg_type, message_bytes):
+        """Send an encoded message to a local user, False if they are not connected here"""
+        session = self.find_session(nickname)
+        if not session:
+            return False
+        self.send_encoded(session, msg_type, message_bytes)
+        return True
+    
+    def apply_presence(self, nickname, room, online):
+        """Track a user on another node"""
+        if not online:
+            if nickname in self.remote_users:
+                self.remote_users.pop(nickname, None)
+                self.presence.update(nickname, None, online=False)
+            return
+        
+        is_new = nickname not in self.remote_users
+        self.remote_users[nickname] = room
+        self.presence.update(nickname, room)
+        self.known_nicknames.add(nickname)
+        
+        # Mail queued on this node follows the user to the node they logged in on
+        if is_new:
+            self.forward_offline_mail(nickname)
+    
+    def leave_room(self, session, room_name):
         """Remove client from a room"""
-        if room_name in self.rooms:
-            self.rooms[room_name].discard(client_socket)
+        nickname = session.nickname
+        session.room = None
+        self.backplane.publish_presence(nickname, None)
+        self.presence.update(nickname, None)
+        self.room_actors.call(room_name, self.remove_room_member, room_name, session.client_id, nickname)
+    
+    def remove_room_member(self, room_name, client_id, nickname):
+        """Leave a room, runs on the room's executor"""
+        if room_name in self.rooms and client_id in self.rooms[room_name]:
+            self.rooms[room_name].discard(client_id)
             
             # Remove empty rooms
             if not self.rooms[room_name]:
                 del self.rooms[room_name]
-            else:
-                # Notify other users
-                nickname = self.clients[client_socket]['nickname']
-                self.broadcast_to_room(room_name, "USER_LEFT", 
-                                     f"{nickname} left the room", exclude=client_socket)
-        
-        self.clients[client_socket]['room'] = None
+            
+            # Notify other users, including members on other nodes
+            self.broadcast_to_room(room_name, "USER_LEFT", 
+                                 f"{nickname} left the room", exclude=client_id)
     
-    def disconnect_client(self, client_socket):
+    def disconnect_client(self, session):
         """Clean up when a client disconnects"""
         try:
-            if client_socket in self.clients:
-                nickname = self.clients[client_socket]['nickname']
-                current_room = self.clients[client_socket]['room']
+            self.idle_wheel.cancel(session)
+            self.pinged.discard(session)
+            
+            # Popping first means only one thread cleans up a session
+            if self.sessions.pop(session.client_id, None):
+                nickname = session.nickname
+                current_room = session.room
                 
                 # Leave current room
                 if current_room:
-                    self.leave_room(client_socket, current_room)
+                    self.leave_room(session, current_room)
                 
                 # Remove from server data structures
-                del self.clients[client_socket]
+                self.sessions_by_nickname.pop(nickname, None)
                 self.nicknames.discard(nickname)
+                self.backplane.release_nickname(nickname)
+                self.presence_subscribers.discard(session)
+                self.presence.update(nickname, None, online=False)
+                
+                # Keep unacknowledged frames around for a resume
+                stream = self.delivery_streams.get(nickname)
+                if stream:
+                    stream.detached_at = time.time()
                 
-                print(f"Client {nickname} disconnected")
+                self.log.info("client disconnected", nickname=nickname, client_id=session.client_id)
             
             # Close socket
-            try:
-                client_socket.close()
-            except:
-                pass
+            self.close_connection(session)
         except Exception as e:
-            print(f"Error disconnecting client: {e}")
-            try:
-                client_socket.close()
-            except:
-                pass
+            self.log.error("disconnect failed", client_id=session.client_id, error=e)
+            self.close_connection(session)
     
     def shutdown_server(self):
         """Gracefully shutdown the server"""
-        print("Shutting down server...")
-        
-        # Close all client connections
-        for client in list(self.clients.keys()):
-            self.disconnect_client(client)
+        was_running = self.running
+        self.running = False
+        self.log.info("shutting down", host=self.host, port=self.port)
         
-        # Close server socket
+        # Stop accepting before draining so nobody new joins
         if self.server_socket:
+            try:
+                self.server_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
             self.server_socket.close()
+        
+        # Save state while room memberships are still intact, and only once
+        # nothing is being handled or delivered any more
+        self.stop_dispatch()
+        if was_running:
+            self.save_snapshot()
+        
+        # Tell everyone to reconnect and close them in bulk, without USER_LEFT
+        # broadcasts into rooms that are going away anyway
+        self.drain_clients("Server is shutting down, reconnecting...")
+        self.stop_workers()
+        self.log.flush()
+    
+    def stop_workers(self):
+        """Stop the threads and pools this server started, once its clients are drained"""
+        # Stop renewing nickname leases and leave the other nodes
+        self.backplane.stop()
+        self.room_actors.stop()
+        self.fanout_pool.stop()
+        self.write_flusher.stop()
+        if self.handler_pool:
+            self.handler_pool.shutdown(wait=False)
+    
+    def build_snapshot(self):
+        """Collect the state worth keeping across a restart"""
+        # Room memberships by nickname, including users that have not come back yet
+        room_members = dict(self.pending_rooms)
+        for session in list(self.sessions.values()):
+            if session.room:
+                room_members[session.nickname] = session.room
+        
+        streams = {}
+        for nickname, stream in list(self.delivery_streams.items()):
+            with stream.lock:
+                streams[nickname] = stream.to_state()
+        
+        return {
+            'room_members': room_members,
+            'known_nicknames': list(self.known_nicknames),
+            'upload_index': dict(self.upload_index),
+            'delivery_streams': streams,
+            'offline_mailboxes': self.offline_mailboxes.export_state(),
+            'recent_commands': self.recent_commands.export_state()
+        }
     
-    def handle_file_transfer(self, client_socket, message):
+    def save_snapshot(self):
+        """Write a snapshot of the server state to disk"""
+        if not self.snapshot_path:
+            return
+        try:
+            started = time.time()
+            size = write_snapshot(self.snapshot_path, self.build_snapshot())
+            self.log.info("saved snapshot", bytes=size, ms=round((time.time() - started) * 1000, 1))
+        except Exception as e:
+            self.log.error("snapshot failed", error=e)
+    
+    def restore_snapshot(self):
+        """Load state saved by a previous run, if there is one"""
+        if not self.snapshot_path:
+            return
+        started = time.time()
+        state = read_snapshot(self.snapshot_path)
+        if not state:
+            return
+        
+        self.pending_rooms = state['room_members']
+        self.known_nicknames.update(state['known_nicknames'])
+        self.upload_index.update(state['upload_index'])
+        for nickname, stream_state in state['delivery_streams'].items():
+            self.delivery_streams[nickname] = DeliveryStream.from_state(nickname, stream_state)
+        self.offline_mailboxes.import_state(state['offline_mailboxes'])
+        # Clients resend recent commands after reconnecting, older snapshots have no IDs
+        self.recent_commands.import_state(state.get('recent_commands', []))
+        
+        self.log.info("restored snapshot", room_memberships=len(self.pending_rooms),
+                      sessions=len(self.delivery_streams), uploads=len(self.upload_index),
+                      ms=round((time.time() - started) * 1000, 1))
+    
+    def snapshot_loop(self):
+        """Periodically snapshot state while the server runs"""
+        while self.running:
+            time.sleep(self.snapshot_interval)
+            if self.running:
+                self.save_snapshot()
+    
+    def handle_file_transfer(self, session, message):
         """Handle file transfer command"""
         try:
-            nickname = self.clients[client_socket]['nickname']
+            nickname = session.nickname
             file_data = message.get('file_data', {})
             
             filename = file_data.get('filename', '')
@@ -397,20 +1489,20 @@ class ChatServer:
             # Validate file
             validation_result = self.validate_file(filename, file_size)
             if not validation_result['valid']:
-                self.send_message(client_socket, "ERROR", validation_result['error'])
+                self.send_message(session, "ERROR", validation_result['error'])
                 return
             
             # Decode file content
             try:
                 file_content = base64.b64decode(file_content_b64)
             except Exception as e:
-                self.send_message(client_socket, "ERROR", "Invalid file data!")
+                self.send_message(session, "ERROR", "Invalid file data!")
                 return
             
             # Save file to server
             safe_filename = self.save_file(nickname, filename, file_content)
             if not safe_filename:
-                self.send_message(client_socket, "ERROR", "Failed to save file!")
+                self.send_message(session, "ERROR", "Failed to save file!")
                 return
             
             # Create file message
@@ -419,21 +1511,22 @@ class ChatServer:
                 'size': file_size,
                 'sender': nickname,
                 'file_id': safe_filename,
-                'timestamp': datetime.now().strftime("%H:%M:%S")
+                'timestamp': self.clock.timestamp()
             }
             
             if is_private:
                 # Send file privately
-                self.send_private_file(client_socket, target, file_info, file_content_b64)
+                self.send_private_file(session, target, file_info, file_content_b64)
             else:
                 # Send file to room
-                self.send_file_to_room(client_socket, target, file_info, file_content_b64)
+                self.send_file_to_room(session, target, file_info, file_content_b64)
                 
-            print(f"{nickname} shared file {filename} ({'private to ' + target if is_private else 'in room ' + target})")
+            self.log.info("file shared", nickname=nickname, filename=filename, target=target,
+                          private=is_private)
             
         except Exception as e:
-            print(f"Error handling file transfer: {e}")
-            self.send_message(client_socket, "ERROR", "File transfer failed!")
+            self.log.error("file transfer failed", client_id=session.client_id, error=e)
+            self.send_message(session, "ERROR", "File transfer failed!")
     
     def validate_file(self, filename, file_size):
         """Validate file based on size and type restrictions"""
@@ -464,50 +1557,57 @@ class ChatServer:
             with open(filepath, 'wb') as f:
                 f.write(file_content)
             
+            self.upload_index[safe_filename] = {
+                'sender': sender_nickname,
+                'filename': filename,
+                'size': len(file_content),
+                'saved_at': time.time()
+            }
             return safe_filename
         except Exception as e:
-            print(f"Error saving file: {e}")
+            self.log.error("could not save file", filename=filename, error=e)
             return None
     
-    def send_private_file(self, sender_socket, target_nickname, file_info, file_content_b64):
+    def send_private_file(self, sender, target_nickname, file_info, file_content_b64):
         """Send file privately to a specific user"""
-        sender_nickname = self.clients[sender_socket]['nickname']
-        target_socket = None
-        
-        # Find target client
-        for client, info in self.clients.items():
-            if info['nickname'] == target_nickname:
-                target_socket = client
-                break
+        file_message = {
+            'type': 'FILE_RECEIVED',
+            'file_info': file_info,
+            'file_content': file_content_b64,
+            'is_private': True,
+            'timestamp': self.clock.timestamp()
+        }
         
-        if target_socket:
-            # Send file to target using proper protocol
-            file_message = {
+        # The backplane finds the target on this node or any other
+        if self.backplane.publish_user(target_nickname, 'FILE_RECEIVED',
+                                       json.dumps(file_message).encode('utf-8')):
+            # Send confirmation to sender
+            self.send_message(sender, "FILE_SENT", 
+                            f"File '{file_info['filename']}' sent privately to {target_nickname}")
+        elif target_nickname in self.known_nicknames:
+            # Target is offline - queue a reference to the stored upload
+            entry = {
                 'type': 'FILE_RECEIVED',
                 'file_info': file_info,
-                'file_content': file_content_b64,
                 'is_private': True,
-                'timestamp': datetime.now().strftime("%H:%M:%S")
+                'timestamp': self.clock.timestamp()
             }
-            message_json = json.dumps(file_message)
-            message_bytes = message_json.encode('utf-8')
-            length_bytes = len(message_bytes).to_bytes(4, byteorder='big')
-            target_socket.send(length_bytes + message_bytes)
-            
-            # Send confirmation to sender
-            self.send_message(sender_socket, "FILE_SENT", 
-                            f"File '{file_info['filename']}' sent privately to {target_nickname}")
+            if self.offline_mailboxes.enqueue(target_nickname, entry):
+                self.send_message(sender, "FILE_SENT", 
+                                f"File '{file_info['filename']}' queued for {target_nickname} (offline)")
+            else:
+                self.send_message(sender, "ERROR", f"Mailbox for {target_nickname} is full!")
         else:
-            self.send_message(sender_socket, "ERROR", f"User {target_nickname} not found!")
+            self.send_message(sender, "ERROR", f"User {target_nickname} not found!")
     
-    def send_file_to_room(self, sender_socket, room_name, file_info, file_content_b64):
+    def send_file_to_room(self, sender, room_name, file_info, file_content_b64):
         """Send file to all users in a room"""
-        sender_nickname = self.clients[sender_socket]['nickname']
-        current_room = self.clients[sender_socket]['room']
+        sender_nickname = sender.nickname
+        current_room = sender.room
         
         # Check if sender is in the specified room
         if current_room != room_name:
-            self.send_message(sender_socket, "ERROR", f"You must be in room '{room_name}' to share files there!")
+            self.send_message(sender, "ERROR", f"You must be in room '{room_name}' to share files there!")
             return
         
         if room_name in self.rooms:
@@ -516,27 +1616,18 @@ class ChatServer:
                 'file_info': file_info,
                 'file_content': file_content_b64,
                 'is_private': False,
-                'timestamp': datetime.now().strftime("%H:%M:%S")
+                'timestamp': self.clock.timestamp()
             }
             
-            # Send to all clients in room except sender
-            clients_to_notify = self.rooms[room_name].copy()
-            message_json = json.dumps(file_message)
-            message_bytes = message_json.encode('utf-8')
-            length_bytes = len(message_bytes).to_bytes(4, byteorder='big')
-            
-            for client in clients_to_notify:
-                if client != sender_socket and client in self.clients:
-                    try:
-                        client.send(length_bytes + message_bytes)
-                    except:
-                        self.rooms[room_name].discard(client)
+            # Send to all clients in room except sender, encoding the file only once
+            message_bytes = json.dumps(file_message).encode('utf-8')
+            self.backplane.publish_room(room_name, 'FILE_RECEIVED', message_bytes, exclude=sender.client_id)
             
             # Send confirmation to sender
-            self.send_message(sender_socket, "FILE_SENT", 
+            self.send_message(sender, "FILE_SENT", 
                             f"File '{file_info['filename']}' shared in room {room_name}")
         else:
-            self.send_message(sender_socket, "ERROR", f"Room '{room_name}' not found!")
+            self.send_message(sender, "ERROR", f"Room '{room_name}' not found!")
     
     def get_file_info(self):
         """Get information about file sharing settings"""
@@ -550,11 +1641,68 @@ class ChatServer:
 if __name__ == "__main__":
     # Start the chat server
     print("=== Python Chat Server ===")
-    print("Starting server on localhost:55555...")
     
-    server = ChatServer()
+    # python server.py --port 55556
+    port = 55555
+    if '--port' in sys.argv[1:-1]:
+        port = int(sys.argv[sys.argv.index('--port') + 1])
+    print(f"Starting server on localhost:{port}...")
+    
+    # python server.py --backplane /tmp/chat_hub.sock
+    # Servers connected to the same broker (python backplane.py PATH) share rooms and users
+    backplane = None
+    broker_path = None
+    if '--backplane' in sys.argv[1:-1]:
+        broker_path = sys.argv[sys.argv.index('--backplane') + 1]
+        node_id = f"{socket.gethostname()}-{os.getpid()}"
+        backplane = lambda server: HubBackplane(server, broker_path, node_id)
+    
+    server = ChatServer('localhost', port, backplane)
+    
+    # python server.py --max-connections 1000 --backlog 256
+    if '--max-connections' in sys.argv[1:-1]:
+        server.max_connections = int(sys.argv[sys.argv.index('--max-connections') + 1])
+    if '--backlog' in sys.argv[1:-1]:
+        server.accept_backlog = int(sys.argv[sys.argv.index('--backlog') + 1])
+    
+    # python server.py --log-file chat_server.log --log-level DEBUG
+    if '--log-file' in sys.argv[1:-1]:
+        server.log.configure(path=sys.argv[sys.argv.index('--log-file') + 1])
+    if '--log-level' in sys.argv[1:-1]:
+        level_name = sys.argv[sys.argv.index('--log-level') + 1].upper()
+        levels = {name: level for level, name in LEVEL_NAMES.items()}
+        server.log.configure(level=levels.get(level_name, INFO))
+    
+    # python server.py --heartbeat-interval 15 --heartbeat-timeout 10
+    if '--heartbeat-interval' in sys.argv[1:-1]:
+        server.heartbeat_interval = float(sys.argv[sys.argv.index('--heartbeat-interval') + 1])
+    if '--heartbeat-timeout' in sys.argv[1:-1]:
+        server.heartbeat_timeout = float(sys.argv[sys.argv.index('--heartbeat-timeout') + 1])
+    
+    # Each server on a broker keeps its own snapshot and mailbox files
+    if broker_path:
+        server.snapshot_path = f"server_snapshot_{port}.pkl"
+        server.offline_mailboxes = MailboxStore(spill_dir=os.path.join("server_mailboxes", str(port)))
+        print(f"Connected to backplane broker at {broker_path}")
+        print(f"Connected to backplane broker at {broker_path}")
+    
+    # python server.py --handoff /tmp/chat_server.sock
+    # Starting a second server with the same path takes over from the running one
+    listener = None
+    handoff = None
+    if '--handoff' in sys.argv[1:-1]:
+        handoff_path = sys.argv[sys.argv.index('--handoff') + 1]
+        listener = request_listener(handoff_path)
+        if listener:
+            print("Took over listening socket from the running server")
+        handoff = HandoffListener(server, handoff_path)
+        handoff.start()
+    
     try:
-        server.start_server()
+        server.start_server(listener)
+        # The accept loop ends early on a handoff, wait until the successor has the socket
+        if handoff and server.handing_off:
+            handoff.finished.wait(30)
     except KeyboardInterrupt:
         print("\nShutting down server...")
         server.shutdown_server()
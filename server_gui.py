@@ -8,6 +8,7 @@ import os
 
 # Import the ChatServer class
 from server import ChatServer
+from rate_limit import DEFAULT_LIMITS
 
 class ServerGUI:
     def __init__(self):
@@ -193,6 +194,17 @@ class ServerGUI:
                                     font=('Arial', 10))
         self.uptime_label.grid(row=1, column=1, padx=20, pady=5, sticky='w')
         
+        # Overload level and the commands being refused at that level
+        self.load_label = tk.Label(stats_grid, text="Load: NORMAL", 
+                                  bg=self.panel_color, fg=self.success_color, 
+                                  font=('Arial', 10, 'bold'))
+        self.load_label.grid(row=2, column=0, padx=20, pady=5, sticky='w')
+        
+        self.shedding_label = tk.Label(stats_grid, text="Shedding: none", 
+                                      bg=self.panel_color, fg=self.text_color, 
+                                      font=('Arial', 10))
+        self.shedding_label.grid(row=2, column=1, padx=20, pady=5, sticky='w')
+        
         # Real-time activity feed
         activity_frame = tk.Frame(overview_frame, bg=self.panel_color, relief=tk.RAISED, bd=1)
         activity_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=(0, 10))
@@ -376,6 +388,30 @@ class ServerGUI:
         ttk.Button(management_buttons, text="📊 Generate Report", 
                   command=self.generate_report, style='Info.TButton').pack(side=tk.LEFT, padx=5)
         
+        # Rate limits, applied to the running server straight away
+        limits_frame = tk.Frame(admin_frame, bg=self.panel_color, relief=tk.RAISED, bd=1)
+        limits_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
+        
+        tk.Label(limits_frame, text="🚦 Rate Limits (per second / burst)", 
+                bg=self.panel_color, fg=self.text_color, 
+                font=('Arial', 12, 'bold')).pack(pady=(10, 5))
+        
+        limits_grid = tk.Frame(limits_frame, bg=self.panel_color)
+        limits_grid.pack(pady=(0, 5))
+        
+        self.rate_limit_vars = {}
+        for row, ((scope, action), (rate, burst)) in enumerate(DEFAULT_LIMITS.items()):
+            tk.Label(limits_grid, text=f"{scope.title()} {action}:", 
+                    bg=self.panel_color, fg=self.text_color).grid(row=row, column=0, padx=5, pady=2, sticky='e')
+            rate_var = tk.StringVar(value=str(rate))
+            burst_var = tk.StringVar(value=str(burst))
+            tk.Entry(limits_grid, textvariable=rate_var, width=8).grid(row=row, column=1, padx=5, pady=2)
+            tk.Entry(limits_grid, textvariable=burst_var, width=8).grid(row=row, column=2, padx=5, pady=2)
+            self.rate_limit_vars[(scope, action)] = (rate_var, burst_var)
+        
+        ttk.Button(limits_frame, text="✅ Apply Limits", 
+                  command=self.apply_rate_limits, style='Success.TButton').pack(pady=(0, 10))
+        
         # Auto-refresh settings
         auto_frame = tk.Frame(admin_frame, bg=self.panel_color, relief=tk.RAISED, bd=1)
         auto_frame.pack(fill=tk.X, padx=10, pady=(0, 10))
@@ -453,10 +489,28 @@ class ServerGUI:
             messagebox.showerror("Error", f"Failed to stop server: {e}")
     
     def restart_server(self):
-        """Restart the chat server"""
+        """Restart the chat server without closing the listening socket"""
         self.log_activity("Server restarting...", "admin")
-        self.stop_server()
-        self.root.after(2000, self.start_server)  # Wait 2 seconds before restarting
+        if not self.server or not self.running:
+            self.start_server()
+            return
+        
+        # The new server takes over the listening socket and the saved state, so
+        # connections are never refused and clients resume after a short random delay
+        listener = self.server.release_listener()
+        if listener is None:
+            self.stop_server()
+            self.start_server()
+            return
+        
+        host, port = listener.getsockname()[:2]
+        self.server = EnhancedChatServer(host, port, self)
+        self.server_thread = threading.Thread(target=self.server.start_server, args=(listener,))
+        self.server_thread.daemon = True
+        self.server_thread.start()
+        
+        self.log_activity("Server restarted, clients are reconnecting", "admin")
+        self.update_status(f"Server running on {host}:{port}")
     
     def log_activity(self, message, tag="system"):
         """Log activity to the activity display"""
@@ -492,13 +546,23 @@ class ServerGUI:
     def update_statistics(self):
         """Update server statistics"""
         if self.server and self.running:
-            client_count = len(self.server.clients)
+            client_count = len(self.server.sessions)
             room_count = len(self.server.rooms)
             message_count = len(self.message_log)
             
             self.clients_count_label.configure(text=f"Connected Clients: {client_count}")
             self.rooms_count_label.configure(text=f"Active Rooms: {room_count}")
             self.messages_count_label.configure(text=f"Messages Sent: {message_count}")
+            
+            load = self.server.overload.status()
+            load_colors = {'NORMAL': self.success_color, 'ELEVATED': self.info_color,
+                           'HIGH': self.warning_color, 'CRITICAL': self.error_color}
+            self.load_label.configure(
+                text=f"Load: {load['level']} ({load['latency_ms']} ms, queue {load['queue_depth']}, "
+                     f"{load['connection_use']}% connections)",
+                fg=load_colors[load['level']])
+            shed = ', '.join(load['shed']) if load['shed'] else "none"
+            self.shedding_label.configure(text=f"Shedding: {shed} ({load['shed_count']} refused)")
     
     def refresh_clients(self):
         """Refresh clients list"""
@@ -507,13 +571,13 @@ class ServerGUI:
             self.clients_tree.delete(item)
         
         if self.server and self.running:
-            for client_socket, info in self.server.clients.items():
+            for session in list(self.server.sessions.values()):
                 try:
-                    address = client_socket.getpeername()
-                    nickname = info['nickname']
-                    room = info['room'] or "None"
-                    connected_since = "N/A"  # Could be tracked if needed
-                    messages_sent = "N/A"    # Could be tracked if needed
+                    address = session.address
+                    nickname = session.nickname
+                    room = session.room or "None"
+                    connected_since = datetime.fromtimestamp(session.connected_at).strftime("%H:%M:%S")
+                    messages_sent = session.commands_received
                     
                     self.clients_tree.insert('', tk.END, values=(
                         nickname, f"{address[0]}:{address[1]}", room, 
@@ -529,7 +593,7 @@ class ServerGUI:
             self.rooms_tree.delete(item)
         
         if self.server and self.running:
-            for room_name, clients in self.server.rooms.items():
+            for room_name, clients in list(self.server.rooms.items()):
                 user_count = len(clients)
                 created = "N/A"  # Could be tracked if needed
                 last_activity = "N/A"  # Could be tracked if needed
@@ -647,6 +711,32 @@ class ServerGUI:
                 self.log_activity("Cleared all rooms", "admin")
                 self.refresh_rooms()
     
+    def read_rate_limits(self):
+        """Limits entered in the admin tab, None if any of them is invalid"""
+        limits = {}
+        for key, (rate_var, burst_var) in self.rate_limit_vars.items():
+            try:
+                rate = float(rate_var.get())
+                burst = int(burst_var.get())
+            except ValueError:
+                return None
+            if rate <= 0 or burst < 1:
+                return None
+            limits[key] = (rate, burst)
+        return limits
+    
+    def apply_rate_limits(self):
+        """Push the rate limits from the admin tab to the running server"""
+        limits = self.read_rate_limits()
+        if limits is None:
+            messagebox.showerror("Error", "Rates must be positive numbers and bursts at least 1!")
+            return
+        
+        if self.server:
+            for (scope, action), (rate, burst) in limits.items():
+                self.server.rate_limiter.set_limit(scope, action, rate, burst)
+            self.log_activity("Rate limits updated", "admin")
+    
     def clear_logs(self):
         """Clear all logs"""
         if messagebox.askyesno("Confirm", "Clear all logs?"):
@@ -689,6 +779,12 @@ class ServerGUI:
             # Get recent file transfers
             recent_files = file_transfers[-10:] if file_transfers else []
             
+            # Per-command handling time from the server's latency histograms
+            latency = self.server.commands.latency_summary() if self.server else {}
+            latency_lines = [f"- {name}: {stats['count']} runs, mean {stats['mean_ms']} ms, "
+                             f"p50 <= {stats['p50_ms']} ms, p99 <= {stats['p99_ms']} ms"
+                             for name, stats in sorted(latency.items())]
+            
             report = f"""
 CHAT SERVER REPORT
 Generated: {datetime.now()}
@@ -700,11 +796,14 @@ SERVER STATUS:
 - Port: {self.port_entry.get()}
 
 STATISTICS:
-- Connected Clients: {len(self.server.clients) if self.server else 0}
+- Connected Clients: {len(self.server.sessions) if self.server else 0}
 - Active Rooms: {len(self.server.rooms) if self.server else 0}
 - Total Messages: {len(self.message_log)}
 - File Transfers: {total_files}
 
+COMMAND LATENCY:
+{chr(10).join(latency_lines) if latency_lines else "No commands handled yet"}
+
 RECENT ACTIVITY:
 {chr(10).join([f"[{entry['timestamp']}] {entry['message']}" for entry in self.message_log[-10:]])}
 
@@ -747,11 +846,16 @@ class EnhancedChatServer(ChatServer):
     def __init__(self, host='localhost', port=55555, gui=None):
         super().__init__(host, port)
         self.gui = gui
+        
+        # Keep the limits set in the admin tab across restarts
+        limits = gui.read_rate_limits() if gui else None
+        for (scope, action), (rate, burst) in (limits or {}).items():
+            self.rate_limiter.set_limit(scope, action, rate, burst)
     
-    def handle_file_transfer(self, client_socket, message):
+    def handle_file_transfer(self, session, message):
         """Enhanced file transfer handling with GUI logging"""
         try:
-            nickname = self.clients[client_socket]['nickname']
+            nickname = session.nickname
             file_data = message.get('file_data', {})
             filename = file_data.get('filename', '')
             file_size = file_data.get('size', 0)
@@ -759,7 +863,7 @@ class EnhancedChatServer(ChatServer):
             is_private = message.get('is_private', False)
             
             # Call parent method first
-            super().handle_file_transfer(client_socket, message)
+            super().handle_file_transfer(session, message)
             
             # Log successful file transfer
             self.log_file_transfer(nickname, filename, file_size, target, is_private)
@@ -770,27 +874,40 @@ class EnhancedChatServer(ChatServer):
             # Re-raise the exception to maintain original error handling
             raise
     
-    def handle_client(self, client_socket, address):
+    def handle_client(self, session):
         """Enhanced client handling with GUI logging"""
         try:
             # Call parent method but with logging
             if self.gui:
-                self.gui.log_activity(f"New connection from {address}", "connect")
+                self.gui.log_activity(f"New connection from {session.address}", "connect")
             
-            super().handle_client(client_socket, address)
+            super().handle_client(session)
             
         except Exception as e:
             if self.gui:
                 self.gui.log_activity(f"Client handling error: {e}", "disconnect")
     
-    def send_message(self, client_socket, msg_type, content):
+    def send_message(self, session, msg_type, content, block=True):
         """Enhanced message sending with logging"""
-        super().send_message(client_socket, msg_type, content)
+        super().send_message(session, msg_type, content, block)
         
         # Only log non-echo messages (don't log "You: ..." messages)
         if self.gui and msg_type in ['PUBLIC_MSG', 'PRIVATE_MSG'] and not content.startswith('You: '):
             self.gui.log_message(content, msg_type.lower().replace('_msg', ''))
     
+    def broadcast_to_room(self, room_name, msg_type, content, exclude=None):
+        """Enhanced room broadcast with logging, once per message rather than per member"""
+        super().broadcast_to_room(room_name, msg_type, content, exclude)
+        
+        if self.gui and msg_type == 'PUBLIC_MSG':
+            self.gui.log_message(content, 'public')
+    
+    def overload_changed(self, level):
+        """Show load level changes in the activity feed"""
+        super().overload_changed(level)
+        if self.gui:
+            self.gui.log_activity(f"⚠️ Load level changed to {level}", "admin")
+    
     def log_file_transfer(self, nickname, filename, file_size, target, is_private):
         """Log file transfer for admin visibility"""
         if self.gui:
@@ -806,50 +923,58 @@ class EnhancedChatServer(ChatServer):
                 self.gui.log_activity(activity_msg, "file")
                 self.gui.log_message(log_msg, "file")
     
-    def disconnect_client(self, client_socket):
+    def disconnect_client(self, session):
         """Enhanced client disconnection with logging"""
-        if client_socket in self.clients and self.gui:
-            nickname = self.clients[client_socket]['nickname']
-            self.gui.log_activity(f"Client {nickname} disconnected", "disconnect")
+        if session.client_id in self.sessions and self.gui:
+            self.gui.log_activity(f"Client {session.nickname} disconnected", "disconnect")
         
-        super().disconnect_client(client_socket)
+        super().disconnect_client(session)
     
     def global_broadcast(self, message):
         """Send global broadcast to all clients"""
-        for client_socket in list(self.clients.keys()):
-            self.send_message(client_socket, "ADMIN_MSG", f"📢 ADMIN: {message}")
+        for session in list(self.sessions.values()):
+            self.send_message(session, "ADMIN_MSG", f"📢 ADMIN: {message}")
     
     def message_client(self, nickname, message):
         """Send private message to specific client"""
-        for client_socket, info in self.clients.items():
-            if info['nickname'] == nickname:
-                self.send_message(client_socket, "ADMIN_MSG", f"👤 ADMIN: {message}")
-                return True
+        session = self.find_session(nickname)
+        if session:
+            self.send_message(session, "ADMIN_MSG", f"👤 ADMIN: {message}")
+            return True
         return False
     
     def kick_client(self, nickname):
         """Kick a specific client"""
-        for client_socket, info in list(self.clients.items()):
-            if info['nickname'] == nickname:
-                self.send_message(client_socket, "ADMIN_MSG", "You have been kicked by an administrator.")
-                self.disconnect_client(client_socket)
-                return True
+        session = self.find_session(nickname)
+        if session:
+            self.send_message(session, "ADMIN_MSG", "You have been kicked by an administrator.")
+            self.disconnect_client(session)
+            return True
         return False
     
     def delete_room(self, room_name):
         """Delete a room and kick all users"""
+        self.room_actors.call(room_name, self.remove_room, room_name)
+    
+    def remove_room(self, room_name):
+        """Delete a room, runs on the room's executor"""
         if room_name in self.rooms:
-            clients_in_room = list(self.rooms[room_name])
-            for client in clients_in_room:
-                self.send_message(client, "ADMIN_MSG", f"Room '{room_name}' has been deleted by an administrator.")
-                self.clients[client]['room'] = None
+            for client_id in list(self.rooms[room_name]):
+                session = self.sessions.get(client_id)
+                if session:
+                    self.send_message(session, "ADMIN_MSG", f"Room '{room_name}' has been deleted by an administrator.",
+                                      block=False)
+                    session.room = None
+                    # Other workers and nodes learn of the move through the backplane
+                    self.backplane.publish_presence(session.nickname, None)
+                    self.presence.update(session.nickname, None)
             del self.rooms[room_name]
     
     def kick_all_users(self):
         """Kick all users from the server"""
-        for client_socket in list(self.clients.keys()):
-            self.send_message(client_socket, "ADMIN_MSG", "Server maintenance. All users disconnected.")
-            self.disconnect_client(client_socket)
+        for session in list(self.sessions.values()):
+            self.send_message(session, "ADMIN_MSG", "Server maintenance. All users disconnected.")
+            self.disconnect_client(session)
     
     def clear_all_rooms(self):
         """Clear all rooms"""
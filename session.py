@@ -0,0 +1,34 @@
+import time
+
+
+class ClientSession:
+    """One client connection
+
+    Slotted so a session costs a fixed handful of fields instead of a dict,
+    and identified by a small integer that rooms store instead of the socket.
+    """
+
+    __slots__ = ('client_id', 'sock', 'address', 'nickname', 'room',
+                 'connected_at', 'commands_received', 'frames_sent', 'writer',
+                  'compressor', 'decompressor')
+
+    def __init__(self, client_id, sock, address):
+        self.client_id = client_id
+        self.sock = sock
+        self.address = address
+        self.nickname = None  # Set once the nickname is accepted
+        self.room = None
+        self.connected_at = time.time()
+        self.commands_received = 0
+        self.frames_sent = 0
+        self.writer = None  # WriteCoalescer, None sends each frame straight to the socket
+        self.compressor = None    # Set when the client asked for compression at login
+        self.decompressor = None
+
+    def __hash__(self):
+        # Sequential IDs spread sessions evenly over fan-out workers
+        return self.client_id
+
+    def __repr__(self):
+        return f"ClientSession({self.client_id}, {self.nickname!r})"
+
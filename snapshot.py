@@ -0,0 +1,39 @@
+import os
+import pickle
+import time
+
+from structured_log import get_logger
+
+SNAPSHOT_VERSION = 1
+
+
+def write_snapshot(path, state):
+    """Atomically write a state dict, returns the number of bytes written"""
+    payload = pickle.dumps({'version': SNAPSHOT_VERSION, 'saved_at': time.time(), 'state': state},
+                           protocol=pickle.HIGHEST_PROTOCOL)
+
+    # Write next to the target and rename, so a crash never leaves half a snapshot
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(payload)
+
+
+def read_snapshot(path):
+    """Load a state dict written by write_snapshot, or None if there is no usable one"""
+    try:
+        with open(path, 'rb') as f:
+            snapshot = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        get_logger().error("could not read snapshot", path=path, error=e)
+        return None
+
+    if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION:
+        get_logger().warning("ignoring snapshot with unsupported version", path=path)
+        return None
+    return snapshot['state']
@@ -0,0 +1,150 @@
+import atexit
+import collections
+import os
+import sys
+import threading
+import time
+
+
+# Log levels, records below the logger's level are dropped at the call site
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR'}
+
+
+class AsyncLogger:
+    """Structured logger that writes from a background thread
+
+    Logging a record only appends a tuple to a bounded deque, which needs no
+    lock in CPython, so handler threads never wait on stdout or the disk.
+    When the buffer is full the oldest records are overwritten. Records
+    below the level return before anything is built, so disabled debug
+    logging costs one comparison.
+    """
+
+    def __init__(self, level=INFO, path=None, max_bytes=5 * 1024 * 1024, backups=3,
+                 capacity=10000, interval=0.1):
+        self.level = level
+        self.path = path            # None writes to stdout
+        self.max_bytes = max_bytes  # The file is rotated once it grows past this
+        self.backups = backups      # Rotated files kept as path.1 ... path.N
+        self.interval = interval    # Seconds between flushes
+        self.records = collections.deque(maxlen=capacity)
+        self.write_lock = threading.Lock()
+        self.file = None
+        self.thread = None
+
+    def is_enabled(self, level):
+        return level >= self.level
+
+    def log(self, level, event, **fields):
+        if level >= self.level:
+            self.records.append((time.time(), level, event, fields))
+
+    def debug(self, event, **fields):
+        if DEBUG >= self.level:
+            self.records.append((time.time(), DEBUG, event, fields))
+
+    def info(self, event, **fields):
+        if INFO >= self.level:
+            self.records.append((time.time(), INFO, event, fields))
+
+    def warning(self, event, **fields):
+        if WARNING >= self.level:
+            self.records.append((time.time(), WARNING, event, fields))
+
+    def error(self, event, **fields):
+        if ERROR >= self.level:
+            self.records.append((time.time(), ERROR, event, fields))
+
+    def configure(self, level=None, path=None):
+        """Change the level or send output to a file from now on"""
+        if level is not None:
+            self.level = level
+        if path is not None:
+            with self.write_lock:
+                if self.file:
+                    self.file.close()
+                    self.file = None
+                self.path = path
+
+    def start(self):
+        """Start the flusher thread and flush whatever is left at exit"""
+        self.thread = threading.Thread(target=self.flush_loop, name="log-flusher")
+        self.thread.daemon = True
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def flush_loop(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        """Format and write every buffered record"""
+        with self.write_lock:
+            lines = []
+            while True:
+                try:
+                    lines.append(self.format(self.records.popleft()))
+                except IndexError:
+                    break
+            if lines:
+                try:
+                    self.write(''.join(lines))
+                except (OSError, ValueError):
+                    pass  # Nowhere left to report a failed log write
+
+    def format(self, record):
+        """One line per record: time, level, event, then key=value fields"""
+        created, level, event, fields = record
+        parts = [time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created)),
+                 LEVEL_NAMES.get(level, str(level)), event]
+        for key, value in fields.items():
+            if isinstance(value, str) and (' ' in value or not value):
+                value = repr(value)
+            parts.append(f"{key}={value}")
+        return ' '.join(parts) + '\n'
+
+    def write(self, text):
+        """Write formatted lines, rotating the file when it gets too big (caller holds write_lock)"""
+        if not self.path:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+            return
+
+        if self.file is None:
+            self.file = open(self.path, 'a', encoding='utf-8')
+        self.file.write(text)
+        self.file.flush()
+        if self.file.tell() >= self.max_bytes:
+            self.rotate()
+
+    def rotate(self):
+        """Shift path.1 ... path.N along and start a fresh file"""
+        self.file.close()
+        self.file = None
+        for index in range(self.backups - 1, 0, -1):
+            older = f"{self.path}.{index}"
+            if os.path.exists(older):
+                os.replace(older, f"{self.path}.{index + 1}")
+        if self.backups:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+
+shared_logger = None
+shared_logger_lock = threading.Lock()
+
+
+def get_logger():
+    """The process-wide logger, started on first use"""
+    global shared_logger
+    with shared_logger_lock:
+        if shared_logger is None:
+            shared_logger = AsyncLogger()
+            shared_logger.start()
+        return shared_logger
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Test script for admission control
+Checks that connections beyond the limit get a SERVER_BUSY frame and slots are reused
+"""
+
+import socket
+import time
+
+from test_helpers import receive_with_length, start_test_server, login
+
+def start_limited_server(max_connections):
+    """Start a test server that admits at most max_connections clients"""
+    server, port = start_test_server()
+    # The limit is read per connection, the handler pool was sized on start
+    server.max_connections = max_connections
+    return server, port
+
+def test_busy_frame_when_full():
+    """The connection over the limit is rejected with a retry hint"""
+    server, port = start_limited_server(2)
+    try:
+        first = login(port, 'first')
+        second = login(port, 'second')
+
+        extra = socket.create_connection(('localhost', port), timeout=5)
+        busy = receive_with_length(extra)
+        assert busy['type'] == 'SERVER_BUSY'
+        assert server.busy_retry_ms // 2 <= busy['retry_after_ms'] <= server.busy_retry_ms
+        assert receive_with_length(extra) is None
+        assert server.rejected_connections == 1
+
+        first.close()
+        second.close()
+        print("✅ Full server answers SERVER_BUSY")
+    finally:
+        server.shutdown_server()
+
+def test_slot_is_reused():
+    """A slot frees up when its client disconnects"""
+    server, port = start_limited_server(1)
+    try:
+        first = login(port, 'first')
+        first.close()
+
+        deadline = time.time() + 5
+        while server.active_connections and time.time() < deadline:
+            time.sleep(0.05)
+        assert server.active_connections == 0
+
+        login(port, 'second').close()
+        print("✅ Connection slots are reused")
+    finally:
+        server.shutdown_server()
+
+def main():
+    """Run all tests"""
+    print("=== Admission Control Test Suite ===")
+    tests = [test_busy_frame_when_full, test_slot_is_reused]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
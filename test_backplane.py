@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Test script for the backplane
+Runs two servers on one hub and checks rooms, private messages and nicknames span both
+"""
+
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import mock
+
+from backplane import BackplaneHub, HubBackplane, InProcessBackplane
+from server import ChatServer
+from test_helpers import send_with_length, receive_with_length, start_test_server, login, receive_type
+
+def start_workers(count):
+    """Start a hub and count servers connected to it, like launcher.py does"""
+    hub = BackplaneHub(os.path.join(tempfile.mkdtemp(), 'hub.sock'))
+    hub.start()
+
+    workers = []
+    for worker_id in range(count):
+        server, port = start_test_server(
+            backplane=lambda server, worker_id=worker_id: HubBackplane(server, hub.path, worker_id))
+        workers.append((server, port))
+    time.sleep(0.2)
+    return hub, workers
+
+def test_room_spans_workers():
+    """Room messages, private messages and LIST work across workers"""
+    hub, [(server_a, port_a), (server_b, port_b)] = start_workers(2)
+    try:
+        alice = login(port_a, 'alice')
+        bob = login(port_b, 'bob')
+        for sock in (alice, bob):
+            send_with_length(sock, json.dumps({'command': 'JOIN', 'content': 'lobby'}))
+            receive_type(sock, 'ROOM_JOINED')
+            time.sleep(0.1)
+        assert receive_type(alice, 'USER_JOINED')['content'] == 'bob joined the room'
+
+        send_with_length(alice, json.dumps({'command': 'MSG', 'content': 'hello from a'}))
+        assert receive_type(bob, 'PUBLIC_MSG')['content'] == 'alice: hello from a'
+
+        send_with_length(bob, json.dumps({'command': 'MSG', 'content': 'alice:psst'}))
+        assert receive_type(alice, 'PRIVATE_MSG')['content'] == 'Private from bob: psst'
+
+        send_with_length(bob, json.dumps({'command': 'LIST'}))
+        listing = receive_type(bob, 'LIST_RESPONSE')['content']
+        assert 'alice (lobby)' in listing and 'lobby (2 users)' in listing
+
+        alice.close()
+        bob.close()
+        print("✅ Rooms and private messages span workers")
+    finally:
+        server_a.shutdown_server()
+        server_b.shutdown_server()
+        hub.stop()
+
+def test_admin_room_removal_spans_workers():
+    """A room deleted by the admin panel disappears from LIST on other workers too"""
+    # Imported here so the other tests do not need Tk
+    from server_gui import EnhancedChatServer
+    hub, [(server_a, port_a), (server_b, port_b)] = start_workers(2)
+    try:
+        alice = login(port_a, 'alice')
+        bob = login(port_b, 'bob')
+        send_with_length(alice, json.dumps({'command': 'JOIN', 'content': 'lobby'}))
+        receive_type(alice, 'ROOM_JOINED')
+
+        server_a.room_actors.call('lobby', EnhancedChatServer.remove_room, server_a, 'lobby')
+        assert receive_type(alice, 'ADMIN_MSG')
+        time.sleep(0.2)
+
+        send_with_length(bob, json.dumps({'command': 'LIST'}))
+        listing = receive_type(bob, 'LIST_RESPONSE')
+        assert listing['presence']['users']['alice'] is None
+        assert 'lobby' not in listing['presence']['rooms']
+        alice.close()
+        bob.close()
+        print("✅ Admin room removal reaches other workers")
+    finally:
+        server_a.shutdown_server()
+        server_b.shutdown_server()
+        hub.stop()
+
+def test_nickname_unique_across_workers():
+    """A nickname in use on one worker is rejected on another"""
+    hub, [(server_a, port_a), (server_b, port_b)] = start_workers(2)
+    try:
+        alice = login(port_a, 'alice')
+        time.sleep(0.2)
+
+        duplicate = socket.create_connection(('localhost', port_b), timeout=5)
+        assert receive_with_length(duplicate)['type'] == 'NICK_REQUEST'
+        send_with_length(duplicate, 'alice')
+        assert receive_with_length(duplicate)['type'] == 'NICK_ERROR'
+        duplicate.close()
+
+        alice.close()
+        time.sleep(0.3)
+        login(port_b, 'alice').close()
+        print("✅ Nicknames are unique across workers")
+    finally:
+        server_a.shutdown_server()
+        server_b.shutdown_server()
+        hub.stop()
+
+def test_in_process_backplane():
+    """Two servers in one process share rooms through an in-process hub"""
+    hub = BackplaneHub()
+    servers = []
+    for node_id in ('a', 'b'):
+        server, port = start_test_server(
+            backplane=lambda server, node_id=node_id: InProcessBackplane(server, hub, node_id))
+        servers.append((server, port))
+    try:
+        alice = login(servers[0][1], 'alice')
+        bob = login(servers[1][1], 'bob')
+        for sock in (alice, bob):
+            send_with_length(sock, json.dumps({'command': 'JOIN', 'content': 'lobby'}))
+            receive_type(sock, 'ROOM_JOINED')
+
+        send_with_length(bob, json.dumps({'command': 'MSG', 'content': 'hi there'}))
+        assert receive_type(alice, 'PUBLIC_MSG')['content'] == 'bob: hi there'
+
+        send_with_length(alice, json.dumps({'command': 'MSG', 'content': 'bob:secret'}))
+        assert receive_type(bob, 'PRIVATE_MSG')['content'] == 'Private from alice: secret'
+
+        alice.close()
+        bob.close()
+        print("✅ In-process backplane connects servers")
+    finally:
+        for server, _ in servers:
+            server.shutdown_server()
+
+def test_given_backplane_is_the_only_one():
+    """A server built with its own backplane never connects the default one"""
+    hub = BackplaneHub(os.path.join(tempfile.mkdtemp(), 'hub.sock'))
+    hub.start()
+    try:
+        with mock.patch('server.InProcessBackplane') as default:
+            server = ChatServer('localhost', 0, lambda server: HubBackplane(server, hub.path, 'w'))
+        assert not default.called
+        assert isinstance(server.backplane, HubBackplane) and server.backplane.running
+        server.backplane.stop()
+        print("✅ Only the given backplane is connected")
+    finally:
+        hub.stop()
+
+def test_standalone_broker():
+    """Servers reach each other through a broker running in its own process"""
+    path = os.path.join(tempfile.mkdtemp(), 'broker.sock')
+    broker = subprocess.Popen([sys.executable, 'backplane.py', path],
+                              cwd=os.path.dirname(os.path.abspath(__file__)),
+                              stdout=subprocess.DEVNULL)
+    servers = []
+    try:
+        deadline = time.time() + 5
+        while not os.path.exists(path) and time.time() < deadline:
+            time.sleep(0.05)
+
+        for worker_id in ('a', 'b'):
+            server, port = start_test_server(
+                backplane=lambda server, worker_id=worker_id: HubBackplane(server, path, worker_id))
+            servers.append((server, port))
+        time.sleep(0.2)
+
+        alice = login(servers[0][1], 'alice')
+        bob = login(servers[1][1], 'bob')
+        time.sleep(0.2)
+        send_with_length(alice, json.dumps({'command': 'MSG', 'content': 'bob:via broker'}))
+        assert receive_type(bob, 'PRIVATE_MSG')['content'] == 'Private from alice: via broker'
+
+        alice.close()
+        bob.close()
+        print("✅ Standalone broker relays traffic")
+    finally:
+        for server, _ in servers:
+            server.shutdown_server()
+        broker.terminate()
+        broker.wait()
+
+def main():
+    """Run all tests"""
+    print("=== Backplane Test Suite ===")
+    tests = [test_room_spans_workers, test_admin_room_removal_spans_workers, test_nickname_unique_across_workers,
+             test_in_process_backplane, test_given_backplane_is_the_only_one, test_standalone_broker]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Test script for batched command frames
+Checks that a BATCH runs its commands in order and answers with one combined frame
+"""
+
+import json
+import threading
+
+from client import ChatClient
+from test_helpers import send_with_length, receive_with_length, start_test_server, login, receive_type
+
+def test_batch_combines_replies():
+    """Replies to each command come back grouped, in order, in one BATCH_RESULT"""
+    server, port = start_test_server()
+    try:
+        sock = login(port, 'bot')
+        send_with_length(sock, json.dumps({'command': 'BATCH', 'content': [
+            {'command': 'LEAVE'},
+            {'command': 'LIST'},
+            {'command': 'DANCE'},
+            {'command': 'BATCH', 'content': []},
+            'not a command',
+        ]}))
+        result = receive_type(sock, 'BATCH_RESULT')
+        types = [[reply['type'] for reply in replies] for replies in result['results']]
+        assert types == [['ERROR'], ['LIST_RESPONSE'], ['ERROR'], ['ERROR'], ['ERROR']]
+        assert "not in any room" in result['results'][0][0]['content']
+        assert "nested" in result['results'][3][0]['content']
+        assert server.commands.latency_summary()['LIST']['count'] == 1
+        sock.close()
+        print("✅ Batch replies come back in one frame")
+    finally:
+        server.shutdown_server()
+
+def test_batch_join_replies_in_slot():
+    """ROOM_JOINED from the room executor lands in its own command's slot"""
+    server, port = start_test_server()
+    try:
+        sock = login(port, 'hopper')
+        send_with_length(sock, json.dumps({'command': 'BATCH', 'content': [
+            {'command': 'JOIN', 'content': 'r1'},
+            {'command': 'LIST'},
+            {'command': 'JOIN', 'content': 'r2'},
+        ]}))
+        result = receive_type(sock, 'BATCH_RESULT')
+        types = [[reply['type'] for reply in replies] for replies in result['results']]
+        assert types == [['ROOM_JOINED'], ['LIST_RESPONSE'], ['ROOM_JOINED']]
+        assert result['results'][0][0]['content'] == "Joined room: r1"
+        assert result['results'][2][0]['content'] == "Joined room: r2"
+        sock.close()
+        print("✅ Batched JOIN replies come back in their slots")
+    finally:
+        server.shutdown_server()
+
+def test_batch_keeps_other_threads_frames():
+    """Frames other threads send to a batching client go out at once, not into its slot"""
+    server, port = start_test_server()
+    try:
+        sock = login(port, 'busy')
+        session = server.find_session('busy')
+        replies = []
+        server.reply_sink.value = (session, replies)
+        try:
+            server.send_message(session, "ROOM_JOINED", "reply to the batched command")
+            other = threading.Thread(target=server.send_message,
+                                     args=(session, "USER_JOINED", "someone joined"))
+            other.start()
+            other.join(5)
+        finally:
+            server.reply_sink.value = None
+        assert [json.loads(reply)['type'] for reply in replies] == ['ROOM_JOINED']
+        assert receive_type(sock, 'USER_JOINED')['content'] == "someone joined"
+        sock.close()
+        print("✅ Only the batched command's own replies are collected")
+    finally:
+        server.shutdown_server()
+
+def test_batch_limits():
+    """Empty and oversized batches are refused, rate limits apply per command"""
+    server, port = start_test_server()
+    try:
+        sock = login(port, 'bulk')
+        send_with_length(sock, json.dumps({'command': 'BATCH', 'content': []}))
+        assert receive_type(sock, 'ERROR')['content'] == "BATCH needs a list of commands!"
+
+        oversized = [{'command': 'LIST'}] * (server.max_batch_size + 1)
+        send_with_length(sock, json.dumps({'command': 'BATCH', 'content': oversized}))
+        assert "limited" in receive_type(sock, 'ERROR')['content']
+
+        # LIST allows a burst of 2, the third one in the batch is throttled
+        send_with_length(sock, json.dumps({'command': 'BATCH', 'content': [{'command': 'LIST'}] * 3}))
+        result = receive_type(sock, 'BATCH_RESULT')
+        assert [replies[0]['type'] for replies in result['results']] == \
+            ['LIST_RESPONSE', 'LIST_RESPONSE', 'THROTTLED']
+        sock.close()
+        print("✅ Batch size limits and per-command rate limits")
+    finally:
+        server.shutdown_server()
+
+def test_client_send_batch():
+    """ChatClient.send_batch joins a room and messages it in one frame"""
+    server, port = start_test_server()
+    try:
+        listener = login(port, 'listener')
+        send_with_length(listener, json.dumps({'command': 'JOIN', 'content': 'lobby'}))
+        receive_type(listener, 'ROOM_JOINED')
+
+        client = ChatClient('localhost', port)
+        assert client.connect_to_server()
+        client.client_socket.settimeout(5)
+        assert receive_with_length(client.client_socket)['type'] == 'NICK_REQUEST'
+        send_with_length(client.client_socket, 'scripted')
+        assert receive_with_length(client.client_socket)['type'] == 'NICK_ACCEPTED'
+
+        client.send_batch([('JOIN', 'lobby'), ('MSG', 'hello from a batch')])
+        assert receive_type(listener, 'USER_JOINED')
+        assert receive_type(listener, 'PUBLIC_MSG')['content'] == "scripted: hello from a batch"
+        assert receive_type(client.client_socket, 'BATCH_RESULT')
+        client.client_socket.close()
+        listener.close()
+        print("✅ ChatClient sends batches")
+    finally:
+        server.shutdown_server()
+
+def main():
+    """Run all tests"""
+    print("=== Batch Test Suite ===")
+    tests = [test_batch_combines_replies, test_batch_join_replies_in_slot,
+             test_batch_keeps_other_threads_frames, test_batch_limits,
+             test_client_send_batch]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Test script for the coarse clock
+Checks that timestamps are formatted once a second and the millisecond epoch never goes backwards
+"""
+
+import time
+from unittest import mock
+
+from clock import CoarseClock
+
+def test_timestamp_cached_per_second():
+    """Calls within the same second reuse the formatted string"""
+    clock = CoarseClock()
+    with mock.patch('clock.time.time', return_value=1000.2), \
+         mock.patch('clock.time.strftime', wraps=time.strftime) as strftime:
+        first = clock.timestamp()
+        for _ in range(100):
+            assert clock.timestamp() is first
+        assert strftime.call_count == 1
+
+    with mock.patch('clock.time.time', return_value=1001.0):
+        later = clock.timestamp()
+    assert later != first
+    assert later == time.strftime("%H:%M:%S", time.localtime(1001))
+    print("✅ Timestamps are formatted once per second")
+
+def test_epoch_ms_is_monotonic():
+    """The millisecond epoch only moves forward and tracks elapsed time"""
+    clock = CoarseClock()
+    readings = [clock.epoch_ms() for _ in range(1000)]
+    assert readings == sorted(readings)
+    before = clock.epoch_ms()
+    time.sleep(0.05)
+    assert 40 <= clock.epoch_ms() - before < 1000
+    # A Unix epoch, so other processes can compare it with their own clocks
+    assert abs(clock.epoch_ms() - time.time() * 1000) < 1000
+    print("✅ Millisecond epoch is monotonic and follows the wall clock")
+
+def main():
+    """Run all tests"""
+    print("=== Clock Test Suite ===")
+    tests = [test_timestamp_cached_per_second, test_epoch_ms_is_monotonic]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Test script for cluster mode
+Runs three nodes on localhost and checks rooms, private messages and nicknames span the mesh
+"""
+
+import json
+import socket
+import time
+
+from cluster import HashRing, ClusterBackplane
+from test_helpers import send_with_length, receive_with_length, start_test_server, login, receive_type
+
+def free_port():
+    """Pick an unused localhost port"""
+    probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    probe.bind(('localhost', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+    return port
+
+def start_nodes(node_ids):
+    """Start one server per node id, all meshed together"""
+    nodes = {node_id: ('localhost', free_port()) for node_id in node_ids}
+    started = []
+    for node_id in node_ids:
+        peers = {peer_id: address for peer_id, address in nodes.items() if peer_id != node_id}
+
+        def build(server, node_id=node_id, peers=peers):
+            backplane = ClusterBackplane(server, node_id, nodes[node_id], peers)
+            backplane.retry_interval = 0.1
+            return backplane
+        server, port = start_test_server(backplane=build)
+        started.append((server, port))
+
+    # Wait until every node sees the whole mesh
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        if all(len(server.backplane.links) == len(node_ids) - 1 for server, _ in started):
+            break
+        time.sleep(0.05)
+    return started
+
+def stop_nodes(nodes):
+    """Shut every node down"""
+    for server, _ in nodes:
+        server.shutdown_server()
+        server.backplane.stop()
+
+def test_hash_ring():
+    """Keys spread over every node and only the removed node's keys move"""
+    ring = HashRing()
+    for node_id in ('a', 'b', 'c'):
+        ring.add(node_id)
+    rooms = [f"room{i}" for i in range(300)]
+    before = {room: ring.node_for(room) for room in rooms}
+    assert set(before.values()) == {'a', 'b', 'c'}
+
+    ring.remove('c')
+    after = {room: ring.node_for(room) for room in rooms}
+    moved = [room for room in rooms if before[room] != after[room]]
+    assert all(before[room] == 'c' for room in moved)
+    assert 'c' not in after.values()
+    print("✅ Hash ring spreads and rebalances rooms")
+
+def test_room_spans_nodes():
+    """Room messages go through the owner to every node with members"""
+    nodes = start_nodes(['a', 'b', 'c'])
+    try:
+        users = [login(port, f"user{i}") for i, (_, port) in enumerate(nodes)]
+        for sock in users:
+            send_with_length(sock, json.dumps({'command': 'JOIN', 'content': 'lobby'}))
+            receive_type(sock, 'ROOM_JOINED')
+            time.sleep(0.1)
+
+        send_with_length(users[0], json.dumps({'command': 'MSG', 'content': 'hello mesh'}))
+        for sock in users[1:]:
+            assert receive_type(sock, 'PUBLIC_MSG')['content'] == 'user0: hello mesh'
+
+        send_with_length(users[2], json.dumps({'command': 'MSG', 'content': 'user0:psst'}))
+        assert receive_type(users[0], 'PRIVATE_MSG')['content'] == 'Private from user2: psst'
+
+        for sock in users:
+            sock.close()
+        print("✅ Rooms and private messages span nodes")
+    finally:
+        stop_nodes(nodes)
+
+def test_nickname_unique_across_nodes():
+    """A nickname in use on one node is rejected on the others"""
+    nodes = start_nodes(['a', 'b'])
+    try:
+        alice = login(nodes[0][1], 'alice')
+        time.sleep(0.2)
+
+        duplicate = socket.create_connection(('localhost', nodes[1][1]), timeout=5)
+        assert receive_with_length(duplicate)['type'] == 'NICK_REQUEST'
+        send_with_length(duplicate, 'alice')
+        assert receive_with_length(duplicate)['type'] == 'NICK_ERROR'
+        duplicate.close()
+
+        alice.close()
+        time.sleep(0.3)
+        login(nodes[1][1], 'alice').close()
+        print("✅ Nicknames are unique across nodes")
+    finally:
+        stop_nodes(nodes)
+
+def main():
+    """Run all tests"""
+    print("=== Cluster Test Suite ===")
+    tests = [test_hash_ring, test_room_spans_nodes, test_nickname_unique_across_nodes]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test script for the command registry
+Checks middleware order and skipping, latency histograms and dispatch through a live server
+"""
+
+import json
+
+from commands import CommandRegistry, LatencyHistogram
+from test_helpers import send_with_length, start_test_server, login, receive_type
+
+def test_middleware_wraps_in_order():
+    """Middleware runs outermost first, can stop a command, and skipped middleware is left out"""
+    calls = []
+    registry = CommandRegistry()
+
+    def outer(command, call_next, session, message):
+        calls.append('outer')
+        call_next(session, message)
+
+    def gate(command, call_next, session, message):
+        calls.append('gate')
+        if message.get('content') != 'blocked':
+            call_next(session, message)
+
+    registry.register('MSG', lambda session, message: calls.append(f"MSG {message['content']}"))
+    registry.register('PING', lambda session, message: calls.append('PING'), skip=(gate,))
+    registry.use(outer)
+    registry.use(gate)
+
+    assert registry.dispatch(None, {'command': 'MSG', 'content': 'hi'})
+    assert registry.dispatch(None, {'command': 'msg', 'content': 'blocked'})
+    assert registry.dispatch(None, {'command': 'PING'})
+    assert not registry.dispatch(None, {'command': 'NOPE'})
+    assert calls == ['outer', 'gate', 'MSG hi', 'outer', 'gate', 'outer', 'PING']
+    print("✅ Middleware runs in order and can be skipped per command")
+
+def test_histogram_percentiles():
+    """Samples land in buckets and percentiles report bucket upper bounds"""
+    histogram = LatencyHistogram()
+    assert histogram.percentile(0.5) is None
+    for _ in range(98):
+        histogram.record(0.0008)  # 0.8 ms
+    histogram.record(0.04)
+    histogram.record(5.0)
+    summary = histogram.summary()
+    assert summary['count'] == 100
+    assert summary['p50_ms'] == 1
+    assert summary['p99_ms'] == 50
+    assert histogram.percentile(1.0) == float('inf')
+    print("✅ Latency histogram percentiles")
+
+def test_server_records_latency_per_command():
+    """Commands sent to a server are timed under their own name, heartbeats are not"""
+    server, port = start_test_server()
+    try:
+        sock = login(port, 'timer')
+        send_with_length(sock, json.dumps({'command': 'JOIN', 'content': 'lobby'}))
+        receive_type(sock, 'ROOM_JOINED')
+        send_with_length(sock, json.dumps({'command': 'LIST'}))
+        receive_type(sock, 'LIST_RESPONSE')
+        send_with_length(sock, json.dumps({'command': 'PING'}))
+        receive_type(sock, 'PONG')
+        send_with_length(sock, json.dumps({'command': 'DANCE'}))
+        assert receive_type(sock, 'ERROR')['content'] == "Unknown command!"
+
+        latency = server.commands.latency_summary()
+        assert latency['JOIN']['count'] == 1 and latency['LIST']['count'] == 1
+        assert 'PING' not in latency
+        sock.close()
+        print("✅ Server records latency for each command")
+    finally:
+        server.shutdown_server()
+
+def main():
+    """Run all tests"""
+    print("=== Command Registry Test Suite ===")
+    tests = [test_middleware_wraps_in_order, test_histogram_percentiles,
+             test_server_records_latency_per_command]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
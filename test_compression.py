@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Test script for per-connection compression
+Checks the deflate framing, skipping compressed file types and negotiation at login
+"""
+
+import base64
+import json
+
+from client import ChatClient
+from compression import (FrameCompressor, FrameDecompressor, carries_precompressed_file,
+                         is_precompressed)
+from test_helpers import send_with_length, receive_with_length, start_test_server, login, receive_type
+
+def receive_frame(sock, decompressor):
+    """Read one length-prefixed frame and decode it"""
+    length = int.from_bytes(sock.recv(4), byteorder='big')
+    data = b''
+    while len(data) < length:
+        data += sock.recv(length - len(data))
+    return json.loads(decompressor.decode(data).decode('utf-8'))
+
+def receive_frame_type(sock, decompressor, msg_type):
+    """Read frames until one of the given type arrives"""
+    while True:
+        message = receive_frame(sock, decompressor)
+        if message['type'] == msg_type:
+            return message
+
+def test_stream_round_trip():
+    """Repetitive chat frames shrink a lot and decode in order, raw frames pass through"""
+    compressor = FrameCompressor()
+    decompressor = FrameDecompressor()
+    frames = [json.dumps({'type': 'PUBLIC_MSG', 'content': f"alice: message {n}",
+                          'timestamp': '12:00:00', 'seq': n}).encode('utf-8') for n in range(200)]
+    for n, frame in enumerate(frames):
+        encoded = compressor.encode(frame, compress=n % 10 != 0)
+        assert decompressor.decode(encoded) == frame
+    assert compressor.bytes_out * 3 < compressor.bytes_in
+    print(f"✅ {compressor.bytes_in} bytes of frames sent as {compressor.bytes_out}")
+
+def test_precompressed_files_are_skipped():
+    """Large frames carrying images or archives are left alone, text files are compressed"""
+    assert is_precompressed('photo.JPG') and is_precompressed('bundle.zip')
+    assert not is_precompressed('notes.txt')
+
+    def file_frame(filename):
+        return json.dumps({'type': 'FILE_RECEIVED', 'file_info': {'filename': filename},
+                           'file_content': base64.b64encode(b'x' * 8192).decode()}).encode()
+
+    assert carries_precompressed_file(file_frame('clip.mp4'))
+    assert not carries_precompressed_file(file_frame('data.csv'))
+    # Small frames are not worth looking into
+    assert not carries_precompressed_file(b'{"file_info": {"filename": "a.jpg"}}')
+    print("✅ Already compressed file types are skipped")
+
+def test_oversized_frame_is_refused():
+    """A frame that inflates beyond max_size is an error, not an allocation"""
+    compressor = FrameCompressor()
+    decompressor = FrameDecompressor(max_size=1024)
+    try:
+        decompressor.decode(compressor.encode(b'0' * 100000))
+    except ValueError:
+        print("✅ Oversized frames are refused")
+        return
+    raise AssertionError("frame was inflated")
+
+def test_negotiated_at_login():
+    """A ChatClient that asks for compression in HELLO gets it, plain clients in the same room do not"""
+    server, port = start_test_server()
+    try:
+        plain = login(port, 'plain')
+        send_with_length(plain, json.dumps({'command': 'JOIN', 'content': 'lobby'}))
+        receive_type(plain, 'ROOM_JOINED')
+
+        client = ChatClient('localhost', port)
+        client.nickname = 'squeezed'
+        assert client.connect_to_server()
+        client.client_socket.settimeout(5)
+        client.send_hello('lobby')
+        request = receive_with_length(client.client_socket)
+        assert request['capabilities'] == ['zlib', 'presence']
+        client.handle_nickname_request(request)
+
+        accepted = receive_frame(client.client_socket, client.decompressor)
+        assert accepted['type'] == 'NICK_ACCEPTED' and accepted['capabilities'] == ['zlib']
+        receive_frame_type(client.client_socket, client.decompressor, 'ROOM_JOINED')
+        for n in range(5):
+            client.send_message('MSG', f"compressed hello {n}")
+        for n in range(5):
+            assert receive_type(plain, 'PUBLIC_MSG')['content'] == f"squeezed: compressed hello {n}"
+        receive_frame_type(client.client_socket, client.decompressor, 'PUBLIC_MSG')
+
+        session = server.find_session('squeezed')
+        assert session.compressor.bytes_out < session.compressor.bytes_in
+        assert server.find_session('plain').compressor is None
+        client.client_socket.close()
+        plain.close()
+        print("✅ Compression is negotiated per connection")
+    finally:
+        server.shutdown_server()
+
+def main():
+    """Run all tests"""
+    print("=== Compression Test Suite ===")
+    tests = [test_stream_round_trip, test_precompressed_files_are_skipped,
+             test_oversized_frame_is_refused, test_negotiated_at_login]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
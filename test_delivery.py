@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Test script for delivery acknowledgements
+Checks sequence numbers, cumulative ACKs and retransmission after a reconnect
+"""
+
+import json
+import threading
+import time
+
+from client import ChatClient
+from delivery import DeliveryStream, IdempotencyCache
+from protocol import RecentCommands
+from test_helpers import send_with_length, receive_with_length, start_test_server, login, receive_type
+
+def test_stream_cumulative_ack():
+    """An ACK releases every frame up to its sequence number"""
+    stream = DeliveryStream('alice')
+    frames = [stream.track(json.dumps({'type': 'PUBLIC_MSG', 'content': str(i)}).encode()) for i in range(3)]
+    assert [json.loads(frame)['seq'] for frame in frames] == [1, 2, 3]
+
+    stream.ack(2)
+    assert [json.loads(frame)['content'] for frame in stream.pending()] == ['2']
+    stream.ack(1)
+    assert len(stream.pending()) == 1
+    print("✅ Cumulative ACK releases frames")
+
+def test_stream_is_bounded():
+    """The oldest unacknowledged frames are dropped past the limit"""
+    stream = DeliveryStream('alice', max_frames=2)
+    for i in range(4):
+        stream.track(json.dumps({'type': 'PUBLIC_MSG', 'content': str(i)}).encode())
+    assert [json.loads(frame)['seq'] for frame in stream.pending()] == [3, 4]
+    print("✅ Delivery stream is bounded")
+
+def test_retransmit_after_reconnect():
+    """Frames that were never acknowledged come back with the same seq"""
+    server, port = start_test_server()
+    try:
+        alice = login(port, 'alice')
+        send_with_length(alice, json.dumps({'command': 'JOIN', 'content': 'lobby'}))
+        assert receive_with_length(alice)['type'] == 'ROOM_JOINED'
+
+        bob = login(port, 'bob')
+        send_with_length(bob, json.dumps({'command': 'JOIN', 'content': 'lobby'}))
+        assert receive_with_length(bob)['type'] == 'ROOM_JOINED'
+
+        assert receive_with_length(alice)['type'] == 'USER_JOINED'
+        send_with_length(bob, json.dumps({'command': 'MSG', 'content': 'first'}))
+        send_with_length(bob, json.dumps({'command': 'MSG', 'content': 'second'}))
+        first = receive_with_length(alice)
+        second = receive_with_length(alice)
+        assert first['content'] == 'bob: first' and second['seq'] == first['seq'] + 1
+
+        # Only the first message is acknowledged before the connection drops
+        send_with_length(alice, json.dumps({'command': 'ACK', 'content': first['seq']}))
+        time.sleep(0.2)
+        alice.close()
+        time.sleep(0.2)
+
+        alice = login(port, 'alice')
+        resent = receive_with_length(alice)
+        assert resent['seq'] == second['seq'] and resent['content'] == 'bob: second'
+
+        alice.close()
+        bob.close()
+        print("✅ Unacknowledged frames retransmitted after reconnect")
+    finally:
+        server.shutdown_server()
+
+def test_idempotency_cache_window():
+    """IDs are remembered per nickname, within the window and size cap"""
+    cache = IdempotencyCache(window_seconds=60, max_entries=2)
+    assert not cache.check_and_add('alice', 'a1')
+    assert cache.check_and_add('alice', 'a1')
+    assert not cache.check_and_add('bob', 'a1')
+
+    # A third ID pushes the oldest one out of the capped cache
+    assert not cache.check_and_add('alice', 'a2')
+    assert not cache.check_and_add('alice', 'a1')
+    print("✅ Idempotency cache is windowed and capped")
+
+def test_retried_message_is_ignored():
+    """Resending a MSG with the same msg_id does not broadcast it twice"""
+    server, port = start_test_server()
+    try:
+        alice = login(port, 'alice')
+        send_with_length(alice, json.dumps({'command': 'JOIN', 'content': 'lobby'}))
+        assert receive_with_length(alice)['type'] == 'ROOM_JOINED'
+
+        command = json.dumps({'command': 'MSG', 'content': 'only once', 'msg_id': 'retry-1'})
+        send_with_length(alice, command)
+        send_with_length(alice, command)
+        send_with_length(alice, json.dumps({'command': 'MSG', 'content': 'next', 'msg_id': 'retry-2'}))
+
+        assert receive_with_length(alice)['content'] == 'You: only once'
+        assert receive_with_length(alice)['content'] == 'You: next'
+        alice.close()
+        print("✅ Retried command is a no-op")
+    finally:
+        server.shutdown_server()
+
+def test_recent_commands_window():
+    """Clients keep what they sent inside the window for a resend, oldest first"""
+    recent = RecentCommands(window=60, max_bytes=10)
+    recent.add(b'12345')
+    recent.add(b'67890', compress=False)
+    assert recent.pending() == [(b'12345', True), (b'67890', False)]
+    recent.add(b'abc')  # Past max_bytes, the oldest goes
+    assert [message_bytes for message_bytes, _ in recent.pending()] == [b'67890', b'abc']
+    recent.window = 0
+    assert recent.pending() == []
+    print("✅ Recent commands are windowed and capped")
+
+def test_client_resends_after_reconnect():
+    """A reconnecting client resends its recent commands with the same msg_id and the server skips them"""
+    server, port = start_test_server()
+    try:
+        bystander = login(port, 'bystander')
+        send_with_length(bystander, json.dumps({'command': 'JOIN', 'content': 'lobby'}))
+        receive_type(bystander, 'ROOM_JOINED')
+
+        client = ChatClient('localhost', port)
+        client.nickname = 'resender'
+        assert client.connect_to_server()
+        client.send_hello('lobby')
+        thread = threading.Thread(target=client.receive_messages)
+        thread.daemon = True
+        thread.start()
+        receive_type(bystander, 'USER_JOINED')
+
+        client.send_message('MSG', 'handled')
+        assert receive_type(bystander, 'PUBLIC_MSG')['content'] == 'resender: handled'
+        client.send_message('MSG', 'lost')
+        assert receive_type(bystander, 'PUBLIC_MSG')['content'] == 'resender: lost'
+        # Forget the second ID, as if that frame had died with the connection
+        lost_id = json.loads(client.recent_commands.pending()[1][0])['msg_id']
+        del server.recent_commands.entries[('resender', lost_id)]
+
+        # The old connection goes away and the client logs back in on its own
+        old_session = server.find_session('resender')
+        server.send_json(old_session, {'type': 'RECONNECT', 'content': 'moving', 'retry_after_ms': 200})
+        receive_type(bystander, 'USER_JOINED')
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            session = server.find_session('resender')
+            if session and session is not old_session and session.commands_received >= 2:
+                break
+            time.sleep(0.05)
+        client.send_message('MSG', 'after')
+
+        # Only the forgotten command runs again, then the new one
+        assert receive_type(bystander, 'PUBLIC_MSG')['content'] == 'resender: lost'
+        assert receive_type(bystander, 'PUBLIC_MSG')['content'] == 'resender: after'
+        client.connected = False
+        client.client_socket.close()
+        bystander.close()
+        print("✅ Reconnected client resends with the same msg_id, only lost commands run")
+    finally:
+        server.shutdown_server()
+
+def main():
+    """Run all tests"""
+    print("=== Delivery Acknowledgement Test Suite ===")
+    tests = [test_stream_cumulative_ack, test_stream_is_bounded, test_retransmit_after_reconnect,
+             test_idempotency_cache_window, test_retried_message_is_ignored,
+             test_recent_commands_window, test_client_resends_after_reconnect]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Test script for parallel room fan-out
+Checks that large rooms are split across the pool and members keep message order
+"""
+
+import json
+import threading
+import time
+
+from fanout import FanoutPool
+from test_helpers import send_with_length, start_test_server, login, receive_type
+
+def test_pool_runs_slices_in_parallel():
+    """Slow recipients on different workers are served at the same time"""
+    pool = FanoutPool(workers=4, threshold=1)
+    recipients = [object() for _ in range(40)]
+    delivered = []
+    lock = threading.Lock()
+
+    def slow_send(recipient):
+        time.sleep(0.01)
+        with lock:
+            delivered.append(recipient)
+
+    start = time.time()
+    job = pool.submit(recipients, slow_send)
+    assert job.wait(5)
+    elapsed = time.time() - start
+    pool.stop()
+
+    assert len(delivered) == 40
+    assert elapsed < 0.4 * 0.8, f"fan-out took {elapsed:.2f}s"
+    print("✅ Fan-out pool delivers slices in parallel")
+
+def test_pool_keeps_order_per_recipient():
+    """Messages to one recipient arrive in submission order"""
+    pool = FanoutPool(workers=4, threshold=1)
+    recipients = [object() for _ in range(8)]
+    received = {id(recipient): [] for recipient in recipients}
+
+    jobs = []
+    for n in range(20):
+        jobs.append(pool.submit(recipients, lambda recipient, n=n: received[id(recipient)].append(n)))
+    for job in jobs:
+        assert job.wait(5)
+    pool.stop()
+
+    assert all(values == list(range(20)) for values in received.values())
+    print("✅ Fan-out keeps per-recipient order")
+
+def test_large_room_uses_pool():
+    """A room above the threshold is delivered through the pool"""
+    server, port = start_test_server()
+    server.fanout_pool.threshold = 3
+    try:
+        members = [login(port, f"member{i}") for i in range(5)]
+        for sock in members:
+            send_with_length(sock, json.dumps({'command': 'JOIN', 'content': 'hall'}))
+            receive_type(sock, 'ROOM_JOINED')
+
+        send_with_length(members[0], json.dumps({'command': 'MSG', 'content': 'first'}))
+        send_with_length(members[0], json.dumps({'command': 'MSG', 'content': 'second'}))
+        for sock in members[1:]:
+            assert receive_type(sock, 'PUBLIC_MSG')['content'] == 'member0: first'
+            assert receive_type(sock, 'PUBLIC_MSG')['content'] == 'member0: second'
+        assert 'hall' in server.fanout_jobs
+
+        for sock in members:
+            sock.close()
+        print("✅ Large rooms are delivered by the fan-out pool")
+    finally:
+        server.shutdown_server()
+
+def main():
+    """Run all tests"""
+    print("=== Fan-out Test Suite ===")
+    tests = [test_pool_runs_slices_in_parallel, test_pool_keeps_order_per_recipient, test_large_room_uses_pool]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
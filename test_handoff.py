@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Test script for zero-downtime restarts
+Checks that a successor server takes over the listening socket and clients resume
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+from handoff import HandoffListener, request_listener, HANDOFF_SUPPORTED
+from server import ChatServer
+from test_helpers import send_with_length, receive_with_length, start_test_server, login
+
+def start_successor(port, snapshot_path, listener):
+    """Start a second server on an inherited listening socket"""
+    server = ChatServer('localhost', port)
+    server.snapshot_path = snapshot_path
+    thread = threading.Thread(target=server.start_server, args=(listener,))
+    thread.daemon = True
+    thread.start()
+    time.sleep(0.3)
+    return server
+
+def test_release_listener_asks_clients_to_resume():
+    """Clients get a RECONNECT hint and come back to the same room on the successor"""
+    snapshot_path = os.path.join(tempfile.mkdtemp(), 'snapshot.pkl')
+    old_server, port = start_test_server(snapshot_path)
+    alice = login(port, 'alice')
+    send_with_length(alice, json.dumps({'command': 'JOIN', 'content': 'lobby'}))
+    assert receive_with_length(alice)['type'] == 'ROOM_JOINED'
+
+    listener = old_server.release_listener()
+    assert listener is not None
+    hint = receive_with_length(alice)
+    assert hint['type'] == 'RECONNECT' and hint['retry_after_ms'] > 0
+
+    # The old server's workers go away with it instead of leaking on every restart
+    workers = old_server.room_actors.threads + old_server.fanout_pool.threads + [old_server.write_flusher.thread]
+    for thread in workers:
+        thread.join(2)
+    assert not any(thread.is_alive() for thread in workers)
+    assert not old_server.backplane.running
+
+    new_server = start_successor(port, snapshot_path, listener)
+    try:
+        alice = login(port, 'alice')
+        rejoined = receive_with_length(alice)
+        assert rejoined['type'] == 'ROOM_JOINED' and rejoined['content'].endswith('lobby')
+        alice.close()
+        print("✅ Clients resume on the successor server")
+    finally:
+        new_server.shutdown_server()
+
+def test_listener_passed_over_unix_socket():
+    """A successor receives the listening socket through SCM_RIGHTS"""
+    if not HANDOFF_SUPPORTED:
+        print("⚠️ Listener handoff not supported on this platform, skipping")
+        return
+
+    handoff_path = os.path.join(tempfile.mkdtemp(), 'handoff.sock')
+    old_server, port = start_test_server()
+    handoff = HandoffListener(old_server, handoff_path)
+    assert handoff.start()
+
+    listener = request_listener(handoff_path)
+    assert listener is not None and listener.getsockname()[1] == port
+    assert handoff.finished.wait(5)
+
+    new_server = start_successor(port, None, listener)
+    try:
+        bob = login(port, 'bob')
+        bob.close()
+        assert not old_server.running and new_server.running
+        print("✅ Listening socket handed over a UNIX socket")
+    finally:
+        new_server.shutdown_server()
+
+def main():
+    """Run all tests"""
+    print("=== Handoff Test Suite ===")
+    tests = [test_release_listener_asks_clients_to_resume, test_listener_passed_over_unix_socket]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Test script for heartbeats and idle connection reaping
+Checks the timer wheel and that silent clients are dropped within seconds
+"""
+
+import json
+import socket
+import threading
+import time
+
+from heartbeat import TimerWheel
+from test_helpers import send_with_length, receive_with_length, start_test_server, login, receive_type
+
+def test_wheel_expires_in_order():
+    """Keys come out once their deadline passes, pushed back keys come out later"""
+    wheel = TimerWheel(tick=1.0, slots=8, now=0)
+    wheel.schedule('a', 2.5)
+    wheel.schedule('b', 3.5)
+    wheel.schedule('c', 4.5)
+    wheel.schedule('b', 20.5)  # Refreshed, stays in its old slot for now
+    wheel.cancel('c')
+
+    assert wheel.advance(2.0) == []
+    assert wheel.advance(3.0) == ['a']
+    assert wheel.advance(10.0) == []
+    assert wheel.advance(21.0) == ['b']
+    assert len(wheel) == 0
+    print("✅ Timer wheel expires keys at their deadlines")
+
+def test_wheel_catches_up_after_stall():
+    """Advancing past a whole rotation still finds every due key"""
+    wheel = TimerWheel(tick=1.0, slots=4, now=0)
+    for n in range(10):
+        wheel.schedule(n, n + 0.5)
+    wheel.schedule('later', 30.5)
+    assert sorted(wheel.advance(12.0)) == list(range(10))
+    assert wheel.advance(31.0) == ['later']
+    print("✅ Timer wheel catches up after a stall")
+
+def answer_pings(sock):
+    """Reply to every PING until the socket closes"""
+    try:
+        while True:
+            message = receive_with_length(sock)
+            if message is None:
+                break
+            if message['type'] == 'PING':
+                send_with_length(sock, json.dumps({'command': 'PONG'}))
+    except OSError:
+        pass
+
+def test_silent_client_is_reaped():
+    """A client that ignores PING loses its session and nickname, one that answers stays"""
+    server, port = start_test_server()
+    try:
+        server.heartbeat_interval = 1
+        server.heartbeat_timeout = 1
+        silent = login(port, 'silent')
+        lively = login(port, 'lively')
+        send_with_length(lively, json.dumps({'command': 'JOIN', 'content': 'lobby'}))
+        receive_type(lively, 'ROOM_JOINED')
+
+        responder = threading.Thread(target=answer_pings, args=(lively,))
+        responder.daemon = True
+        responder.start()
+        assert receive_type(silent, 'PING')
+
+        deadline = time.time() + 5
+        while 'silent' in server.nicknames and time.time() < deadline:
+            time.sleep(0.1)
+        assert 'silent' not in server.nicknames
+        time.sleep(2)
+        assert 'lively' in server.nicknames
+        assert server.reaped_connections == 1
+
+        # The nickname can be used again straight away
+        again = login(port, 'silent')
+        again.close()
+        silent.close()
+        lively.close()
+        print("✅ Silent clients are reaped and their nickname freed")
+    finally:
+        server.shutdown_server()
+
+def test_login_timeout():
+    """A connection that never sends a nickname is closed"""
+    server, port = start_test_server()
+    try:
+        server.login_timeout = 1
+        sock = socket.create_connection(('localhost', port), timeout=5)
+        assert receive_with_length(sock)['type'] == 'NICK_REQUEST'
+        time.sleep(2.5)
+        assert sock.recv(4096) == b''
+        sock.close()
+        print("✅ Connections that never log in are closed")
+    finally:
+        server.shutdown_server()
+
+def test_slow_upload_is_not_reaped():
+    """A frame that takes longer than the heartbeat timeout to arrive keeps the client alive"""
+    server, port = start_test_server()
+    try:
+        server.heartbeat_interval = 1
+        server.heartbeat_timeout = 1
+        uploader = login(port, 'uploader')
+
+        # About four seconds for one frame, twice the time a silent client gets
+        frame = json.dumps({'command': 'LIST', 'content': 'x' * 8000}).encode('utf-8')
+        uploader.sendall(len(frame).to_bytes(4, byteorder='big'))
+        for start in range(0, len(frame), 1000):
+            uploader.sendall(frame[start:start + 1000])
+            time.sleep(0.5)
+
+        assert receive_type(uploader, 'LIST_RESPONSE')
+        assert 'uploader' in server.nicknames and server.reaped_connections == 0
+        uploader.close()
+        print("✅ Slow uploads are not reaped")
+    finally:
+        server.shutdown_server()
+
+def test_ping_never_blocks_heartbeat():
+    """Pinging a client that stopped reading does not block, one too far behind is reaped"""
+    server, port = start_test_server()
+    try:
+        stuck = login(port, 'stuck')
+        session = server.find_session('stuck')
+        # Far more than the socket buffers hold, and the client never reads it
+        session.writer.append(b'x' * (4 * 1024 * 1024))
+
+        pinger = threading.Thread(target=server.connection_idle, args=(session,))
+        pinger.start()
+        pinger.join(2)
+        assert not pinger.is_alive()
+        assert 'stuck' in server.nicknames
+
+        server.pinged.discard(session)
+        session.writer.max_backlog = 1024
+        server.connection_idle(session)
+        assert server.reaped_connections == 1 and 'stuck' not in server.nicknames
+        stuck.close()
+        print("✅ PING never blocks the heartbeat thread")
+    finally:
+        server.shutdown_server()
+
+def main():
+    """Run all tests"""
+    print("=== Heartbeat Test Suite ===")
+    tests = [test_wheel_expires_in_order, test_wheel_catches_up_after_stall,
+             test_silent_client_is_reaped, test_login_timeout, test_slow_upload_is_not_reaped,
+             test_ping_never_blocks_heartbeat]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Test script for the pipelined HELLO login
+Checks that login and the first join finish without waiting for NICK_REQUEST, and bad logins are refused
+"""
+
+import json
+import socket
+
+from protocol import PROTOCOL_VERSION, hello_frame
+from test_helpers import send_with_length, receive_with_length, start_test_server, login, receive_type
+
+def connect(port):
+    """Open a connection without logging in"""
+    return socket.create_connection(('localhost', port), timeout=5)
+
+def test_hello_logs_in_and_joins():
+    """HELLO sent straight after connecting logs in and joins the room in one round trip"""
+    server, port = start_test_server()
+    try:
+        listener = login(port, 'listener')
+        send_with_length(listener, json.dumps({'command': 'JOIN', 'content': 'lobby'}))
+        receive_type(listener, 'ROOM_JOINED')
+
+        sock = connect(port)
+        send_with_length(sock, json.dumps(hello_frame('eager', room='lobby')))
+        # Everything below was on its way before we read a single frame
+        request = receive_with_length(sock)
+        assert request['type'] == 'NICK_REQUEST' and request['version'] == PROTOCOL_VERSION
+        accepted = receive_with_length(sock)
+        assert accepted['type'] == 'NICK_ACCEPTED' and accepted['capabilities'] == []
+        assert receive_type(sock, 'ROOM_JOINED')['content'] == "Joined room: lobby"
+        assert receive_type(listener, 'USER_JOINED')['content'] == "eager joined the room"
+        sock.close()
+        listener.close()
+        print("✅ HELLO logs in and joins in one round trip")
+    finally:
+        server.shutdown_server()
+
+def test_bad_logins_are_refused():
+    """Commands before login, unsupported versions and taken nicknames get NICK_ERROR"""
+    server, port = start_test_server()
+    try:
+        taken = login(port, 'taken')
+        attempts = [
+            ({'command': 'JOIN', 'content': 'lobby'}, "Invalid nickname format!"),
+            (dict(hello_frame('future'), version=0), "Unsupported protocol version!"),
+            (hello_frame('taken'), "Nickname already taken or invalid!"),
+        ]
+        for frame, error in attempts:
+            sock = connect(port)
+            send_with_length(sock, json.dumps(frame))
+            assert receive_with_length(sock)['type'] == 'NICK_REQUEST'
+            reply = receive_with_length(sock)
+            assert reply['type'] == 'NICK_ERROR' and reply['content'] == error
+            sock.close()
+        taken.close()
+        print("✅ Bad logins are refused")
+    finally:
+        server.shutdown_server()
+
+def main():
+    """Run all tests"""
+    print("=== HELLO Login Test Suite ===")
+    tests = [test_hello_logs_in_and_joins, test_bad_logins_are_refused]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Helpers shared by the test scripts
+Framing, a throwaway server on a free port and a plain socket login
+"""
+
+import json
+import socket
+import tempfile
+import threading
+import time
+
+from offline_mailbox import MailboxStore
+from server import ChatServer
+
+def send_with_length(sock, data):
+    """Send data with length prefix"""
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    length_bytes = len(data).to_bytes(4, byteorder='big')
+    sock.send(length_bytes + data)
+
+def receive_with_length(sock):
+    """Receive a length prefixed JSON message"""
+    length_data = sock.recv(4)
+    if not length_data:
+        return None
+
+    message_length = int.from_bytes(length_data, byteorder='big')
+
+    message_data = b''
+    while len(message_data) < message_length:
+        chunk = sock.recv(min(4096, message_length - len(message_data)))
+        if not chunk:
+            return None
+        message_data += chunk
+
+    return json.loads(message_data.decode('utf-8'))
+
+def start_test_server(snapshot_path=None, backplane=None):
+    """Start a server on a free port in a background thread, backplane(server) builds its backplane"""
+    probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    probe.bind(('localhost', 0))
+    port = probe.getsockname()[1]
+    probe.close()
+
+    server = ChatServer('localhost', port, backplane)
+    server.offline_mailboxes = MailboxStore(spill_dir=tempfile.mkdtemp())
+    server.snapshot_path = snapshot_path
+    thread = threading.Thread(target=server.start_server)
+    thread.daemon = True
+    thread.start()
+    time.sleep(0.5)
+    return server, port
+
+def login(port, nickname):
+    """Connect and log in, returns the socket after NICK_ACCEPTED"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.settimeout(5)
+    sock.connect(('localhost', port))
+    assert receive_with_length(sock)['type'] == 'NICK_REQUEST'
+    send_with_length(sock, nickname)
+    assert receive_with_length(sock)['type'] == 'NICK_ACCEPTED'
+    return sock
+
+def receive_type(sock, msg_type):
+    """Read messages until one of the given type arrives"""
+    while True:
+        message = receive_with_length(sock)
+        if message['type'] == msg_type:
+            return message
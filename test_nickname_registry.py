@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Test script for the nickname registry
+Checks lease expiry and renewal, the negative lookup cache and cluster-wide uniqueness
+"""
+
+import time
+
+from nickname_registry import LeaseTable, NicknameCache
+from backplane import BackplaneHub, InProcessBackplane
+from test_helpers import start_test_server
+
+def test_lease_expiry_and_renewal():
+    """Leases run out unless renewed, and only the holder can renew them"""
+    table = LeaseTable(lease_seconds=10)
+    now = 1000.0
+    assert table.acquire('alice', 'a', now)
+    assert not table.acquire('alice', 'b', now + 5)
+
+    assert table.renew('a', ['alice'], now + 8) == []
+    assert table.holder_of('alice', now + 15) == 'a'
+    assert table.renew('b', ['alice'], now + 15) == ['alice']
+
+    assert table.expire(now + 30) == [('alice', 'a')]
+    assert table.acquire('alice', 'b', now + 30)
+    assert table.release_holder('b') == ['alice']
+    print("✅ Leases expire and renew")
+
+def test_negative_cache():
+    """Names found taken are remembered for a short while"""
+    cache = NicknameCache(negative_ttl=60)
+    assert not cache.is_taken('bob')
+    cache.mark_taken('bob')
+    assert cache.is_taken('bob')
+    assert not cache.is_taken('bob', time.time() + 61)
+
+    cache.mark_taken('carol')
+    cache.forget('carol')
+    assert not cache.is_taken('carol')
+    print("✅ Negative lookups are cached")
+
+def test_registry_across_nodes():
+    """A second node is refused without asking twice, and gets the name once the lease lapses"""
+    hub = BackplaneHub()
+    hub.leases.lease_seconds = 0.5
+    servers = []
+    for node_id in ('a', 'b'):
+        server, _ = start_test_server(
+            backplane=lambda server, node_id=node_id: InProcessBackplane(server, hub, node_id))
+        servers.append(server)
+    node_a, node_b = servers[0].backplane, servers[1].backplane
+    try:
+        assert node_a.claim_nickname('alice')
+        assert not node_b.claim_nickname('alice')
+
+        # The refusal is cached, so the hub is not asked again
+        asked = []
+        original = hub.handle_op
+        hub.handle_op = lambda node_id, op: asked.append(op) or original(node_id, op)
+        assert not node_b.claim_nickname('alice')
+        assert asked == []
+        hub.handle_op = original
+
+        # Node a stops sending heartbeats, so its lease runs out
+        node_a.running = False
+        time.sleep(0.6)
+        node_b.nickname_cache.forget('alice')
+        assert node_b.claim_nickname('alice')
+        assert hub.leases.holder_of('alice') == 'b'
+        print("✅ Registry keeps nicknames unique across nodes")
+    finally:
+        for server in servers:
+            server.shutdown_server()
+
+def main():
+    """Run all tests"""
+    print("=== Nickname Registry Test Suite ===")
+    tests = [test_lease_expiry_and_renewal, test_negative_cache, test_registry_across_nodes]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
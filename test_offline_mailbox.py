@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Test script for offline mailboxes
+Checks disk spill, TTL eviction and delivery of queued private messages on login
+"""
+
+import socket
+import json
+import os
+import tempfile
+import time
+
+from offline_mailbox import MailboxStore
+from test_helpers import send_with_length, receive_with_length, start_test_server, login
+
+def test_mailbox_spill_keeps_order():
+    """Entries beyond the memory limit go to disk and come back in order"""
+    store = MailboxStore(spill_dir=tempfile.mkdtemp(), memory_limit=2, max_entries=5)
+    for i in range(5):
+        assert store.enqueue('alice', {'type': 'PRIVATE_MSG', 'content': str(i)})
+    assert not store.enqueue('alice', {'type': 'PRIVATE_MSG', 'content': 'overflow'})
+    assert store.pending_count('alice') == 5
+
+    entries = store.peek('alice', limit=10)
+    assert [entry['content'] for entry in entries] == ['0', '1', '2', '3', '4']
+    store.remove_through('alice', entries[-1]['queued_at'])
+    assert store.pending_count('alice') == 0 and store.peek('alice') == []
+    print("✅ Mailbox spill keeps order")
+
+def test_mailbox_ttl_eviction():
+    """Expired entries are dropped on peek and by the sweeper"""
+    store = MailboxStore(spill_dir=tempfile.mkdtemp(), memory_limit=1, ttl_seconds=60)
+    store.enqueue('bob', {'type': 'PRIVATE_MSG', 'content': 'old'})
+    store.enqueue('bob', {'type': 'PRIVATE_MSG', 'content': 'spilled'})
+
+    assert [entry['content'] for entry in store.peek('bob')] == ['old', 'spilled']
+    store.ttl_seconds = -1  # Everything queued so far is now past its TTL
+    assert store.peek('bob') == []
+    store.enqueue('bob', {'type': 'PRIVATE_MSG', 'content': 'fresh'})
+
+    store.evict_expired(time.time() + 1)
+    assert store.pending_count('bob') == 0
+    assert store.peek('bob') == []
+    print("✅ Mailbox TTL eviction works")
+
+def test_offline_delivery_on_login():
+    """A private message to an offline user arrives in one batch on login"""
+    server, port = start_test_server()
+    try:
+        alice = login(port, 'alice')
+        alice.close()
+        time.sleep(0.2)
+
+        bob = login(port, 'bob')
+        send_with_length(bob, json.dumps({'command': 'MSG', 'content': 'alice:see you later'}))
+        reply = receive_with_length(bob)
+        assert reply['type'] == 'PRIVATE_MSG' and 'queued' in reply['content']
+
+        send_with_length(bob, json.dumps({'command': 'MSG', 'content': 'nobody:hello'}))
+        assert receive_with_length(bob)['type'] == 'ERROR'
+
+        alice = login(port, 'alice')
+        batch = receive_with_length(alice)
+        assert batch['type'] == 'OFFLINE_MESSAGES'
+        assert [m['content'] for m in batch['messages']] == ['Private from bob: see you later']
+
+        alice.close()
+        bob.close()
+        print("✅ Offline messages delivered on login")
+    finally:
+        server.shutdown_server()
+
+def test_mailbox_peek_and_remove():
+    """Peeked entries stay queued until removed, including the spilled part"""
+    store = MailboxStore(spill_dir=tempfile.mkdtemp(), memory_limit=2)
+    for i in range(5):
+        store.enqueue('carol', {'type': 'PRIVATE_MSG', 'content': str(i)})
+    entries = store.peek('carol', limit=3)
+    assert [entry['content'] for entry in entries] == ['0', '1', '2']
+    assert store.pending_count('carol') == 5
+
+    store.remove_through('carol', entries[-1]['queued_at'])
+    assert [entry['content'] for entry in store.peek('carol')] == ['3', '4']
+    print("✅ Mailbox entries stay queued until removed")
+
+def test_offline_files_wait_for_ack():
+    """Queued files go out one frame each and leave the mailbox only once acknowledged"""
+    server, port = start_test_server()
+    try:
+        dave = login(port, 'dave')
+        dave.close()
+        time.sleep(0.2)
+
+        for name in ('one.txt', 'two.txt'):
+            with open(os.path.join(server.uploads_dir, f"test_offline_{name}"), 'wb') as f:
+                f.write(name.encode('utf-8') * 1000)
+            server.offline_mailboxes.enqueue('dave', {
+                'type': 'FILE_RECEIVED',
+                'file_info': {'filename': name, 'file_id': f"test_offline_{name}"},
+                'is_private': True,
+                'timestamp': ''
+            })
+        server.offline_mailboxes.enqueue('dave', {'type': 'PRIVATE_MSG', 'content': 'after the files'})
+
+        dave = login(port, 'dave')
+        first = receive_with_length(dave)
+        assert first['type'] == 'FILE_RECEIVED' and first['file_info']['filename'] == 'one.txt'
+        dave.settimeout(0.5)
+        try:
+            receive_with_length(dave)
+            assert False, "the next frame did not wait for the ACK"
+        except socket.timeout:
+            pass
+
+        # Going away without an ACK loses nothing, the frame is resent on resume
+        dave.close()
+        time.sleep(0.2)
+        assert server.offline_mailboxes.pending_count('dave') == 3
+        dave = login(port, 'dave')
+        assert receive_with_length(dave)['seq'] == first['seq']
+
+        received = []
+        frame = first
+        while len(received) < 2:
+            send_with_length(dave, json.dumps({'command': 'ACK', 'content': frame['seq']}))
+            frame = receive_with_length(dave)
+            received.append(frame)
+        assert received[0]['type'] == 'FILE_RECEIVED' and received[0]['file_info']['filename'] == 'two.txt'
+        assert received[1]['type'] == 'OFFLINE_MESSAGES'
+        assert [m['content'] for m in received[1]['messages']] == ['after the files']
+
+        send_with_length(dave, json.dumps({'command': 'ACK', 'content': frame['seq']}))
+        time.sleep(0.2)
+        assert server.offline_mailboxes.pending_count('dave') == 0
+        dave.close()
+        print("✅ Offline files are sent one at a time and kept until acknowledged")
+    finally:
+        server.shutdown_server()
+        for name in ('one.txt', 'two.txt'):
+            try:
+                os.remove(os.path.join(server.uploads_dir, f"test_offline_{name}"))
+            except OSError:
+                pass
+
+def main():
+    """Run all tests"""
+    print("=== Offline Mailbox Test Suite ===")
+    tests = [test_mailbox_spill_keeps_order, test_mailbox_ttl_eviction, test_offline_delivery_on_login,
+             test_mailbox_peek_and_remove, test_offline_files_wait_for_ack]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Test script for overload protection
+Checks load grading and that FILE and LIST are shed before MSG
+"""
+
+import json
+
+from overload import OverloadMonitor, NORMAL, ELEVATED, HIGH, CRITICAL
+from test_helpers import send_with_length, start_test_server, login, receive_type
+
+def test_levels_step_up_and_down():
+    """Load jumps straight to its level and recovers one step at a time"""
+    monitor = OverloadMonitor(depth_limits=(10, 20, 30))
+    assert monitor.update(0, 0.0) is None and monitor.level == NORMAL
+    assert monitor.update(35, 0.0) == CRITICAL
+    assert monitor.update(0, 0.0) == HIGH
+    assert monitor.update(0, 0.0) == ELEVATED
+    assert monitor.update(0, 0.95) == HIGH
+    print("✅ Load levels step up at once and down gradually")
+
+def test_shedding_order():
+    """FILE goes first, then LIST, then JOIN, and MSG is never shed"""
+    monitor = OverloadMonitor(depth_limits=(10, 20, 30))
+    shed_at = {}
+    for depth in (0, 10, 20, 30):
+        monitor.update(depth, 0.0)
+        shed_at[monitor.level] = {command for command in ('MSG', 'FILE', 'LIST', 'JOIN')
+                                  if monitor.should_shed(command)}
+    assert shed_at == {NORMAL: set(), ELEVATED: {'FILE'}, HIGH: {'FILE', 'LIST'},
+                       CRITICAL: {'FILE', 'LIST', 'JOIN'}}
+    assert monitor.retry_after_ms() == 8000
+    print("✅ Expensive commands are shed first")
+
+def test_server_sheds_list_but_not_msg():
+    """An overloaded server answers LIST with RETRY_LATER and still delivers MSG"""
+    server, port = start_test_server()
+    try:
+        alice = login(port, 'alice')
+        bob = login(port, 'bob')
+        for sock in (alice, bob):
+            send_with_length(sock, json.dumps({'command': 'JOIN', 'content': 'lobby'}))
+            receive_type(sock, 'ROOM_JOINED')
+
+        # Hold the level steady instead of letting the load check re-grade it
+        server.overload.update = lambda queue_depth, connection_use: None
+        server.overload.level = HIGH
+        send_with_length(alice, json.dumps({'command': 'LIST'}))
+        refused = receive_type(alice, 'RETRY_LATER')
+        assert refused['command'] == 'LIST' and refused['retry_after_ms'] == 4000
+
+        send_with_length(alice, json.dumps({'command': 'MSG', 'content': 'still here'}))
+        assert receive_type(bob, 'PUBLIC_MSG')['content'] == 'alice: still here'
+        assert server.overload.status()['shed_count'] == 1
+
+        alice.close()
+        bob.close()
+        print("✅ Overloaded server sheds LIST and keeps MSG")
+    finally:
+        server.shutdown_server()
+
+def test_shed_command_can_be_retried():
+    """A command refused with RETRY_LATER runs when it is retried with the same msg_id"""
+    server, port = start_test_server()
+    try:
+        alice = login(port, 'alice')
+        server.overload.update = lambda queue_depth, connection_use: None
+        server.overload.level = HIGH
+        command = json.dumps({'command': 'LIST', 'msg_id': 'list-1'})
+        send_with_length(alice, command)
+        receive_type(alice, 'RETRY_LATER')
+
+        server.overload.level = NORMAL
+        send_with_length(alice, command)
+        assert 'alice' in receive_type(alice, 'LIST_RESPONSE')['content']
+
+        alice.close()
+        print("✅ Shed commands can be retried with the same msg_id")
+    finally:
+        server.shutdown_server()
+
+def main():
+    """Run all tests"""
+    print("=== Overload Protection Test Suite ===")
+    tests = [test_levels_step_up_and_down, test_shedding_order, test_server_sheds_list_but_not_msg,
+             test_shed_command_can_be_retried]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Test script for presence tracking
+Checks the events each change produces and that subscribed clients get versioned PRESENCE frames after LIST
+"""
+
+import json
+import socket
+
+from presence import PresenceTracker
+from protocol import hello_frame
+from test_helpers import send_with_length, receive_with_length, start_test_server, login, receive_type
+
+def test_tracker_events():
+    """Logins, moves and logouts produce user and room count events with rising versions"""
+    published = []
+    tracker = PresenceTracker(publish=lambda version, events: published.append((version, events)))
+    tracker.update('alice', None)
+    tracker.update('alice', 'lobby')
+    tracker.update('bob', 'lobby')
+    assert tracker.update('bob', 'lobby') is None  # Nothing changed
+    tracker.update('alice', None, online=False)
+    tracker.update('bob', None, online=False)
+
+    assert [version for version, _ in published] == [1, 2, 3, 4, 5]
+    assert published[0][1] == [{'op': 'user_online', 'nickname': 'alice', 'room': None}]
+    assert published[1][1] == [{'op': 'user_moved', 'nickname': 'alice', 'room': 'lobby'},
+                               {'op': 'room_created', 'room': 'lobby', 'count': 1}]
+    assert published[2][1][1] == {'op': 'room_count', 'room': 'lobby', 'count': 2}
+    assert published[3][1] == [{'op': 'user_offline', 'nickname': 'alice'},
+                               {'op': 'room_count', 'room': 'lobby', 'count': 1}]
+    assert published[4][1][1] == {'op': 'room_removed', 'room': 'lobby'}
+    assert tracker.snapshot() == (5, {}, {})
+    print("✅ Presence changes produce versioned events")
+
+def test_subscriber_gets_deltas():
+    """LIST carries the versioned state and later changes arrive as PRESENCE frames"""
+    server, port = start_test_server()
+    try:
+        watcher = socket.create_connection(('localhost', port), timeout=5)
+        send_with_length(watcher, json.dumps(hello_frame('watcher', ['presence'])))
+        assert receive_with_length(watcher)['type'] == 'NICK_REQUEST'
+        accepted = receive_type(watcher, 'NICK_ACCEPTED')
+        assert accepted['capabilities'] == ['presence']
+
+        send_with_length(watcher, json.dumps({'command': 'LIST'}))
+        listing = receive_type(watcher, 'LIST_RESPONSE')
+        version = listing['presence']['version']
+        assert listing['presence']['users'] == {'watcher': None}
+
+        walker = login(port, 'walker')
+        send_with_length(walker, json.dumps({'command': 'JOIN', 'content': 'lobby'}))
+        receive_type(walker, 'ROOM_JOINED')
+        walker.close()
+
+        # Frames up to the LIST version may still be in flight, later ones follow in order
+        ops = []
+        while len(ops) < 4:
+            frame = receive_type(watcher, 'PRESENCE')
+            if frame['version'] <= version:
+                continue
+            assert frame['version'] == version + 1
+            version = frame['version']
+            ops.extend(event['op'] for event in frame['events'])
+        assert ops[:4] == ['user_online', 'user_moved', 'room_created', 'user_moved']
+        watcher.close()
+        print("✅ Subscribers get PRESENCE frames in version order")
+    finally:
+        server.shutdown_server()
+
+def main():
+    """Run all tests"""
+    print("=== Presence Test Suite ===")
+    tests = [test_tracker_events, test_subscriber_gets_deltas]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
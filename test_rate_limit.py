@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Test script for rate limiting
+Checks token bucket refill, all-or-nothing checks, live limit changes and THROTTLED replies
+"""
+
+import json
+import time
+
+from rate_limit import RateLimiter
+from test_helpers import send_with_length, start_test_server, login, receive_type
+
+def test_bucket_refills():
+    """A burst is allowed, then one command per refill interval"""
+    limiter = RateLimiter({('client', 'MSG'): (2.0, 3)})
+    check = [('client', 'MSG', 'alice')]
+    assert [limiter.acquire(check, now=0) for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire(check, now=0) == 500
+    assert limiter.acquire(check, now=0.5) == 0
+    assert limiter.acquire(check, now=0.5) > 0
+    assert limiter.throttled_count == 2
+
+    # Other clients have their own bucket
+    assert limiter.acquire([('client', 'MSG', 'bob')], now=0.5) == 0
+    print("✅ Buckets allow a burst and refill over time")
+
+def test_checks_are_all_or_nothing():
+    """A command refused by the room limit does not use up the client's tokens"""
+    limiter = RateLimiter({('client', 'MSG'): (1.0, 2), ('room', 'MSG'): (1.0, 1)})
+    assert limiter.acquire([('client', 'MSG', 'alice'), ('room', 'MSG', 'lobby')], now=0) == 0
+    assert limiter.acquire([('client', 'MSG', 'bob'), ('room', 'MSG', 'lobby')], now=0) == 1000
+    assert limiter.buckets[('client', 'MSG', 'bob')].tokens == 2
+    print("✅ Refused commands take no tokens")
+
+def test_set_limit_applies_to_existing_buckets():
+    """Changing a limit takes effect for clients that already have a bucket"""
+    limiter = RateLimiter({('client', 'LIST'): (1.0, 5)})
+    check = [('client', 'LIST', 'alice')]
+    assert limiter.acquire(check, now=0) == 0
+    limiter.set_limit('client', 'LIST', 0.1, 1)
+    assert limiter.acquire(check, now=0) == 0
+    assert limiter.acquire(check, now=0) == 10000
+    print("✅ Limit changes apply immediately")
+
+def test_server_throttles_fast_sender():
+    """Messages past the burst are answered with THROTTLED and not delivered"""
+    server, port = start_test_server()
+    try:
+        server.rate_limiter.set_limit('client', 'MSG', 0.1, 2)
+        alice = login(port, 'alice')
+        bob = login(port, 'bob')
+        for sock in (alice, bob):
+            send_with_length(sock, json.dumps({'command': 'JOIN', 'content': 'lobby'}))
+            receive_type(sock, 'ROOM_JOINED')
+
+        for n in range(3):
+            send_with_length(alice, json.dumps({'command': 'MSG', 'content': f"message {n}"}))
+        throttled = receive_type(alice, 'THROTTLED')
+        assert throttled['command'] == 'MSG' and throttled['retry_after_ms'] > 0
+
+        assert receive_type(bob, 'PUBLIC_MSG')['content'] == 'alice: message 0'
+        assert receive_type(bob, 'PUBLIC_MSG')['content'] == 'alice: message 1'
+        assert server.rate_limiter.throttled_count == 1
+
+        alice.close()
+        bob.close()
+        print("✅ Fast senders get THROTTLED")
+    finally:
+        server.shutdown_server()
+
+def test_throttled_command_can_be_retried():
+    """A command refused with THROTTLED runs when it is retried with the same msg_id"""
+    server, port = start_test_server()
+    try:
+        server.rate_limiter.set_limit('client', 'LIST', 5, 1)
+        alice = login(port, 'alice')
+        send_with_length(alice, json.dumps({'command': 'LIST', 'msg_id': 'm1'}))
+        receive_type(alice, 'LIST_RESPONSE')
+        send_with_length(alice, json.dumps({'command': 'LIST', 'msg_id': 'm2'}))
+        throttled = receive_type(alice, 'THROTTLED')
+
+        # Once the bucket has refilled, the same ID is run rather than dropped
+        time.sleep(throttled['retry_after_ms'] / 1000 + 0.05)
+        send_with_length(alice, json.dumps({'command': 'LIST', 'msg_id': 'm2'}))
+        assert 'alice' in receive_type(alice, 'LIST_RESPONSE')['content']
+
+        alice.close()
+        print("✅ Throttled commands can be retried with the same msg_id")
+    finally:
+        server.shutdown_server()
+
+def main():
+    """Run all tests"""
+    print("=== Rate Limit Test Suite ===")
+    tests = [test_bucket_refills, test_checks_are_all_or_nothing,
+             test_set_limit_applies_to_existing_buckets, test_server_throttles_fast_sender,
+             test_throttled_command_can_be_retried]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Test script for per-room executors
+Checks that room operations run in order on one thread and room state stays consistent
+"""
+
+import json
+import socket
+import threading
+import time
+
+from room_actors import RoomActors
+from test_helpers import send_with_length, receive_with_length, start_test_server, login, receive_type
+
+def test_room_operations_are_serialized():
+    """Operations on one room run in posting order on the owning thread"""
+    actors = RoomActors(shards=4)
+    seen = []
+    threads = set()
+
+    def record(n):
+        seen.append(n)
+        threads.add(threading.current_thread())
+
+    for n in range(100):
+        actors.post('lobby', record, n)
+    assert actors.flush()
+    actors.stop()
+
+    assert seen == list(range(100))
+    assert threads == {actors.threads[actors.shard_of('lobby')]}
+    print("✅ Room operations run in order on one executor")
+
+def test_call_runs_inline_on_owner():
+    """A room operation posted from its own executor runs immediately"""
+    actors = RoomActors(shards=2)
+    order = []
+
+    def outer():
+        actors.call('lobby', order.append, 'inner')
+        order.append('outer')
+
+    actors.post('lobby', outer)
+    assert actors.flush()
+    actors.stop()
+    assert order == ['inner', 'outer']
+    print("✅ Calls from the owning executor run inline")
+
+def test_concurrent_joins_keep_rooms_consistent():
+    """Users hopping between rooms leave every member set matching their room"""
+    server, port = start_test_server()
+    try:
+        # Hop faster than the default JOIN rate limit allows
+        server.rate_limiter.set_limit('client', 'JOIN', 100, 100)
+        users = [login(port, f"hopper{i}") for i in range(6)]
+
+        def hop(sock, i):
+            for room in ('red', 'green', 'blue', f"room{i % 2}"):
+                send_with_length(sock, json.dumps({'command': 'JOIN', 'content': room}))
+                receive_type(sock, 'ROOM_JOINED')
+
+        threads = [threading.Thread(target=hop, args=(sock, i)) for i, sock in enumerate(users)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        assert server.room_actors.flush()
+
+        assert sorted(server.rooms.keys()) == ['room0', 'room1']
+        for client_id, session in server.sessions.items():
+            assert client_id in server.rooms[session.room]
+        assert sum(len(members) for members in server.rooms.values()) == 6
+
+        for sock in users:
+            sock.close()
+        print("✅ Concurrent joins keep rooms consistent")
+    finally:
+        server.shutdown_server()
+
+def test_slow_reader_does_not_stall_shard():
+    """A member that stops reading does not hold up other rooms on the same executor"""
+    server, port = start_test_server()
+    try:
+        slow = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        slow.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        slow.settimeout(5)
+        slow.connect(('localhost', port))
+        assert receive_with_length(slow)['type'] == 'NICK_REQUEST'
+        send_with_length(slow, 'slow')
+        send_with_length(slow, json.dumps({'command': 'JOIN', 'content': 'backlog'}))
+        receive_type(slow, 'ROOM_JOINED')
+
+        # Far more than the socket buffers hold, and the reader never takes any of it
+        for _ in range(500):
+            server.broadcast_to_room('backlog', 'PUBLIC_MSG', 'x' * 20000)
+
+        shard = server.room_actors.shard_of('backlog')
+        neighbour = next(f"room{n}" for n in range(1000) if server.room_actors.shard_of(f"room{n}") == shard)
+        joiner = login(port, 'joiner')
+        started = time.time()
+        send_with_length(joiner, json.dumps({'command': 'JOIN', 'content': neighbour}))
+        receive_type(joiner, 'ROOM_JOINED')
+        assert time.time() - started < 2
+        slow.close()
+        joiner.close()
+        print("✅ A slow reader does not stall its room executor")
+    finally:
+        server.shutdown_server()
+
+def test_blocked_sender_does_not_stall_shard():
+    """A thread stuck writing to a slow reader holds no lock a room executor needs"""
+    server, port = start_test_server()
+    try:
+        slow = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        slow.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        slow.settimeout(5)
+        slow.connect(('localhost', port))
+        assert receive_with_length(slow)['type'] == 'NICK_REQUEST'
+        send_with_length(slow, 'slow')
+        send_with_length(slow, json.dumps({'command': 'JOIN', 'content': 'backlog'}))
+        receive_type(slow, 'ROOM_JOINED')
+        session = server.find_session('slow')
+
+        # A private 4 MB frame leaves this thread blocked in a write to the slow reader
+        sender = threading.Thread(target=server.send_json, args=(session, {
+            'type': 'PRIVATE_MSG', 'content': 'x' * (4 * 1024 * 1024)}))
+        sender.daemon = True
+        sender.start()
+        time.sleep(0.3)
+
+        shard = server.room_actors.shard_of('backlog')
+        neighbour = next(f"room{n}" for n in range(1000) if server.room_actors.shard_of(f"room{n}") == shard)
+        server.broadcast_to_room('backlog', 'PUBLIC_MSG', 'for the slow reader')
+        joiner = login(port, 'joiner')
+        started = time.time()
+        send_with_length(joiner, json.dumps({'command': 'JOIN', 'content': neighbour}))
+        receive_type(joiner, 'ROOM_JOINED')
+        assert time.time() - started < 2
+        slow.close()
+        joiner.close()
+        print("✅ A blocked sender does not stall its room executor")
+    finally:
+        server.shutdown_server()
+
+def main():
+    """Run all tests"""
+    print("=== Room Executor Test Suite ===")
+    tests = [test_room_operations_are_serialized, test_call_runs_inline_on_owner,
+             test_concurrent_joins_keep_rooms_consistent, test_slow_reader_does_not_stall_shard,
+             test_blocked_sender_does_not_stall_shard]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Test script for client sessions
+Checks the slotted session footprint and that rooms hold integer client IDs
+"""
+
+import json
+import socket
+import tracemalloc
+
+from session import ClientSession
+from test_helpers import send_with_length, start_test_server, login, receive_type
+
+def test_session_footprint():
+    """100k sessions take less memory than 100k of the old per-client dicts"""
+    sock = socket.socket()
+    try:
+        assert not hasattr(ClientSession(1, sock, None), '__dict__')
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        sessions = [ClientSession(n, sock, None) for n in range(100000)]
+        session_bytes = tracemalloc.get_traced_memory()[0] - before
+        del sessions
+
+        before = tracemalloc.get_traced_memory()[0]
+        dicts = [{'nickname': None, 'room': None} for _ in range(100000)]
+        dict_bytes = tracemalloc.get_traced_memory()[0] - before
+        del dicts
+        tracemalloc.stop()
+    finally:
+        sock.close()
+
+    # Sessions carry more fields than the old dicts and still come out smaller
+    assert session_bytes < dict_bytes
+    print(f"✅ 100k sessions: {session_bytes // 1024} KB, 100k dicts: {dict_bytes // 1024} KB")
+
+def test_rooms_hold_client_ids():
+    """Room member sets hold integer IDs and sessions count their traffic"""
+    server, port = start_test_server()
+    try:
+        alice = login(port, 'alice')
+        bob = login(port, 'bob')
+        for sock in (alice, bob):
+            send_with_length(sock, json.dumps({'command': 'JOIN', 'content': 'lobby'}))
+            receive_type(sock, 'ROOM_JOINED')
+        assert server.room_actors.flush()
+
+        session = server.find_session('alice')
+        assert server.rooms['lobby'] == {session.client_id, server.find_session('bob').client_id}
+        assert all(isinstance(client_id, int) for client_id in server.rooms['lobby'])
+
+        send_with_length(alice, json.dumps({'command': 'MSG', 'content': 'bob: hi'}))
+        assert receive_type(bob, 'PRIVATE_MSG')['content'] == 'Private from alice: hi'
+        assert session.commands_received == 2
+        assert session.frames_sent >= 3
+
+        alice.close()
+        bob.close()
+        print("✅ Rooms hold client IDs")
+    finally:
+        server.shutdown_server()
+
+def main():
+    """Run all tests"""
+    print("=== Client Session Test Suite ===")
+    tests = [test_session_footprint, test_rooms_hold_client_ids]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Test script for draining clients on shutdown
+Checks that every client gets one RECONNECT hint, no USER_LEFT, and shutdown time stays bounded
+"""
+
+import json
+import socket
+import threading
+import time
+
+from test_helpers import send_with_length, receive_with_length, start_test_server, login, receive_type
+
+def join_lobby(server, port, count):
+    """Log in count users and put them all in one room"""
+    server.rate_limiter.set_limit('room', 'JOIN', 1000, 1000)
+    users = []
+    for i in range(count):
+        sock = login(port, f"user{i}")
+        send_with_length(sock, json.dumps({'command': 'JOIN', 'content': 'lobby'}))
+        receive_type(sock, 'ROOM_JOINED')
+        users.append(sock)
+    assert server.room_actors.flush()
+    return users
+
+def read_until_closed(sock, frames):
+    """Collect frames until the server closes the connection, closing after a RECONNECT"""
+    try:
+        while True:
+            message = receive_with_length(sock)
+            if message is None:
+                break
+            frames.append(message)
+            if message['type'] == 'RECONNECT':
+                sock.close()
+                break
+    except OSError:
+        pass
+
+def test_drain_sends_one_hint_and_no_user_left():
+    """Every client gets exactly one RECONNECT and nobody hears USER_LEFT"""
+    server, port = start_test_server()
+    users = join_lobby(server, port, 30)
+    received = [[] for _ in users]
+    readers = [threading.Thread(target=read_until_closed, args=(sock, frames))
+               for sock, frames in zip(users, received)]
+    for reader in readers:
+        reader.start()
+
+    started = time.time()
+    server.shutdown_server()
+    elapsed = time.time() - started
+    for reader in readers:
+        reader.join(5)
+
+    for frames in received:
+        types = [frame['type'] for frame in frames]
+        assert types.count('RECONNECT') == 1 and types[-1] == 'RECONNECT'
+        assert 'USER_LEFT' not in types
+        assert frames[-1]['retry_after_ms'] > 0
+    # Clients closed promptly, so the drain did not wait for its deadline
+    assert elapsed < server.drain_timeout
+    print(f"✅ 30 clients drained in {elapsed:.2f}s with one hint each")
+
+def test_drain_is_bounded_by_deadline():
+    """Clients that never close are cut off once drain_timeout has passed"""
+    server, port = start_test_server()
+    server.drain_timeout = 1
+    users = join_lobby(server, port, 10)
+
+    started = time.time()
+    server.shutdown_server()
+    elapsed = time.time() - started
+    assert elapsed < 2.5
+
+    for sock in users:
+        assert receive_type(sock, 'RECONNECT')
+        assert receive_with_length(sock) is None
+        sock.close()
+    print(f"✅ Unresponsive clients closed after {elapsed:.2f}s")
+
+def test_drain_flushes_queued_frames_first():
+    """Frames still queued when the drain starts reach the client ahead of its hint"""
+    server, port = start_test_server()
+    sock = login(port, 'reader')
+    session = next(iter(server.sessions.values()))
+    # More than the socket buffers hold, so the drain has to keep flushing
+    for i in range(1000):
+        frame = json.dumps({'type': 'PUBLIC_MSG', 'content': str(i) + 'x' * 10000})
+        server.queue_frame(session, frame.encode('utf-8'), schedule=False, block=False)
+
+    stopper = threading.Thread(target=server.shutdown_server)
+    stopper.start()
+    time.sleep(0.3)
+    frames = []
+    read_until_closed(sock, frames)
+    stopper.join(5)
+
+    types = [frame['type'] for frame in frames]
+    assert types == ['PUBLIC_MSG'] * 1000 + ['RECONNECT']
+    print("✅ Queued frames are flushed before the RECONNECT hint")
+
+def test_drain_reaches_clients_logging_in():
+    """A connection that has not logged in yet still gets a RECONNECT hint"""
+    server, port = start_test_server()
+    sock = socket.create_connection(('localhost', port), timeout=5)
+    assert receive_with_length(sock)['type'] == 'NICK_REQUEST'
+    assert len(server.connections) == 1 and not server.sessions
+
+    server.shutdown_server()
+    assert receive_type(sock, 'RECONNECT')
+    sock.close()
+    print("✅ Clients still logging in are drained too")
+
+def main():
+    """Run all tests"""
+    print("=== Shutdown Drain Test Suite ===")
+    tests = [test_drain_sends_one_hint_and_no_user_left, test_drain_is_bounded_by_deadline,
+             test_drain_flushes_queued_frames_first, test_drain_reaches_clients_logging_in]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
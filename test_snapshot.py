@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Test script for server snapshots
+Checks that rooms, sessions and mailboxes survive a server restart
+"""
+
+import json
+import os
+import tempfile
+import time
+
+from snapshot import read_snapshot
+from test_helpers import send_with_length, receive_with_length, start_test_server, login
+
+def test_restart_restores_state():
+    """A restarted server puts users back in their room and keeps their mail"""
+    snapshot_path = os.path.join(tempfile.mkdtemp(), 'snapshot.pkl')
+
+    server, port = start_test_server(snapshot_path)
+    alice = login(port, 'alice')
+    send_with_length(alice, json.dumps({'command': 'JOIN', 'content': 'lobby'}))
+    assert receive_with_length(alice)['type'] == 'ROOM_JOINED'
+
+    bob = login(port, 'bob')
+    bob.close()
+    time.sleep(0.2)
+    send_with_length(alice, json.dumps({'command': 'MSG', 'content': 'bob:welcome back'}))
+    reply = receive_with_length(alice)
+    assert 'queued' in reply['content']
+    send_with_length(alice, json.dumps({'command': 'ACK', 'content': reply['seq']}))
+    time.sleep(0.2)
+
+    server.shutdown_server()
+    alice.close()
+    assert os.path.exists(snapshot_path)
+
+    server, port = start_test_server(snapshot_path)
+    try:
+        assert 'bob' in server.known_nicknames
+
+        alice = login(port, 'alice')
+        rejoined = receive_with_length(alice)
+        assert rejoined['type'] == 'ROOM_JOINED' and rejoined['content'].endswith('lobby')
+
+        bob = login(port, 'bob')
+        batch = receive_with_length(bob)
+        assert batch['type'] == 'OFFLINE_MESSAGES'
+        assert batch['messages'][0]['content'] == 'Private from alice: welcome back'
+
+        alice.close()
+        bob.close()
+        print("✅ Server state restored after restart")
+    finally:
+        server.shutdown_server()
+
+def test_snapshot_follows_pending_deliveries():
+    """Frames still queued on a room executor get sequenced before the snapshot is taken"""
+    snapshot_path = os.path.join(tempfile.mkdtemp(), 'snapshot.pkl')
+    server, port = start_test_server(snapshot_path)
+    alice = login(port, 'alice')
+    send_with_length(alice, json.dumps({'command': 'JOIN', 'content': 'lobby'}))
+    assert receive_with_length(alice)['type'] == 'ROOM_JOINED'
+
+    def late_delivery():
+        time.sleep(0.3)
+        server.broadcast_to_room('lobby', 'PUBLIC_MSG', 'sent during shutdown')
+    server.room_actors.post('lobby', late_delivery)
+    server.shutdown_server()
+
+    seqs = []
+    while True:
+        message = receive_with_length(alice)
+        if message is None or message['type'] == 'RECONNECT':
+            break
+        if 'seq' in message:
+            seqs.append(message['seq'])
+    alice.close()
+    assert seqs, "the queued delivery never arrived"
+    # The successor continues after every seq the client has seen
+    assert read_snapshot(snapshot_path)['delivery_streams']['alice']['next_seq'] > max(seqs)
+    print("✅ Snapshot is taken after queued deliveries")
+
+def main():
+    """Run all tests"""
+    print("=== Snapshot Test Suite ===")
+    tests = [test_restart_restores_state, test_snapshot_follows_pending_deliveries]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Test script for the structured logger
+Checks level filtering, the bounded ring buffer, file output and rotation
+"""
+
+import os
+import tempfile
+
+from structured_log import AsyncLogger, DEBUG, INFO
+
+def test_disabled_levels_are_not_buffered():
+    """Debug records cost nothing when the level is INFO"""
+    log = AsyncLogger(level=INFO)
+    log.debug("command", nickname='alice', command='MSG')
+    assert len(log.records) == 0
+    log.info("client connected", nickname='alice')
+    assert len(log.records) == 1
+
+    log.configure(level=DEBUG)
+    log.debug("command", nickname='alice', command='MSG')
+    assert len(log.records) == 2
+    print("✅ Records below the level are dropped at the call site")
+
+def test_ring_buffer_keeps_newest():
+    """A full buffer overwrites the oldest records instead of blocking"""
+    log = AsyncLogger(capacity=3)
+    for n in range(5):
+        log.info("tick", n=n)
+    assert [record[3]['n'] for record in log.records] == [2, 3, 4]
+    print("✅ Full ring buffer keeps the newest records")
+
+def test_file_output_and_rotation():
+    """Records are written as key=value lines and the file rotates when it grows"""
+    path = os.path.join(tempfile.mkdtemp(), 'server.log')
+    log = AsyncLogger(path=path, max_bytes=200, backups=2)
+    log.info("client connected", nickname='alice', address='somewhere else')
+    log.flush()
+    with open(path) as f:
+        line = f.read()
+    assert "INFO client connected nickname=alice address='somewhere else'" in line
+
+    for n in range(20):
+        log.info("tick", n=n)
+        log.flush()
+    assert os.path.exists(path + '.1') and os.path.exists(path + '.2')
+    assert not os.path.exists(path + '.3')
+    print("✅ Log files are written and rotated")
+
+def main():
+    """Run all tests"""
+    print("=== Structured Log Test Suite ===")
+    tests = [test_disabled_levels_are_not_buffered, test_ring_buffer_keeps_newest,
+             test_file_output_and_rotation]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Test script for coalesced outbound writes
+Checks that queued frames are merged into few writes, stay in order, and survive a full socket buffer
+"""
+
+import socket
+from unittest import mock
+
+from writer import WriteCoalescer, WriteFlusher
+from test_helpers import start_test_server, login
+
+def read_exactly(sock, size):
+    """Read size bytes from a socket"""
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        assert chunk
+        data += chunk
+    return data
+
+def test_burst_is_one_write():
+    """Frames queued within the window go out together and in order"""
+    left, right = socket.socketpair()
+    flusher = WriteFlusher(window=0.05)
+    flusher.start()
+    try:
+        writer = WriteCoalescer(left, flusher)
+        frames = [f"frame {n};".encode() for n in range(100)]
+        for frame in frames:
+            writer.send(frame)
+        right.settimeout(5)
+        assert read_exactly(right, sum(len(frame) for frame in frames)) == b''.join(frames)
+        assert writer.frames == 100
+        assert writer.writes <= 2
+        print(f"✅ 100 frames written in {writer.writes} write(s)")
+    finally:
+        flusher.stop()
+        left.close()
+        right.close()
+
+def test_byte_threshold_flushes_inline():
+    """Once max_bytes are waiting the sender writes them without waiting for the flusher"""
+    left, right = socket.socketpair()
+    flusher = WriteFlusher(window=60)  # Never fires during the test
+    flusher.start()
+    try:
+        writer = WriteCoalescer(left, flusher, max_bytes=100)
+        writer.send(b'a' * 60)
+        assert writer.writes == 0
+        writer.send(b'b' * 60)
+        assert writer.writes == 1 and writer.pending_bytes == 0
+        right.settimeout(5)
+        assert read_exactly(right, 120) == b'a' * 60 + b'b' * 60
+        print("✅ Byte threshold flushes inline")
+    finally:
+        flusher.stop()
+        left.close()
+        right.close()
+
+def test_nonblocking_send_is_bounded():
+    """A non-blocking send leaves a full socket to the flusher and refuses to queue past max_backlog"""
+    left, right = socket.socketpair()
+    flusher = WriteFlusher(window=60)  # Never fires during the test
+    flusher.start()
+    try:
+        left.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        writer = WriteCoalescer(left, flusher, max_bytes=100, max_backlog=2 * 1024 * 1024)
+        payload = b'a' * (1024 * 1024)  # Far more than the socket buffers hold
+        writer.send(payload, block=False)
+        assert writer.writes >= 1 and 0 < writer.pending_bytes < len(payload)
+        waiting = writer.pending_bytes
+        writer.send(b'b' * 120, block=False)
+        assert writer.pending_bytes == waiting + 120  # Queued behind, not written
+        try:
+            writer.send(b'c' * (2 * 1024 * 1024), block=False)
+            assert False, "queued past max_backlog"
+        except BufferError:
+            pass
+        assert writer.pending_bytes == waiting + 120 and writer.frames == 2
+        print("✅ Non-blocking sends never block and are bounded")
+    finally:
+        flusher.stop()
+        left.close()
+        right.close()
+
+def test_nonblocking_send_writes_at_once():
+    """A non-blocking send to a socket with room writes from the sending thread"""
+    left, right = socket.socketpair()
+    flusher = WriteFlusher(window=60)  # Never fires during the test
+    flusher.start()
+    try:
+        writer = WriteCoalescer(left, flusher)
+        writer.send(b'a' * 120, block=False)
+        assert writer.writes == 1 and writer.pending_bytes == 0 and not writer.scheduled
+        right.settimeout(5)
+        assert read_exactly(right, 120) == b'a' * 120
+        print("✅ Non-blocking sends write what the socket takes at once")
+    finally:
+        flusher.stop()
+        left.close()
+        right.close()
+
+def test_full_buffer_keeps_the_tail():
+    """A non-blocking flush into a full socket keeps the unsent bytes and finishes later"""
+    left, right = socket.socketpair()
+    try:
+        left.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 4096)
+        writer = WriteCoalescer(left)
+        payload = bytes(range(256)) * 4096  # 1 MB, far more than the socket buffers hold
+        writer.append(b'head', payload, b'tail')
+        assert not writer.flush(blocking=False)
+        assert 0 < writer.pending_bytes < len(payload) + 8
+
+        received = bytearray()
+        right.settimeout(5)
+        while len(received) < len(payload) + 8:
+            received += right.recv(65536)
+            writer.flush(blocking=False)
+        assert bytes(received) == b'head' + payload + b'tail'
+        print("✅ Partial writes resume where they stopped")
+    finally:
+        left.close()
+        right.close()
+
+def test_no_coalescing_without_nonblocking_sends():
+    """Without MSG_DONTWAIT frames are written at once instead of by the flusher"""
+    left, right = socket.socketpair()
+    flusher = WriteFlusher(window=60)  # Never fires during the test
+    try:
+        with mock.patch('writer.NONBLOCKING_FLAG', 0):
+            writer = WriteCoalescer(left, flusher)
+        assert writer.flusher is None
+        writer.send(b'one', block=False)
+        writer.send(b'two')
+        assert writer.pending_bytes == 0 and writer.writes == 2
+        right.settimeout(5)
+        assert read_exactly(right, 6) == b'onetwo'
+        print("✅ Frames are written at once where sends cannot be non-blocking")
+    finally:
+        left.close()
+        right.close()
+
+def test_server_sockets_use_nodelay():
+    """Accepted client sockets have TCP_NODELAY and a write coalescer"""
+    server, port = start_test_server()
+    try:
+        sock = login(port, 'nagle')
+        session = server.find_session('nagle')
+        assert session.sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY)
+        assert session.writer.frames >= 2  # NICK_REQUEST and NICK_ACCEPTED
+        sock.close()
+        print("✅ Server sockets use TCP_NODELAY")
+    finally:
+        server.shutdown_server()
+
+def main():
+    """Run all tests"""
+    print("=== Write Coalescer Test Suite ===")
+    tests = [test_burst_is_one_write, test_byte_threshold_flushes_inline, test_nonblocking_send_is_bounded,
+             test_nonblocking_send_writes_at_once, test_full_buffer_keeps_the_tail,
+             test_no_coalescing_without_nonblocking_sends, test_server_sockets_use_nodelay]
+    tests_passed = 0
+    for test in tests:
+        try:
+            test()
+            tests_passed += 1
+        except Exception as e:
+            print(f"❌ {test.__name__} failed: {e!r}")
+
+    print(f"\n=== Test Results ===")
+    print(f"Tests passed: {tests_passed}/{len(tests)}")
+
+if __name__ == "__main__":
+    main()
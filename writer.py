@@ -0,0 +1,216 @@
+import heapq
+import itertools
+import socket
+import threading
+import time
+
+
+# Buffers handed to one sendmsg call, Linux refuses more than IOV_MAX (1024)
+IOV_LIMIT = 512
+# Windows has no MSG_DONTWAIT, so there is no per-call non-blocking send there
+NONBLOCKING_FLAG = getattr(socket, 'MSG_DONTWAIT', 0)
+
+
+def enable_nodelay(sock):
+    """Send small writes at once, the coalescer already batches them"""
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+class WriteCoalescer:
+    """Outbound frames for one connection, merged into as few writes as possible
+
+    Frames are queued and written by the flusher once its window has passed,
+    so a burst of frames costs one sendmsg instead of one send each. When
+    max_bytes are waiting the sending thread writes them itself, which also
+    slows down producers for a client that cannot keep up. Threads that must
+    never wait on one client, like room executors and fan-out workers, send
+    with block=False: they write what the socket takes at once without
+    blocking and leave only the rest to the flusher. Only one thread writes
+    to the socket at a time, so frames are never interleaved.
+
+    Where sends cannot be made non-blocking (no MSG_DONTWAIT) the flusher is
+    not used and every frame is written at once by the thread sending it,
+    block=False included, so there a slow client does hold up its sender.
+    """
+
+    def __init__(self, sock, flusher=None, max_bytes=32 * 1024, on_error=None,
+                 max_backlog=16 * 1024 * 1024):
+        self.sock = sock
+        # None writes every frame at once, the flusher must never block on one client
+        self.flusher = flusher if NONBLOCKING_FLAG else None
+        self.max_bytes = max_bytes
+        self.max_backlog = max_backlog  # Bytes a non-blocking send may leave waiting
+        self.on_error = on_error  # on_error(exception) when a background flush fails
+        self.pending = []         # Buffers waiting to be written, in order
+        self.pending_bytes = 0
+        self.scheduled = False
+        self.lock = threading.Lock()        # Guards pending
+        self.write_lock = threading.Lock()  # Held while writing to the socket
+        self.frames = 0  # Frames queued
+        self.writes = 0  # Write syscalls made
+
+    def append(self, *buffers):
+        """Queue one frame without scheduling a flush"""
+        with self.lock:
+            self.pending.extend(buffers)
+            self.pending_bytes += sum(len(buffer) for buffer in buffers)
+            self.frames += 1
+
+    def send(self, *buffers, block=True):
+        """Queue one frame, written within the flusher's window or at once if enough is waiting
+
+        With block=False the frame is written without blocking, or left to the
+        flusher when the socket is full, and BufferError is raised instead of
+        queueing past max_backlog.
+        """
+        if self.queue(*buffers, block=block):
+            self.flush()
+
+    def queue(self, *buffers, block=True):
+        """Queue one frame like send, but return True instead of flushing when a write is due
+
+        Callers holding locks of their own queue under them and flush after
+        releasing them, so nobody waits on those locks while the socket is full.
+        """
+        size = sum(len(buffer) for buffer in buffers)
+        write_now = False
+        with self.lock:
+            if not block and self.flusher is not None:
+                if self.pending_bytes + size > self.max_backlog:
+                    raise BufferError("client is too far behind")
+                # Frames already waiting mean the socket was full, they go out together
+                write_now = not self.pending
+            self.pending.extend(buffers)
+            self.pending_bytes += size
+            self.frames += 1
+            flush_now = self.flusher is None or (block and self.pending_bytes >= self.max_bytes)
+
+        # Write what the socket takes now, so writes to many clients are spread
+        # over the senders instead of all waiting for the one flusher thread
+        if write_now and self.flush(blocking=False, wait=False):
+            return False
+
+        with self.lock:
+            schedule = not flush_now and not self.scheduled and bool(self.pending)
+            if schedule:
+                self.scheduled = True
+        if schedule:
+            self.flusher.schedule(self)
+        return flush_now
+
+    def flush(self, blocking=True, wait=True):
+        """Write everything queued, False if a non-blocking flush left bytes behind
+
+        With wait=False it also gives up at once when another thread is writing.
+        """
+        if not self.write_lock.acquire(wait):
+            return False
+        try:
+            with self.lock:
+                buffers = self.pending
+                self.pending = []
+                self.pending_bytes = 0
+                self.scheduled = False
+            if not buffers:
+                return True
+
+            remainder = self.write(buffers, blocking)
+            if remainder:
+                # Put the unsent tail back in front of anything queued meanwhile
+                with self.lock:
+                    self.pending[:0] = remainder
+                    self.pending_bytes += sum(len(buffer) for buffer in remainder)
+                return False
+            return True
+        finally:
+            self.write_lock.release()
+
+    def write(self, buffers, blocking):
+        """Write buffers to the socket, returns what a non-blocking write could not send"""
+        flags = 0 if blocking else NONBLOCKING_FLAG
+        while buffers:
+            try:
+                if hasattr(self.sock, 'sendmsg'):
+                    sent = self.sock.sendmsg(buffers[:IOV_LIMIT], (), flags)
+                else:
+                    sent = self.sock.send(b''.join(buffers[:IOV_LIMIT]), flags)
+            except BlockingIOError:
+                if blocking:
+                    raise
+                return buffers
+            self.writes += 1
+
+            # Drop what went out, a buffer cut in the middle keeps its tail
+            index = 0
+            while sent and sent >= len(buffers[index]):
+                sent -= len(buffers[index])
+                index += 1
+            buffers = buffers[index:]
+            if sent:
+                buffers[0] = memoryview(buffers[0])[sent:]
+        return []
+
+    def failed(self, error):
+        """Drop queued frames after a write error and report it"""
+        with self.lock:
+            self.pending = []
+            self.pending_bytes = 0
+            self.scheduled = False
+        if self.on_error:
+            self.on_error(error)
+
+
+class WriteFlusher:
+    """One thread that flushes every connection's coalescer once its window has passed
+
+    It only ever writes without blocking, a client whose socket buffer is full
+    is retried later instead of holding up the others.
+    """
+
+    def __init__(self, window=0.002, retry_delay=0.05):
+        self.window = window            # Seconds a frame may wait for others to join it
+        self.retry_delay = retry_delay  # Seconds before retrying a client that was not writable
+        self.due = []  # Heap of (deadline, order, coalescer)
+        self.order = itertools.count()
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, name="write-flusher")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    def schedule(self, coalescer, delay=None):
+        """Flush a coalescer after the window, or after delay seconds"""
+        deadline = time.monotonic() + (self.window if delay is None else delay)
+        with self.condition:
+            heapq.heappush(self.due, (deadline, next(self.order), coalescer))
+            if self.due[0][2] is coalescer:
+                self.condition.notify()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.due:
+                    self.condition.wait()
+                if not self.running:
+                    return
+                deadline, _, coalescer = self.due[0]
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    self.condition.wait(delay)
+                    continue
+                heapq.heappop(self.due)
+
+            try:
+                if not coalescer.flush(blocking=False, wait=False):
+                    self.schedule(coalescer, self.retry_delay)
+            except OSError as e:
+                coalescer.failed(e)